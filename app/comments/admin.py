@@ -2,20 +2,25 @@ from django.contrib import admin
 # Register your models here.
 from django.utils.html import format_html
 from .models import Comment
+from app.core.admin import ScalableAdminMixin, owner_filter
 
 # -----------------------------
 # Comment Admin
 # -----------------------------
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdminMixin, admin.ModelAdmin):
     # -----------------------------
     # List display with color-coded status
     # -----------------------------
-    list_display = ('id', 'content', 'author', 'created_at', 'updated_at')
+    list_display = ('id', 'content', 'author', 'post', 'created_at', 'updated_at')
     list_display_links = ('id', 'author')
-    list_filter = ('author', 'created_at')
+    list_select_related = ('author', 'post')
+    list_filter = (owner_filter('author', title='author'), 'created_at')
     search_fields = ('content', 'author__username')
     ordering = ('-created_at',)
+
+    # search widget instead of a <select> of every post (uses PostAdmin.search_fields)
+    autocomplete_fields = ('post',)
     
     # -----------------------------
     # Read-only fields
@@ -57,7 +62,7 @@ class CommentAdmin(admin.ModelAdmin):
     def get_readonly_fields(self, request, obj=None):
         ro_fields = list(self.readonly_fields)
         if obj and obj.author != request.user and not request.user.is_superuser:
-            ro_fields += ['title', 'body', 'is_published']
+            ro_fields += ['post', 'content']
         return ro_fields
 
     def has_change_permission(self, request, obj=None):
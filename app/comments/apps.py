@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CommentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app.comments'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (registers receivers)
@@ -0,0 +1,83 @@
+'''
+
+Post.comment_count / Post.last_comment_at bookkeeping.
+
+The counters are changed with single UPDATE statements computed by the database
+(comment_count = comment_count + 1), never read-modify-write in Python, so concurrent
+comments on the same post can't lose an increment:
+
+    comments_added(post_id, created_at)      -> UPDATE ... SET comment_count = comment_count + 1,
+                                                last_comment_at = MAX(last_comment_at, created_at)
+    comments_removed(post_id)                -> UPDATE ... SET comment_count = MAX(comment_count - 1, 0),
+                                                last_comment_at = (newest remaining comment)
+
+signals.py calls them for every Comment saved/deleted through the ORM (API views, admin
+inlines, cascades). Code writing comments with bulk_create()/update() must call them
+itself. They invalidate the post's cached details and the cached lists that embed comments
+(?with_comments=), not the plain post lists (app/core/cache.py): those show the new
+counters once their short TTL is over.
+reconcile() recomputes the counters from post_comments for posts that drifted anyway
+(raw SQL, failed migrations...), in one UPDATE that counts the comments itself, see
+`manage.py reconcile_comment_counts`.
+
+'''
+
+from django.db.models import Count, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from app.posts.cache import COMMENT_LISTS, post_cache
+from app.posts.models import Post
+
+from .models import Comment
+
+
+def _newest_comment():
+    # served by comment_post_created_idx (post, created_at, id)
+    newest = Comment.objects.filter(post=OuterRef('pk')).order_by('-created_at', '-id').values('created_at')[:1]
+    return Subquery(newest)
+
+
+def comments_added(post_id, last_at, count=1):
+    """`count` comments were added to post `post_id`, the newest created at `last_at`."""
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F('comment_count') + count,
+        last_comment_at=Greatest(Coalesce('last_comment_at', Value(last_at)), Value(last_at)),
+    )
+    # update() sends no post_save signal. Not the plain lists: a busy post would otherwise
+    # keep every cached post list cold, they show the new counters within their TTL
+    post_cache.invalidate([post_id], lists=False, groups=[COMMENT_LISTS])
+
+
+def comments_removed(post_id, count=1):
+    """`count` comments of post `post_id` were deleted (or moved to another post)."""
+    Post.objects.filter(pk=post_id).update(
+        # never below zero: PositiveIntegerField is a CHECK constraint on PostgreSQL
+        comment_count=Greatest(F('comment_count') - count, Value(0)),
+        last_comment_at=_newest_comment(),
+    )
+    post_cache.invalidate([post_id], lists=False, groups=[COMMENT_LISTS])
+
+
+def _comment_count():
+    count = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(n=Count('id')).values('n')
+    return Coalesce(Subquery(count), Value(0))
+
+
+def reconcile(post_ids):
+    """Recompute the counters of `post_ids`; return the ids whose values were wrong."""
+    current = {
+        pk: (count, last)
+        for pk, count, last in Post.objects.filter(pk__in=post_ids).values_list('pk', 'comment_count', 'last_comment_at')
+    }
+    actual = {
+        row['post_id']: (row['count'], row['last'])
+        for row in Comment.objects.filter(post_id__in=post_ids)
+        .values('post_id').annotate(count=Count('id'), last=Max('created_at')).order_by()
+    }
+    drifted = [pk for pk, values in current.items() if values != actual.get(pk, (0, None))]
+    if drifted:
+        # counted again by the UPDATE itself: a comment added or removed since the reads
+        # above is not overwritten by the values they saw
+        Post.objects.filter(pk__in=drifted).update(comment_count=_comment_count(), last_comment_at=_newest_comment())
+        post_cache.invalidate(drifted)
+    return drifted
@@ -0,0 +1,34 @@
+import django_filters
+from rest_framework.filters import OrderingFilter
+
+from .models import Comment
+
+
+class CommentFilter(django_filters.FilterSet):
+    """
+    ?post=<id> / ?author=<id>, served by the (post|author, created_at, id) indexes.
+    Plain number filters on the FK columns: a ModelChoiceFilter would first load the post
+    or user just to validate the id.
+    """
+    post = django_filters.NumberFilter(field_name='post_id')
+    author = django_filters.NumberFilter(field_name='author_id')
+    # threads: ?parent=<id> direct replies, ?max_depth=0 top level comments only
+    parent = django_filters.NumberFilter(field_name='parent_id')
+    max_depth = django_filters.NumberFilter(field_name='depth', lookup_expr='lte')
+
+    class Meta:
+        model = Comment
+        fields = ['post', 'author', 'parent', 'max_depth']
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that always ends with `id` (in the direction of the first field), so
+    rows sharing a timestamp keep their order and ?page= pages never overlap.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering = [*ordering, '-id' if ordering[0].startswith('-') else 'id']
+        return ordering
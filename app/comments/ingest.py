@@ -0,0 +1,403 @@
+'''
+
+Buffered (write-behind) comment ingestion, for comment bursts on a hot post.
+
+With COMMENT_INGEST['ENABLED'], POST /api/comments/ validates the comment as usual but
+does not insert it: the validated comment goes into a bounded in-process queue and the
+client gets 202 Accepted with an `ingest_id` (a UUID, stored on the row as
+Comment.ingest_id). A flusher thread writes the queue out with bulk_create():
+
+    size trigger     as soon as BATCH_SIZE comments are waiting
+    time trigger     FLUSH_INTERVAL seconds after the oldest waiting comment arrived
+
+One batch = one transaction: INSERT (bulk), UPDATE of path/created_at (bulk), one counter
+UPDATE per post (counters.comments_added). Hundreds of comments cost a handful of
+statements instead of three per comment.
+
+Backpressure: when MAX_QUEUE comments are waiting, enqueue() waits ENQUEUE_TIMEOUT
+seconds for room and then raises QueueFull; the view answers 503 with Retry-After.
+
+Durability: the queue lives in memory, a crash loses what was not flushed yet. With
+SPOOL_PATH every accepted comment is first appended to a local NDJSON spool file
+(fsync'd per comment with SPOOL_FSYNC), compacted after every written batch to the comments
+still waiting, and replayed on startup: the spooled comments go to the flusher directly, not
+through the bounded queue, so a spool longer than MAX_QUEUE never blocks a request. ingest_id
+is unique, replaying a comment that was already written is a no-op. With several worker processes give every process its own
+file ('{pid}' in SPOOL_PATH is replaced by the process id) and replay the files of dead
+workers with `manage.py replay_comment_spool`.
+
+Metrics (stats(), GET /api/comments/ingest/stats/): queue depth, age of the oldest waiting
+comment, accepted/rejected/written/dropped counts and flush latency percentiles.
+
+Comments are only visible once flushed: GET /api/comments/ingest/<ingest_id>/ answers 202
+while the comment is waiting and 200 with the comment when it is written.
+
+'''
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from app.posts.models import Post
+
+from . import counters
+from .models import Comment, make_path
+
+logger = logging.getLogger(__name__)
+
+
+def ingest_settings():
+    defaults = {
+        'ENABLED': False,
+        'MAX_QUEUE': 10000,
+        'BATCH_SIZE': 500,
+        'FLUSH_INTERVAL': 0.2,
+        'ENQUEUE_TIMEOUT': 0.05,
+        'SPOOL_PATH': '',
+        'SPOOL_FSYNC': False,
+        'AUTOSTART': True,
+    }
+    return {**defaults, **getattr(settings, 'COMMENT_INGEST', {})}
+
+
+def ingest_enabled():
+    return ingest_settings()['ENABLED']
+
+
+class QueueFull(Exception):
+    pass
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+# -----------------------------
+# Writing a batch
+# -----------------------------
+def make_item(post_id, author_id, content, parent_id=None):
+    """A queued comment: plain JSON types, it may go through the spool file."""
+    return {
+        'ingest_id': str(uuid.uuid4()),
+        'post': post_id,
+        'parent': parent_id,
+        'author': author_id,
+        'content': content,
+        'accepted_at': timezone.now().isoformat(),
+    }
+
+
+def _insert(items, batch_size):
+    """INSERT `items` in one transaction; returns the number of comments written."""
+    ids = [item['ingest_id'] for item in items]
+    # replayed spool entries that made it to the database before the crash
+    done = {str(pk) for pk in Comment.objects.filter(ingest_id__in=ids).values_list('ingest_id', flat=True)}
+    posts = set(Post.objects.filter(pk__in={item['post'] for item in items}).values_list('pk', flat=True))
+    parents = {
+        pk: (path, depth)
+        for pk, path, depth in Comment.objects.filter(pk__in={item['parent'] for item in items if item['parent']})
+        .values_list('pk', 'path', 'depth')
+    }
+
+    comments, accepted = [], []
+    for item in items:
+        if item['ingest_id'] in done:
+            continue
+        if item['post'] not in posts or (item['parent'] and item['parent'] not in parents):
+            # post or parent deleted while the comment was waiting
+            logger.warning("Dropping queued comment %s: its post or parent no longer exists", item['ingest_id'])
+            continue
+        parent_path, parent_depth = parents.get(item['parent'], ('', -1))
+        comments.append(Comment(
+            ingest_id=item['ingest_id'], post_id=item['post'], parent_id=item['parent'],
+            author_id=item['author'], content=item['content'], depth=parent_depth + 1,
+        ))
+        accepted.append((item, parent_path))
+    if not comments:
+        return 0
+
+    Comment.objects.bulk_create(comments, batch_size=batch_size)
+    newest = {}
+    for comment, (item, parent_path) in zip(comments, accepted):
+        comment.path = make_path(parent_path, comment.pk)
+        # auto_now_add stamped the flush time, the comment was made when it was accepted
+        comment.created_at = parse_datetime(item['accepted_at'])
+        newest[comment.post_id] = newest.get(comment.post_id, []) + [comment.created_at]
+    Comment.objects.bulk_update(comments, ['path', 'created_at'], batch_size=batch_size)
+    # bulk_create sends no post_save signal (signals.py)
+    for post_id, created in newest.items():
+        counters.comments_added(post_id, max(created), count=len(created))
+    return len(comments)
+
+
+def write_batch(items, batch_size=500):
+    """
+    Write queued comments; returns (written, dropped). A batch that fails as a whole
+    (e.g. a post deleted between the checks and the INSERT) is retried one comment at a
+    time, so one bad comment does not take the others down with it.
+    """
+    try:
+        with transaction.atomic():
+            written = _insert(items, batch_size)
+        return written, len(items) - written
+    except IntegrityError:
+        written = 0
+        for item in items:
+            try:
+                with transaction.atomic():
+                    written += _insert([item], batch_size)
+            except IntegrityError:
+                logger.exception("Dropping queued comment %s", item['ingest_id'])
+        return written, len(items) - written
+
+
+# -----------------------------
+# Spool file
+# -----------------------------
+class Spool:
+    """Append-only NDJSON file of the accepted, not yet written comments."""
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a+', encoding='utf-8')
+
+    def append(self, item):
+        self.file.write(json.dumps(item, separators=(',', ':')) + '\n')
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def read(self):
+        self.file.seek(0)
+        return read_spool_lines(self.file)
+
+    def truncate(self):
+        self.file.seek(0)
+        self.file.truncate()
+
+    def rewrite(self, items):
+        """Replace the file's content with `items` (atomic: a crash leaves the old or the new file)."""
+        if not items:
+            return self.truncate()
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(item, separators=(',', ':')) + '\n' for item in items)
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+        os.replace(tmp, self.path)
+        self.file.close()
+        self.file = open(self.path, 'a+', encoding='utf-8')
+
+    def close(self):
+        self.file.close()
+
+
+def read_spool_lines(lines):
+    items = []
+    for line in lines:
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            break  # torn last line of a crash: the comment was never acknowledged
+    return items
+
+
+# -----------------------------
+# Ingestor
+# -----------------------------
+class CommentIngestor:
+    """Bounded queue + flusher thread, one per process (see get_ingestor())."""
+
+    def __init__(self, config=None):
+        self.config = config or ingest_settings()
+        self.queue = queue.Queue(maxsize=self.config['MAX_QUEUE'])
+        self.pending = {}  # ingest_id -> accepted_at (monotonic), queued or being written
+        self.retry = []  # batch that failed to write, goes first next time
+        self.replayed = deque()  # spooled comments of a previous run, written before the queue
+        self.spooled = {}  # ingest_id -> item, what the spool must keep
+        self.lock = threading.Lock()  # spool append + queue put vs spool compaction
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.latencies = deque(maxlen=1000)
+        self.counts = {'accepted': 0, 'rejected': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'failed_batches': 0}
+        spool_path = self.config['SPOOL_PATH'].replace('{pid}', str(os.getpid()))
+        self.spool = Spool(spool_path, self.config['SPOOL_FSYNC']) if spool_path else None
+
+    def start(self):
+        if self.spool is not None:
+            self.replay()
+        self.thread = threading.Thread(target=self.run, name='comment-ingest', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=5):
+        """Stop the flusher after it has written what is queued."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def replay(self):
+        """
+        Hand the spooled comments of a previous run of this process (same spool file) to the
+        flusher. They stay in the spool until written and never wait for room in the queue.
+        """
+        with self.lock:
+            items = [item for item in self.spool.read() if item['ingest_id'] not in self.spooled]
+            if items:
+                logger.info("Replaying %d spooled comments from %s", len(items), self.spool.path)
+            now = time.monotonic()
+            for item in items:
+                self.pending[item['ingest_id']] = now
+                self.spooled[item['ingest_id']] = item
+                self.replayed.append(item)
+
+    # -- producer side
+    def enqueue(self, item, timeout=-1):
+        """Queue a comment (see make_item()); QueueFull once the queue stays full for `timeout` s."""
+        timeout = self.config['ENQUEUE_TIMEOUT'] if timeout == -1 else timeout
+        with self.lock:
+            # pending before the put: the flusher may write the comment right away
+            self.pending[item['ingest_id']] = time.monotonic()
+            try:
+                self.queue.put(item, timeout=timeout)
+            except queue.Full:
+                del self.pending[item['ingest_id']]
+                self.counts['rejected'] += 1
+                raise QueueFull()
+            if self.spool is not None:
+                self.spool.append(item)
+                self.spooled[item['ingest_id']] = item
+            self.counts['accepted'] += 1
+        return item['ingest_id']
+
+    def is_pending(self, ingest_id):
+        return str(ingest_id) in self.pending
+
+    # -- flusher side
+    def collect(self, block=True):
+        """The next batch: BATCH_SIZE comments, or what arrived within FLUSH_INTERVAL."""
+        if self.retry:
+            batch, self.retry = self.retry, []
+            return batch
+        if self.replayed:
+            return [self.replayed.popleft() for _ in range(min(len(self.replayed), self.config['BATCH_SIZE']))]
+        try:
+            batch = [self.queue.get(timeout=self.config['FLUSH_INTERVAL']) if block else self.queue.get_nowait()]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.config['FLUSH_INTERVAL']
+        while len(batch) < self.config['BATCH_SIZE']:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if block and remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self, batch):
+        start = time.perf_counter()
+        try:
+            written, dropped = write_batch(batch, self.config['BATCH_SIZE'])
+        except Exception:
+            # database down: keep the batch (not in the queue, the flusher must never
+            # wait for room in it) and try again after FLUSH_INTERVAL
+            self.counts['failed_batches'] += 1
+            logger.exception("Writing %d queued comments failed", len(batch))
+            self.retry = batch
+            return False
+        self.latencies.append(time.perf_counter() - start)
+        self.counts['batches'] += 1
+        self.counts['written'] += written
+        self.counts['dropped'] += dropped
+        for item in batch:
+            self.pending.pop(item['ingest_id'], None)
+        if self.spool is not None:
+            with self.lock:
+                for item in batch:
+                    self.spooled.pop(item['ingest_id'], None)
+                self.spool.rewrite(list(self.spooled.values()))  # only what is still waiting
+        return True
+
+    def flush_all(self):
+        """Write everything queued right now, in the calling thread (tests, shutdown)."""
+        while batch := self.collect(block=False):
+            if not self.flush(batch):
+                break
+
+    def run(self):
+        while not self.stop_event.is_set():
+            batch = self.collect()
+            if batch:
+                close_old_connections()  # honour CONN_MAX_AGE, drop broken connections
+                if not self.flush(batch):
+                    self.stop_event.wait(self.config['FLUSH_INTERVAL'])
+        self.flush_all()
+
+    # -- metrics
+    def stats(self):
+        oldest = min(self.pending.values(), default=None)
+        latencies = list(self.latencies)
+        return {
+            'queue_depth': self.queue.qsize() + len(self.retry) + len(self.replayed),
+            'queue_capacity': self.config['MAX_QUEUE'],
+            'oldest_pending_seconds': round(time.monotonic() - oldest, 3) if oldest is not None else None,
+            **self.counts,
+            'flush_latency_ms': {
+                name: round(value * 1000, 2) if value is not None else None
+                for name, value in (('p50', percentile(latencies, 50)), ('p95', percentile(latencies, 95)),
+                                    ('p99', percentile(latencies, 99)), ('max', max(latencies, default=None)))
+            },
+        }
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor():
+    """The process' ingestor, created (and its flusher started) on first use."""
+    global _ingestor
+    if _ingestor is None:
+        with _ingestor_lock:
+            if _ingestor is None:
+                ingestor = CommentIngestor()
+                if ingestor.config['AUTOSTART']:
+                    ingestor.start()
+                _ingestor = ingestor
+    return _ingestor
+
+
+def existing_ingestor():
+    """The process' ingestor if something already used it, else None (never starts one)."""
+    return _ingestor
+
+
+def reset_ingestor():
+    """Stop and forget the process' ingestor (tests, settings changes)."""
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is not None:
+            _ingestor.stop()
+            if _ingestor.spool is not None:
+                _ingestor.spool.close()
+        _ingestor = None
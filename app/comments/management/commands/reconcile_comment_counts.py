@@ -0,0 +1,55 @@
+'''
+
+Recompute Post.comment_count / last_comment_at from post_comments and fix drifted posts.
+
+    python manage.py reconcile_comment_counts --batch-size 1000
+    python manage.py reconcile_comment_counts --dry-run
+
+Walks the posts in primary key order, one batch per transaction, so it can run on a live
+database without holding long locks. Only posts whose counters are wrong are written.
+
+'''
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.comments import counters
+from app.posts.models import Post
+
+
+class DryRun(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Fix Post.comment_count / last_comment_at drift, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Report drifted posts without fixing them")
+
+    def handle(self, *args, **options):
+        batch_size, dry_run = options['batch_size'], options['dry_run']
+        checked = fixed = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            try:
+                with transaction.atomic():
+                    drifted = counters.reconcile(pks)
+                    if dry_run:
+                        raise DryRun
+            except DryRun:
+                pass
+            checked += len(pks)
+            fixed += len(drifted)
+            if drifted and options['verbosity'] > 1:
+                self.stdout.write(f"drifted: {', '.join(map(str, drifted))}")
+            last_pk = pks[-1]
+
+        action = "would fix" if dry_run else "fixed"
+        self.stdout.write(self.style.SUCCESS(f"{checked} post(s) checked, {action} {fixed}"))
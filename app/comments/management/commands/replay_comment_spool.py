@@ -0,0 +1,44 @@
+'''
+
+Write the comments left in buffered ingestion spool files (app/comments/ingest.py), e.g.
+the files of worker processes that crashed or were killed before their queue was flushed.
+
+    python manage.py replay_comment_spool /var/spool/multiplex/comments-*.ndjson
+    python manage.py replay_comment_spool comments-4121.ndjson --keep
+
+Comments already in the database (same ingest_id) are skipped, so a file can be replayed
+any number of times. Only replay files of processes that are no longer running: a live
+worker still owns its file. Replayed files are deleted unless --keep is given.
+
+'''
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from app.comments.ingest import read_spool_lines, write_batch
+
+
+class Command(BaseCommand):
+    help = "Write the comments of buffered ingestion spool files to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--keep', action='store_true', help="Don't delete the files once replayed")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total_written = total_dropped = 0
+        for path in options['paths']:
+            with open(path, encoding='utf-8') as spool:
+                items = read_spool_lines(spool)
+            written = dropped = 0
+            for start in range(0, len(items), batch_size):
+                w, d = write_batch(items[start:start + batch_size], batch_size)
+                written, dropped = written + w, dropped + d
+            self.stdout.write(f"{path}: {len(items)} spooled, {written} written, {dropped} skipped")
+            if not options['keep']:
+                os.remove(path)
+            total_written, total_dropped = total_written + written, total_dropped + dropped
+        self.stdout.write(self.style.SUCCESS(f"{total_written} comment(s) written, {total_dropped} skipped"))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# PostgreSQL only: comments are append-only, so created_at follows the physical row order
+# and a BRIN index (a few pages for millions of rows) serves time-range scans.
+# SQLite has no BRIN, the B-tree indexes above cover it there.
+def add_created_brin(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX comment_created_brin ON post_comments USING brin (created_at)"
+        )
+
+
+def drop_created_brin(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS comment_created_brin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0001_initial'),
+        ('posts', '0004_post_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='comment_author_created_idx'),
+        ),
+        migrations.RunPython(add_created_brin, drop_created_brin),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import CharField, Max, Value
+from django.db.models.functions import Cast, LPad
+
+PATH_SEGMENT = 10
+BATCH_SIZE = 10000
+
+
+def backfill_paths(apps, schema_editor):
+    """
+    Existing comments are all top level: path = their own zero-padded id, depth 0.
+    One UPDATE per BATCH_SIZE ids, so a large table is not locked in a single statement.
+    """
+    Comment = apps.get_model('comments', 'Comment')
+    comments = Comment.objects.using(schema_editor.connection.alias)
+    last_id = comments.aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last_id, BATCH_SIZE):
+        comments.filter(id__gt=start, id__lte=start + BATCH_SIZE, path='').update(
+            path=LPad(Cast('id', CharField()), PATH_SEGMENT, Value('0')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0003_comment_created_id_index'),
+        ('posts', '0005_post_comment_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='comments.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=250),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['post', 'id'], name='comment_post_roots_idx'),
+        ),
+    ]
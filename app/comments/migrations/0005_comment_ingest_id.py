@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0004_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='ingest_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
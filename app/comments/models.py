@@ -1,8 +1,34 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from app.posts.models import Post
 # Create your models here.
 
+# Threads are stored as a materialized path: every comment's `path` is its ancestors'
+# ids followed by its own, each zero-padded to PATH_SEGMENT digits:
+#
+#   0000000007                       comment 7 (a top level comment)
+#   00000000070000000012             reply 12 to comment 7
+#   000000000700000000120000000031   reply 31 to reply 12
+#
+# Sorting on path gives the depth-first thread order, and a subtree is a path range
+# (see subtree_range) served by the (post, path) index, whatever its depth.
+PATH_SEGMENT = 10
+MAX_DEPTH = 24  # replies to replies..., path max_length = (MAX_DEPTH + 1) * PATH_SEGMENT
+
+
+def make_path(parent_path, pk):
+    return f'{parent_path}{pk:0{PATH_SEGMENT}d}'
+
+
+def subtree_range(path):
+    """
+    (lower, upper) bounds of the paths in the subtree rooted at `path`:
+    lower <= path < upper. Pure digit strings compare the same in every collation,
+    and a plain range (unlike LIKE 'prefix%') can use the B-tree index everywhere.
+    """
+    head, last = path[:-PATH_SEGMENT], int(path[-PATH_SEGMENT:])
+    return path, make_path(head, last + 1)
+
 class Comment(models.Model):
     author = models.ForeignKey(
         User, 
@@ -14,12 +40,60 @@ class Comment(models.Model):
         on_delete=models.CASCADE,
         related_name='comments'
     )
+    parent = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='replies'
+    )
+    # set on insert by save(), never changes (replies can't move to another parent)
+    path = models.CharField(max_length=(MAX_DEPTH + 1) * PATH_SEGMENT, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     content = models.TextField()
+    # id handed out by the buffered ingestion (ingest.py) before the row exists
+    ingest_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table='post_comments'
+        indexes = [
+            # comments of a post, in time order: WHERE post_id = ? ORDER BY created_at, id
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+            # comments of an author, in time order
+            models.Index(fields=['author', 'created_at', 'id'], name='comment_author_created_idx'),
+            # all comments, in time order (unfiltered /api/comments/ pages)
+            models.Index(fields=['created_at', 'id'], name='comment_created_id_idx'),
+            # threads of a post in depth-first order, subtrees as path ranges
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+            # top level comments of a post (the "top N threads")
+            models.Index(fields=['post', 'id'], name='comment_post_roots_idx', condition=models.Q(parent__isnull=True)),
+        ]
+
+    # post_id as loaded from the database (None for unsaved comments), lets the
+    # post_save handler in signals.py tell a moved comment from an edited one
+    _loaded_post_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_post_id = instance.__dict__.get('post_id')
+        return instance
 
     def __str__(self):
-        return self.author.username
+        # no author lookup: admin lists, deletes and logs print many comments at once
+        return f'Comment #{self.pk} on post {self.post_id}'
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding or self.path:
+            return super().save(*args, **kwargs)
+        # the path ends with our own id: insert first, then store the path
+        parent_path = ''
+        if self.parent_id is not None:
+            parent_path = self.parent.path
+            self.depth = self.parent.depth + 1
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            self.path = make_path(parent_path, self.pk)
+            type(self)._base_manager.using(self._state.db).filter(pk=self.pk).update(path=self.path)
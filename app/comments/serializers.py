@@ -1,21 +1,39 @@
 from rest_framework import serializers
-from .models import Comment
+from .models import Comment, MAX_DEPTH
+from app.core.fieldsets import SparseFieldsetMixin
 
-class CommentListSerializer(serializers.ModelSerializer):
+class CommentListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    author_username = serializers.ReadOnlyField(source='author.username')
 
     class Meta:
         model = Comment
-        fields = ['id','post','author','content','created_at']
-        read_only_fields = ['id','author']
+        fields = ['id','post','parent','depth','author','author_username','content','created_at']
+        read_only_fields = ['id','author','author_username']
 
 class CommentCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        fields = ['id','post','author','content','created_at']
+        fields = ['id','post','parent','depth','author','content','created_at']
         read_only_fields = ['id','author']
 
+    def validate(self, attrs):
+        parent = attrs.get('parent')
+        if parent is not None:
+            if parent.post_id != attrs['post'].id:
+                raise serializers.ValidationError({'parent': 'The parent comment belongs to another post.'})
+            if parent.depth + 1 > MAX_DEPTH:
+                raise serializers.ValidationError({'parent': f'Replies can be nested at most {MAX_DEPTH} levels deep.'})
+        return attrs
+
 class CommentUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        fields = ['id','author','post','content','created_at']
-        read_only_fields = ['id','author']
+        fields = ['id','author','post','parent','content','created_at']
+        read_only_fields = ['id','author','parent']
+
+    def validate_post(self, post):
+        # a thread can't be split across posts
+        comment = self.instance
+        if comment is not None and post.id != comment.post_id and (comment.parent_id or comment.replies.exists()):
+            raise serializers.ValidationError('Comments that are part of a thread can not be moved to another post.')
+        return post
@@ -0,0 +1,57 @@
+'''
+
+Keep Post.comment_count / last_comment_at in step with the comments table (counters.py).
+
+Every ORM path ends up here: CommentListView.post / CommentDetailView.delete, admin inline
+add/delete, and the cascade when a user is deleted. When the post itself is being deleted
+its comments are cascaded too; updating the counters of a row that is about to disappear
+would cost one UPDATE per comment, so those are skipped: post_delete's `origin` (the
+instance or queryset delete() was called on) says whether the comment's post is part of
+the delete.
+
+'''
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from app.posts.cache import COMMENT_LISTS, post_cache
+from app.posts.models import Post
+
+from . import counters
+from .models import Comment
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:  # loaddata: fixtures carry their own counters
+        return
+    previous = instance._loaded_post_id
+    if created:
+        counters.comments_added(instance.post_id, instance.created_at)
+    elif previous is not None and previous != instance.post_id:
+        # moved to another post
+        counters.comments_removed(previous)
+        counters.comments_added(instance.post_id, instance.created_at)
+    else:
+        # edited: cached post lists may embed it (?with_comments=, feeds.py)
+        post_cache.invalidate(lists=False, groups=[COMMENT_LISTS])
+    instance._loaded_post_id = instance.post_id
+
+
+def _deletes_post(origin, post_id):
+    """Whether the delete() that started the cascade deletes post `post_id`."""
+    if isinstance(origin, Post):
+        return origin.pk == post_id
+    if isinstance(origin, QuerySet) and origin.model is Post:
+        # read once per delete(): the posts are deleted after their comments
+        if not hasattr(origin, '_deleting_pks'):
+            origin._deleting_pks = set(origin.values_list('pk', flat=True))
+        return post_id in origin._deleting_pks
+    return False
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    if _deletes_post(origin, instance.post_id):
+        return
+    counters.comments_removed(instance.post_id)
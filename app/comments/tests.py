@@ -1,7 +1,19 @@
 
+import json
 import pytest 
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIRequestFactory
 from app.comments.models import Comment
+from app.comments.views import CommentListAsyncView
+from app.comments.threads import post_threads, subtree
+from app.comments import ingest
 from app.posts.models import Post
+from django.contrib.auth.models import User
+from app.core.explain import capture_plans
 
 # what ever pass in parameter will call automatically first
 @pytest.fixture
@@ -23,6 +35,23 @@ class TestCommentAPI:
         resp = auth_client.get('/api/comments/')
         assert resp.status_code == 200
 
+    def test_list_sparse_fieldset(self, auth_client, comment1):
+        resp = auth_client.get('/api/comments/?fields=id,content')
+        assert resp.data["results"] == [{"id": comment1.id, "content": "First comment!"}]
+
+    def test_list_fast_path_matches_serializer(self, auth_client, comment1, settings):
+        fast = auth_client.get('/api/comments/').content
+        settings.FAST_READ_SERIALIZATION = False
+        assert auth_client.get('/api/comments/').content == fast
+
+    def test_export_ndjson_resume(self, auth_client, comment1, user1, post1):
+        second = Comment.objects.create(author=user1, post=post1, content="Second")
+        resp = auth_client.get('/api/comments/export/')
+        lines = b''.join(resp.streaming_content).decode().splitlines()
+        assert [json.loads(line)['id'] for line in lines] == [comment1.id, second.id]
+        resp = auth_client.get(f'/api/comments/export/?after={comment1.id}&export_format=csv&fields=id,content')
+        assert b''.join(resp.streaming_content).decode().splitlines() == ['id,content', f'{second.id},Second']
+
     def test_create_comment(self, auth_client, user1, post1):
         data = {"post":post1.id, "content": "Hello Comment"}
         resp = auth_client.post('/api/comments/', data, format="json")
@@ -42,6 +71,428 @@ class TestCommentAPI:
         assert resp.status_code == 200
         assert not comment1.object.filter(id = comment1.id).exist()
 
+
+@pytest.mark.django_db
+class TestCommentQueryPlans:
+    """Comment access paths must hit the (post|author, created_at, id) indexes."""
+
+    @pytest.fixture(autouse=True)
+    def seed(self, post1, user1, user2):
+        other = Post.objects.create(title="Other", body="Post", user=user2)
+        Comment.objects.bulk_create(
+            Comment(author=user1 if i % 2 else user2, post=post1 if i % 3 else other, content=f"c{i}")
+            for i in range(200)
+        )
+
+    def test_comments_of_post(self, post1):
+        with capture_plans() as plans:
+            list(Comment.objects.filter(post=post1).order_by('created_at', 'id')[:20])
+        assert plans.problems('post_comments') == {}
+
+    def test_comments_of_author(self, user1):
+        with capture_plans() as plans:
+            list(Comment.objects.filter(author=user1).order_by('-created_at', '-id')[:20])
+        assert plans.problems('post_comments') == {}
+
+@pytest.mark.django_db
+class TestCommentList:
+    """Paginated, filtered, (created_at, id) ordered comment list with bounded queries."""
+
+    @pytest.fixture
+    def comments(self, post1, user1, user2):
+        other = Post.objects.create(title="Other", body="Post", user=user2)
+        return Comment.objects.bulk_create(
+            Comment(author=user1 if i % 2 else user2, post=post1 if i % 3 else other, content=f"c{i}")
+            for i in range(30)
+        )
+
+    def test_paginated_in_created_order(self, api_client, comments):
+        resp = api_client.get('/api/comments/')
+        assert resp.data["count"] == 30
+        assert [c["id"] for c in resp.data["results"]] == [c.id for c in comments[:10]]
+        assert len(api_client.get("/api/comments/?page_size=1000").data["results"]) == 30
+        assert len(api_client.get('/api/comments/?page_size=5').data["results"]) == 5
+
+    def test_filters(self, api_client, comments, post1, user1):
+        resp = api_client.get(f'/api/comments/?post={post1.id}&author={user1.id}&page_size=100')
+        expected = [c.id for c in comments if c.post_id == post1.id and c.author_id == user1.id]
+        assert [c["id"] for c in resp.data["results"]] == expected
+        assert resp.data["results"][0]["author_username"] == user1.username
+
+    def test_keyset_walk(self, api_client, comments, post1):
+        url, seen = f'/api/comments/?post={post1.id}&cursor=&page_size=7', []
+        while url:
+            resp = api_client.get(url)
+            seen += [c["id"] for c in resp.data["results"]]
+            url = resp.data["next"]
+        assert seen == [c.id for c in comments if c.post_id == post1.id]
+
+    @pytest.mark.parametrize('query', ['?cursor=&page_size=50', '?page_size=50'])
+    def test_query_count_bounded(self, api_client, comments, query):
+        with CaptureQueriesContext(connection) as ctx:
+            api_client.get('/api/comments/' + query)
+        # keyset: the page; ?page=: COUNT(*) + the page
+        assert len(ctx.captured_queries) == (1 if 'cursor' in query else 2)
+
+    @pytest.mark.parametrize('query', ['', '?post={post}', '?author={author}'])
+    def test_pages_use_indexes(self, api_client, comments, post1, user1, query):
+        with capture_plans() as plans:
+            api_client.get('/api/comments/' + query.format(post=post1.id, author=user1.id) + ('&' if query else '?') + 'cursor=')
+        assert plans.for_table('post_comments')
+        assert plans.problems('post_comments') == {}
+
+    def test_async_view_same_as_sync(self, api_client, comments, post1):
+        url = f'/api/comments/?post={post1.id}&page=2'
+        resp = async_to_sync(CommentListAsyncView.as_view())(APIRequestFactory().get(url))
+        assert json.loads(resp.content) == json.loads(api_client.get(url).content)
+
+
+@pytest.mark.django_db
+class TestCommentThreads:
+    """Materialized path threads: subtree / top N threads in one indexed query."""
+
+    @pytest.fixture
+    def tree(self, post1, user1):
+        """
+        a            d
+        ├── b        └── e
+        │   └── c
+        └── f
+        """
+        def reply(parent, content):
+            return Comment.objects.create(author=user1, post=post1, parent=parent, content=content)
+        a = reply(None, "a")
+        b = reply(a, "b")
+        c = reply(b, "c")
+        d = reply(None, "d")
+        e = reply(d, "e")
+        f = reply(a, "f")
+        return dict(a=a, b=b, c=c, d=d, e=e, f=f)
+
+    def contents(self, items):
+        return [(item["content"], self.contents(item["replies"])) for item in items]
+
+    def test_paths(self, tree):
+        a, b, c = tree["a"], tree["b"], tree["c"]
+        c.refresh_from_db()
+        assert (c.depth, c.path) == (2, f"{a.id:010d}{b.id:010d}{c.id:010d}")
+
+    def test_create_reply_through_api(self, auth_client, tree, post1):
+        resp = auth_client.post('/api/comments/', {"post": post1.id, "parent": tree["c"].id, "content": "g"}, format="json")
+        assert resp.status_code == 201
+        assert resp.data["depth"] == 3
+
+    def test_reply_must_be_on_the_same_post(self, auth_client, tree, user2):
+        other = Post.objects.create(title="Other", body="Post", user=user2)
+        resp = auth_client.post('/api/comments/', {"post": other.id, "parent": tree["a"].id, "content": "x"}, format="json")
+        assert resp.status_code == 400
+
+    def test_subtree_single_query(self, api_client, tree):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = api_client.get(f'/api/comments/{tree["a"].id}/thread/')
+        assert self.contents(resp.data) == [("a", [("b", [("c", [])]), ("f", [])])]
+        # the comment itself (its path) + the subtree
+        assert len(ctx.captured_queries) == 2
+
+    def test_subtree_max_depth(self, api_client, tree):
+        resp = api_client.get(f'/api/comments/{tree["a"].id}/thread/?max_depth=1')
+        assert self.contents(resp.data) == [("a", [("b", []), ("f", [])])]
+
+    def test_top_threads(self, api_client, tree, post1):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = api_client.get(f'/api/comments/threads/?post={post1.id}&threads=2&replies=2')
+        assert len(ctx.captured_queries) == 1
+        assert self.contents(resp.data) == [("d", [("e", [])]), ("a", [("b", [("c", [])])])]
+        resp = api_client.get(f'/api/comments/threads/?post={post1.id}&threads=1&replies=5&sort=oldest&max_depth=1')
+        assert self.contents(resp.data) == [("a", [("b", []), ("f", [])])]
+        assert api_client.get('/api/comments/threads/').status_code == 400
+
+    def test_list_depth_and_path_ordering(self, api_client, tree, post1):
+        resp = api_client.get(f'/api/comments/?post={post1.id}&ordering=path&cursor=&page_size=4')
+        assert [c["content"] for c in resp.data["results"]] == ["a", "b", "c", "f"]
+        assert [c["content"] for c in api_client.get(resp.data["next"]).data["results"]] == ["d", "e"]
+        resp = api_client.get(f'/api/comments/?post={post1.id}&max_depth=0')
+        assert [c["content"] for c in resp.data["results"]] == ["a", "d"]
+        resp = api_client.get(f'/api/comments/?parent={tree["a"].id}')
+        assert [c["content"] for c in resp.data["results"]] == ["b", "f"]
+
+    def test_thread_queries_use_indexes(self, tree, post1):
+        with capture_plans() as plans:
+            list(subtree(tree["a"]))
+        assert plans.problems('post_comments') == {}
+        with capture_plans() as plans:
+            list(post_threads(post1.id))
+        # the window sorts the selected threads' rows, but nothing scans the table
+        problems = [line for lines in plans.problems('post_comments').values() for line in lines]
+        assert not [line for line in problems if 'SCAN' in line and 'post_comments' in line]
+
+
+@pytest.mark.django_db
+class TestPostCommentCounters:
+    """Post.comment_count / last_comment_at follow every way comments come and go."""
+
+    def counters(self, post):
+        post.refresh_from_db()
+        return post.comment_count, post.last_comment_at
+
+    def test_create_through_api(self, auth_client, post1):
+        resp = auth_client.post('/api/comments/', {"post": post1.id, "content": "Hi"}, format="json")
+        assert resp.status_code == 201
+        comment = Comment.objects.get(post=post1)
+        assert self.counters(post1) == (1, comment.created_at)
+        assert auth_client.get(f'/api/posts/{post1.id}/').data["comment_count"] == 1
+
+    def test_cached_lists_with_comments_follow_comments(self, post1, user1):
+        from rest_framework.test import APIClient
+        anonymous = APIClient()
+
+        def embedded():
+            resp = anonymous.get('/api/posts/?with_comments=3')
+            return resp['X-Cache'], [c['content'] for c in resp.data['results'][0]['latest_comments']]
+
+        old = Comment.objects.create(author=user1, post=post1, content="old")
+        assert embedded() == ('MISS', ["old"])
+        old.delete()
+        assert embedded() == ('MISS', [])
+        Comment.objects.create(author=user1, post=post1, content="new")
+        assert embedded() == ('MISS', ["new"])
+        assert embedded()[0] == 'HIT'
+        anonymous.get('/api/posts/')
+        Comment.objects.create(author=user1, post=post1, content="newer")
+        assert anonymous.get('/api/posts/')['X-Cache'] == 'HIT'  # plain lists: counters within the TTL
+
+    def test_delete_through_api(self, auth_client, post1, user1):
+        first = Comment.objects.create(author=user1, post=post1, content="a")
+        last = Comment.objects.create(author=user1, post=post1, content="b")
+        auth_client.delete(f'/api/comments/{last.id}/')
+        assert self.counters(post1) == (1, first.created_at)
+        auth_client.delete(f'/api/comments/{first.id}/')
+        assert self.counters(post1) == (0, None)
+
+    def test_moving_a_comment(self, comment1, post1, user2):
+        other = Post.objects.create(title="Other", body="Post", user=user2)
+        comment1.post = other
+        comment1.save()
+        assert self.counters(post1) == (0, None)
+        assert self.counters(other) == (1, comment1.created_at)
+
+    def test_reconcile_keeps_concurrent_comments(self, post1, user1):
+        from app.comments import counters
+        Post.objects.filter(pk=post1.pk).update(comment_count=7)  # drifted
+        injected = []
+
+        def comment_meanwhile(execute, sql, params, many, context):
+            if not injected and sql.startswith('UPDATE') and 'comment_count' in sql:
+                injected.append(None)  # once: the comment's own counter UPDATE comes through here too
+                injected[0] = Comment.objects.create(author=user1, post=post1, content="meanwhile")
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(comment_meanwhile):
+            assert counters.reconcile([post1.pk]) == [post1.pk]
+        assert self.counters(post1) == (1, injected[0].created_at)
+
+    def test_cascade_from_user(self, post1, user1, user2):
+        Comment.objects.create(author=user1, post=post1, content="mine")
+        Comment.objects.create(author=user2, post=post1, content="theirs")
+        user2.delete()
+        assert self.counters(post1)[0] == 1
+
+    def test_cascade_from_post_skips_counter_updates(self, post1, user1):
+        Comment.objects.bulk_create(Comment(author=user1, post=post1, content=f"c{i}") for i in range(5))
+        with CaptureQueriesContext(connection) as ctx:
+            post1.delete()
+        assert not [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+
+    def test_queryset_delete_of_posts_skips_counter_updates(self, post1, user1):
+        Comment.objects.bulk_create(Comment(author=user1, post=post1, content=f"c{i}") for i in range(5))
+        with CaptureQueriesContext(connection) as ctx:
+            Post.objects.filter(pk=post1.pk).delete()
+        assert not [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+
+    def test_failed_post_delete_keeps_counting(self, post1, user1):
+        from django.db import transaction
+        from django.db.models.signals import pre_delete
+        first = Comment.objects.create(author=user1, post=post1, content="a")
+        Comment.objects.create(author=user1, post=post1, content="b")
+
+        def fail(sender, instance, **kwargs):
+            raise RuntimeError("delete failed")
+        pre_delete.connect(fail, sender=Post)
+        try:
+            with pytest.raises(RuntimeError), transaction.atomic():
+                post1.delete()
+        finally:
+            pre_delete.disconnect(fail, sender=Post)
+        first.delete()
+        assert self.counters(post1)[0] == 1
+
+    def test_post_save_does_not_overwrite_counters(self, post1, user1):
+        stale = Post.objects.get(pk=post1.pk)
+        Comment.objects.create(author=user1, post=post1, content="meanwhile")
+        stale.title = "Edited"
+        stale.save()
+        assert self.counters(post1)[0] == 1
+
+    def test_reconcile_command(self, post1, user1):
+        Comment.objects.bulk_create(Comment(author=user1, post=post1, content=f"c{i}") for i in range(3))
+        Post.objects.filter(pk=post1.pk).update(comment_count=7)
+        out = StringIO()
+        call_command('reconcile_comment_counts', batch_size=1, stdout=out)
+        assert "fixed 1" in out.getvalue()
+        newest = Comment.objects.filter(post=post1).latest('created_at', 'id')
+        assert self.counters(post1) == (3, newest.created_at)
+
+@pytest.mark.django_db
+class TestCommentIngestion:
+    """Buffered ingestion: 202 + ingest_id, batched writes, backpressure, spool replay."""
+
+    @pytest.fixture(autouse=True)
+    def buffered(self, settings):
+        # no flusher thread: the tests flush explicitly, on the test's database connection
+        settings.COMMENT_INGEST = {'ENABLED': True, 'AUTOSTART': False, 'ENQUEUE_TIMEOUT': 0}
+        ingest.reset_ingestor()
+        yield settings.COMMENT_INGEST
+        ingest.reset_ingestor()
+
+    def post_comment(self, client, post, content, parent=None):
+        return client.post('/api/comments/', {"post": post.id, "parent": parent, "content": content}, format="json")
+
+    def test_accepted_then_written(self, auth_client, post1, user1):
+        resp = self.post_comment(auth_client, post1, "queued")
+        assert resp.status_code == 202
+        status_url = resp.data["status_url"]
+        assert resp["Location"] == status_url
+        assert not Comment.objects.exists()
+        assert auth_client.get(status_url).status_code == 202
+
+        ingest.get_ingestor().flush_all()
+        comment = Comment.objects.get(ingest_id=resp.data["ingest_id"])
+        assert (comment.author, comment.content, comment.path) == (user1, "queued", f"{comment.id:010d}")
+        post1.refresh_from_db()
+        assert (post1.comment_count, post1.last_comment_at) == (1, comment.created_at)
+        resp = auth_client.get(status_url)
+        assert resp.status_code == 200 and resp.data["id"] == comment.id
+
+    def test_invalid_comment_rejected_up_front(self, auth_client):
+        resp = auth_client.post('/api/comments/', {"post": 999, "content": "x"}, format="json")
+        assert resp.status_code == 400
+
+    def test_batch_of_replies(self, auth_client, comment1, post1):
+        for i in range(3):
+            self.post_comment(auth_client, post1, f"reply {i}", parent=comment1.id)
+        with CaptureQueriesContext(connection) as ctx:
+            ingest.get_ingestor().flush_all()
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        assert len(inserts) == 1
+        replies = list(Comment.objects.filter(parent=comment1).order_by('path'))
+        assert [r.content for r in replies] == ["reply 0", "reply 1", "reply 2"]
+        assert all(r.depth == 1 and r.path == f"{comment1.path}{r.id:010d}" for r in replies)
+        post1.refresh_from_db()
+        assert post1.comment_count == 4
+
+    def test_backpressure(self, auth_client, post1, buffered):
+        buffered['MAX_QUEUE'] = 1
+        ingest.reset_ingestor()
+        assert self.post_comment(auth_client, post1, "fits").status_code == 202
+        resp = self.post_comment(auth_client, post1, "does not fit")
+        assert resp.status_code == 503
+        assert resp["Retry-After"] == "1"
+        assert ingest.get_ingestor().stats()['rejected'] == 1
+
+    def test_deleted_post_is_dropped(self, auth_client, post1):
+        self.post_comment(auth_client, post1, "orphan")
+        post1.delete()
+        ingest.get_ingestor().flush_all()
+        assert ingest.get_ingestor().stats()['dropped'] == 1
+
+    def test_spool_replayed_once(self, auth_client, post1, buffered, tmp_path):
+        buffered['SPOOL_PATH'] = str(tmp_path / 'comments-{pid}.ndjson')
+        ingest.reset_ingestor()
+        ingest_id = self.post_comment(auth_client, post1, "survives").data["ingest_id"]
+        ingest.reset_ingestor()  # "crash": the queue is lost, the spool file is not
+
+        ingestor = ingest.get_ingestor()
+        ingestor.replay()
+        ingestor.flush_all()
+        assert Comment.objects.filter(ingest_id=ingest_id).count() == 1
+        assert ingestor.spool.read() == []  # truncated once everything is written
+
+    def test_long_spool_replayed_without_blocking(self, auth_client, post1, user1, buffered, tmp_path):
+        buffered.update(SPOOL_PATH=str(tmp_path / 'comments.ndjson'), MAX_QUEUE=1, BATCH_SIZE=2)
+        items = [ingest.make_item(post1.id, user1.id, f"spooled {i}") for i in range(3)]
+        (tmp_path / 'comments.ndjson').write_text(''.join(json.dumps(item) + '\n' for item in items))
+        ingest.reset_ingestor()
+
+        ingestor = ingest.get_ingestor()
+        ingestor.replay()  # longer than MAX_QUEUE: doesn't go through the queue
+        assert self.post_comment(auth_client, post1, "new").status_code == 202
+        assert ingestor.stats()['queue_depth'] == 4
+
+        ingestor.flush(ingestor.collect(block=False))
+        spooled = [item['content'] for item in ingestor.spool.read()]
+        assert spooled == ["spooled 2", "new"]  # compacted after the batch, not when the queue is empty
+        ingestor.flush_all()
+        assert Comment.objects.filter(post=post1).count() == 4
+        assert ingestor.spool.read() == []
+
+    def test_replay_command_skips_written_comments(self, post1, user1, tmp_path):
+        items = [ingest.make_item(post1.id, user1.id, f"c{i}") for i in range(3)]
+        ingest.write_batch(items[:1])
+        spool = tmp_path / 'dead-worker.ndjson'
+        spool.write_text(''.join(json.dumps(item) + '\n' for item in items) + '{"torn')
+        out = StringIO()
+        call_command('replay_comment_spool', str(spool), stdout=out)
+        assert "2 comment(s) written, 1 skipped" in out.getvalue()
+        assert Comment.objects.filter(post=post1).count() == 3
+        assert not spool.exists()
+
+    def test_stats_admin_only(self, auth_client, admin_client, post1):
+        self.post_comment(auth_client, post1, "queued")
+        assert auth_client.get('/api/comments/ingest/stats/').status_code == 403
+        stats = admin_client.get('/api/comments/ingest/stats/').json()
+        assert stats['queue_depth'] == 1 and stats['accepted'] == 1
+        ingest.get_ingestor().flush_all()
+        stats = admin_client.get('/api/comments/ingest/stats/').json()
+        assert stats['queue_depth'] == 0 and stats['written'] == 1
+        assert stats['flush_latency_ms']['p50'] is not None
+
+@pytest.mark.django_db
+class TestCommentAdminScale:
+    """Comment changelist / change page: no query per row, no <select> of every post."""
+
+    def queries(self, client, url):
+        client.get(url)  # warm up (content types, session)
+        with CaptureQueriesContext(connection) as ctx:
+            assert client.get(url).status_code == 200
+        return len(ctx.captured_queries)
+
+    def add_comments(self, post, count):
+        start = User.objects.count()
+        authors = User.objects.bulk_create(User(username=f'author{start + i}', password='!') for i in range(count))
+        for i, author in enumerate(authors):
+            Comment.objects.create(post=post, author=author, content=f'c{i}')
+
+    def test_changelist_constant_queries(self, admin_client, post1):
+        self.add_comments(post1, 3)
+        few = self.queries(admin_client, '/admin/comments/comment/')
+        self.add_comments(post1, 30)
+        assert self.queries(admin_client, '/admin/comments/comment/') == few
+
+    def test_change_page(self, admin_client, comment1, post1, user1):
+        for i in range(20):
+            Post.objects.create(title=f'Other {i}', body='B', user=user1)
+        url = f'/admin/comments/comment/{comment1.id}/change/'
+        resp = admin_client.get(url)
+        # autocomplete widget: only the selected post is rendered
+        assert 'Other 1' not in resp.content.decode()
+        assert self.queries(admin_client, url) <= 12
+
+    def test_str_does_not_query(self, comment1):
+        comment = Comment.objects.get(pk=comment1.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            str(comment)
+        assert not ctx.captured_queries
+
 # def test_create_comment_unauthenticated(self, api_client, post1):
 #         """Anonymous users cannot create comments (expect 401)."""
 #         data = {"post": post1.id, "content": "Should fail"}
@@ -0,0 +1,73 @@
+'''
+
+Thread queries on the materialized path (see Comment.path in models.py).
+
+    subtree(comment, max_depth=2)                 comment + its replies, 2 levels down
+    post_threads(post_id, threads=10, replies=3)  the 10 newest top level comments of a post,
+                                                  each with its first 3 replies (depth-first)
+
+Both are a single SELECT: a subtree is a path range on the (post, path) index, and the
+top N threads use ROW_NUMBER() OVER (PARTITION BY <thread> ORDER BY path) to cut every
+thread after K replies, in the database. The top level comments come from the partial
+(post, id) index; the window then sorts the rows of those N threads only.
+nest() turns the depth-first rows into a tree.
+
+'''
+
+from django.db.models import F, Subquery, Window
+from django.db.models.functions import RowNumber, Substr
+
+from .models import PATH_SEGMENT, Comment, subtree_range
+
+SORTS = ('newest', 'oldest')
+
+
+def thread_key():
+    """The thread a comment belongs to = the first path segment (its top level comment)."""
+    return Substr('path', 1, PATH_SEGMENT)
+
+
+def subtree(comment, max_depth=None, queryset=None):
+    """`comment` and all its replies (down to `max_depth` levels below it), in thread order."""
+    lower, upper = subtree_range(comment.path)
+    queryset = Comment.objects.all() if queryset is None else queryset
+    queryset = queryset.filter(post_id=comment.post_id, path__gte=lower, path__lt=upper)
+    if max_depth is not None:
+        queryset = queryset.filter(depth__lte=comment.depth + max_depth)
+    return queryset.order_by('path')
+
+
+def post_threads(post_id, threads=10, replies=3, sort='newest', max_depth=None, queryset=None):
+    """
+    The first `threads` top level comments of a post (newest or oldest first), each
+    followed by its first `replies` replies in thread order.
+    """
+    newest = sort == 'newest'
+    roots = (
+        Comment.objects.filter(post_id=post_id, parent__isnull=True)
+        .order_by('-id' if newest else 'id').values('path')[:threads]
+    )
+    queryset = Comment.objects.all() if queryset is None else queryset
+    queryset = queryset.filter(post_id=post_id).annotate(thread=thread_key()).filter(thread__in=Subquery(roots))
+    if max_depth is not None:
+        queryset = queryset.filter(depth__lte=max_depth)
+    queryset = queryset.annotate(
+        thread_position=Window(RowNumber(), partition_by=[F('thread')], order_by=F('path').asc()),
+    ).filter(thread_position__lte=replies + 1)  # + 1: the top level comment itself
+    # roots have path == thread key, ids are zero-padded: thread order == id order
+    return queryset.order_by(F('thread').desc() if newest else F('thread').asc(), 'path')
+
+
+def nest(rows, data, children_key='replies'):
+    """
+    Depth-first `rows` (dicts with id and parent) and their serialized `data` -> list of
+    top level items, replies nested under `children_key`. Rows whose parent is not part
+    of `rows` (cut by max_depth, or a subtree's own root) become top level items.
+    """
+    by_id, top = {}, []
+    for row, item in zip(rows, data):
+        item[children_key] = []
+        by_id[row['id']] = item
+        parent = by_id.get(row['parent'])
+        (parent[children_key] if parent is not None else top).append(item)
+    return top
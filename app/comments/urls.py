@@ -1,7 +1,18 @@
 from django.urls import path
-from .views import CommentListView, CommentDetailView
+from .views import (
+    CommentListView, CommentDetailView, CommentExportView, CommentListAsyncView, CommentThreadView, CommentThreadsView,
+    CommentIngestStatsView, CommentIngestStatusView, PostCommentListView,
+)
+from app.core.asyncviews import async_reads_enabled
 
 urlpatterns = [
-    path('comments/', CommentListView.as_view(), name="comment-list-create"),
+    path('comments/', (CommentListAsyncView if async_reads_enabled() else CommentListView).as_view(),
+         name="comment-list-create"),
+    path('posts/<int:post_pk>/comments/', PostCommentListView.as_view(), name="post-comment-list"),
+    path('comments/export/', CommentExportView.as_view(), name="comment-export"),
+    path('comments/threads/', CommentThreadsView.as_view(), name="comment-threads"),
+    path('comments/ingest/stats/', CommentIngestStatsView.as_view(), name="comment-ingest-stats"),
+    path('comments/ingest/<uuid:ingest_id>/', CommentIngestStatusView.as_view(), name="comment-ingest-status"),
+    path('comments/<int:pk>/thread/', CommentThreadView.as_view(), name="comment-thread"),
     path('comments/<int:pk>/', CommentDetailView.as_view(), name="comment-detail")
 ]
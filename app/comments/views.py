@@ -1,35 +1,260 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import generics, status
+from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
 from .serializers import CommentCreateSerializer, CommentListSerializer, CommentUpdateSerializer
-from .models import Comment
-from drf_spectacular.utils import extend_schema
+from .models import Comment, MAX_DEPTH
+from .filters import CommentFilter, StableOrderingFilter
+from .threads import SORTS, nest, post_threads, subtree
+from drf_spectacular.utils import extend_schema, extend_schema_view
 from drf_spectacular.openapi import AutoSchema
+from app.core.fieldsets import sparse_queryset, sparse_fieldset_parameters
+from app.core.fastpath import FastReadMixin, compile_row_converter, fast_read_enabled
+from app.core.asyncviews import AsyncModelReadView
+from app.core.replicas import ReplicaReadMixin
+from app.core.pagination import HybridPagination, KeysetPagination
+from app.core.export import streaming_export, export_parameters
+from .ingest import QueueFull, get_ingestor, ingest_enabled, ingest_settings, make_item
+from math import ceil
+from rest_framework.permissions import IsAdminUser
+from django.urls import reverse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework.exceptions import NotFound, ValidationError
+from app.posts.models import Post
 
 
-class CommentListView(APIView):
+class CommentKeysetPagination(KeysetPagination):
+    ordering = 'created_at'  # oldest first, like a discussion thread
+
+class CommentPagination(HybridPagination):
+    """?page=N (default) or keyset with ?cursor=, never more than max_page_size comments."""
+    keyset_class = CommentKeysetPagination
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class CommentQueryMixin:
+    """Queryset, filters and serializer shared by the comment list and its export."""
+    queryset = Comment.objects.select_related('author').order_by('created_at', 'id')
+    serializer_class = CommentListSerializer
+    filter_backends = [DjangoFilterBackend, StableOrderingFilter]
+    filterset_class = CommentFilter
+    # ?ordering=path => depth-first thread order (replies right after their parent)
+    ordering_fields = ['created_at', 'path']
+    ordering = ['created_at', 'id']
+    # columns the keyset cursors read, whatever ?fields= selects
+    sparse_always_load = ('id', 'created_at', 'path')
+    fast_read_extra = sparse_always_load
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method in ('GET', 'HEAD'):
+            # ?fields= / ?omit= => only load the columns the response needs
+            queryset = sparse_queryset(queryset, self.get_serializer(), always=self.sparse_always_load)
+        return queryset
+
+
+@extend_schema_view(
+    get=extend_schema(description="List Comments (paginated, oldest first)", tags=["Comments"],
+                      parameters=sparse_fieldset_parameters(CommentListSerializer)),
+    post=extend_schema(request=CommentCreateSerializer, responses=CommentCreateSerializer,
+                       description="Create Comment", tags=["Comments"]),
+)
+class CommentListView(ReplicaReadMixin, CommentQueryMixin, FastReadMixin, generics.ListCreateAPIView):
+    """
+    GET  /api/comments/?post=<id>&author=<id>  -> paginated, ordered by (created_at, id)
+         ?parent=<id>, ?max_depth=N, ?ordering=path|-created_at
+    POST /api/comments/                        -> {"post": 1, "parent": 7, "content": "..."} replies
+         with COMMENT_INGEST enabled: 202 {"ingest_id": ...}, written in batches (ingest.py)
+    Reads go through the .values() fast path (app/core/fastpath.py): one query per keyset
+    page (plus COUNT(*) with ?page=), whatever the page size.
+    """
+    schema = AutoSchema()
+    pagination_class = CommentPagination
+    query_budget = {'get': 4, 'post': 8}  # app/core/budgets.py, authentication included
+
+    def get_serializer_class(self):
+        if self.request.method == 'POST':
+            return CommentCreateSerializer
+        return CommentListSerializer
+
+    def create(self, request, *args, **kwargs):
+        if not ingest_enabled():
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        parent = data.get('parent')
+        item = make_item(data['post'].id, request.user.id, data['content'], parent.id if parent else None)
+        try:
+            ingest_id = get_ingestor().enqueue(item)
+        except QueueFull:
+            retry_after = max(1, ceil(ingest_settings()['FLUSH_INTERVAL']))
+            return Response({'detail': 'Too many comments waiting to be written, try again shortly.'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(retry_after)})
+        status_url = reverse('comment-ingest-status', kwargs={'ingest_id': ingest_id})
+        return Response({'ingest_id': ingest_id, 'status': 'queued', 'status_url': status_url},
+                        status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+
+    def perform_create(self, serializer):
+        serializer.save(author=self.request.user)
+
+@extend_schema_view(
+    get=extend_schema(description="Comments of one post (paginated, oldest first)", tags=["Comments"],
+                      parameters=sparse_fieldset_parameters(CommentListSerializer)),
+)
+class PostCommentListView(ReplicaReadMixin, CommentQueryMixin, FastReadMixin, generics.ListAPIView):
+    """
+    GET /api/posts/<post_pk>/comments/ -> CommentListView restricted to one post: same
+    filters (?author=, ?parent=, ?max_depth=, ?ordering=path), pagination and fast path,
+    served by comment_post_created_idx / comment_post_path_idx. 404 for unknown posts.
+    """
+    schema = AutoSchema()
+    pagination_class = CommentPagination
+    query_budget = 5
+
+    def get_queryset(self):
+        post_id = self.kwargs['post_pk']
+        if not Post.objects.filter(pk=post_id).exists():
+            raise NotFound('Post not found.')
+        return super().get_queryset().filter(post_id=post_id)
+
+class CommentListAsyncView(AsyncModelReadView):
+    """CommentListView GET as a native async view (ASYNC_READ_VIEWS=true), POST stays sync."""
+    view_class = CommentListView
+    read_action = 'list'
+
+class CommentExportView(CommentQueryMixin, generics.GenericAPIView):
     schema = AutoSchema()
+    query_budget = 3  # the rows are streamed after the response left the middleware: not counted
 
-    # GET /api/comments/
-    @extend_schema(responses=CommentListSerializer, description="List Comments", tags=["Comments"])
+    # GET /api/comments/export/?export_format=ndjson|csv&after=<last id>&post=<id>
+    @extend_schema(parameters=export_parameters() + sparse_fieldset_parameters(CommentListSerializer),
+                   responses={(200, 'application/x-ndjson'): OpenApiTypes.STR, (200, 'text/csv'): OpenApiTypes.STR},
+                   description="Stream every comment matching the list filters as NDJSON or CSV, in id order",
+                   tags=["Comments"])
     def get(self, request):
-        comments = Comment.objects.all()
-        serializer = CommentListSerializer(comments, many=True)
-        return Response(serializer.data)
-
-    # POST /api/comments/
-    @extend_schema(request=CommentCreateSerializer, responses=CommentCreateSerializer, description="Create Comment", tags=["Comments"])
-    def post(self, request):
-        serializer = CommentCreateSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(author=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        comments = self.filter_queryset(self.get_queryset())
+        return streaming_export(comments, self.get_serializer(), request, filename='comments')
+
+def _int_param(request, name, default, minimum, maximum):
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({name: 'A valid integer is required.'})
+    if not minimum <= value <= maximum:
+        raise ValidationError({name: f'Must be between {minimum} and {maximum}.'})
+    return value
+
+
+def _thread_parameters(*extra):
+    max_depth = OpenApiParameter('max_depth', OpenApiTypes.INT, OpenApiParameter.QUERY,
+                                 description='Levels of replies to include (0 = no replies).')
+    return [*extra, max_depth, *sparse_fieldset_parameters(CommentListSerializer)]
+
+
+class CommentThreadMixin:
+    """Serialize a depth-first comment queryset as a tree of {..., "replies": [...]}."""
+
+    def thread_response(self, request, queryset):
+        serializer = CommentListSerializer(context={'request': request})
+        converter = compile_row_converter(serializer) if fast_read_enabled() else None
+        if converter is not None:
+            rows = list(queryset.values(*dict.fromkeys(converter.values_fields + ['id', 'parent'])))
+            data = converter.convert_many(rows)
+        else:
+            comments = list(queryset.select_related('author'))
+            rows = [{'id': c.id, 'parent': c.parent_id} for c in comments]
+            data = CommentListSerializer(comments, many=True, context={'request': request}).data
+        return Response(nest(rows, data))
+
+
+class CommentThreadView(CommentThreadMixin, APIView):
+    schema = AutoSchema()
+    query_budget = 4
+
+    # GET /api/comments/<pk>/thread/?max_depth=N
+    @extend_schema(parameters=_thread_parameters(), responses=CommentListSerializer(many=True),
+                   description="A comment with its replies as a tree (one query on the path index)", tags=["Comments"])
+    def get(self, request, pk):
+        comment = get_object_or_404(Comment.objects.only('id', 'post_id', 'path', 'depth'), pk=pk)
+        max_depth = _int_param(request, 'max_depth', None, 0, MAX_DEPTH)
+        return self.thread_response(request, subtree(comment, max_depth))
+
+
+class CommentThreadsView(CommentThreadMixin, APIView):
+    schema = AutoSchema()
+    query_budget = 4
+
+    # GET /api/comments/threads/?post=<id>&threads=10&replies=3&sort=newest&max_depth=N
+    @extend_schema(
+        parameters=_thread_parameters(
+            OpenApiParameter('post', OpenApiTypes.INT, OpenApiParameter.QUERY, required=True),
+            OpenApiParameter('threads', OpenApiTypes.INT, OpenApiParameter.QUERY,
+                             description='Number of top level comments (default 10, max 100).'),
+            OpenApiParameter('replies', OpenApiTypes.INT, OpenApiParameter.QUERY,
+                             description='Replies per thread, in thread order (default 3, max 100).'),
+            OpenApiParameter('sort', OpenApiTypes.STR, OpenApiParameter.QUERY, enum=list(SORTS),
+                             description='Order of the threads (default newest).'),
+        ),
+        responses=CommentListSerializer(many=True),
+        description="The top N threads of a post with their first K replies, in one query", tags=["Comments"],
+    )
+    def get(self, request):
+        post_id = _int_param(request, 'post', None, 1, 2 ** 63 - 1)
+        if post_id is None:
+            raise ValidationError({'post': 'This parameter is required.'})
+        sort = request.query_params.get('sort', 'newest')
+        if sort not in SORTS:
+            raise ValidationError({'sort': f'Expected one of: {", ".join(SORTS)}.'})
+        queryset = post_threads(
+            post_id,
+            threads=_int_param(request, 'threads', 10, 1, 100),
+            replies=_int_param(request, 'replies', 3, 0, 100),
+            sort=sort,
+            max_depth=_int_param(request, 'max_depth', None, 0, MAX_DEPTH),
+        )
+        return self.thread_response(request, queryset)
+
+class CommentIngestStatusView(APIView):
+    schema = AutoSchema()
+    query_budget = 3
+
+    # GET /api/comments/ingest/<ingest_id>/ -> 202 while queued, 200 + comment once written
+    @extend_schema(responses={200: CommentListSerializer, 202: OpenApiTypes.OBJECT},
+                   description="State of a comment accepted by the buffered ingestion", tags=["Comments"])
+    def get(self, request, ingest_id):
+        comment = Comment.objects.select_related('author').filter(ingest_id=ingest_id).first()
+        if comment is not None:
+            return Response(CommentListSerializer(comment, context={'request': request}).data)
+        if ingest_enabled() and get_ingestor().is_pending(ingest_id):
+            return Response({'ingest_id': str(ingest_id), 'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
+        # unknown, dropped, or queued by another process
+        return Response({'detail': 'No such comment (yet).'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class CommentIngestStatsView(APIView):
+    schema = AutoSchema()
+    permission_classes = [IsAdminUser]
+    query_budget = 3
+
+    # GET /api/comments/ingest/stats/ (admin only): queue depth, flush latency of this process
+    @extend_schema(responses=OpenApiTypes.OBJECT, description="Buffered ingestion metrics (admin only)",
+                   tags=["Comments"])
+    def get(self, request):
+        if not ingest_enabled():
+            return Response({'enabled': False})
+        return Response({'enabled': True, **get_ingestor().stats()})
 
 class CommentDetailView(APIView):
     schema = AutoSchema()
     serializer_class = CommentUpdateSerializer  # helps schema generation
+    query_budget = {'put': 5, 'delete': MAX_DEPTH + 6}  # the cascade selects the replies one level at a time
     
     @extend_schema(request=CommentUpdateSerializer, responses=CommentUpdateSerializer, description="Update Comment", tags=["Comments"])
     def put(self, request, pk):
@@ -1,13 +1,33 @@
 import pytest
+from django.core.cache import caches
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
 from app.users.models import userProfile
+from app.users.authentication import token_user_cache
+from app.core.throttling import reset_throttles
+from app.core.replicas import selector as replica_selector
 
 # -----------------------
 # Fixtures
 # -----------------------
 
+"""Caches outlive the per-test database rollback, start every test empty."""
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+    token_user_cache.clear_local()
+    reset_throttles()
+    replica_selector.reset()
+    yield
+
+"""Views over their query_budget fail the test instead of logging (app/core/budgets.py)."""
+@pytest.fixture(autouse=True)
+def enforce_query_budgets(settings):
+    settings.QUERY_BUDGETS = {**settings.QUERY_BUDGETS, 'RAISE': True}
+    yield
+
 """Unauthenticated DRF client."""
 @pytest.fixture
 def api_client():
@@ -0,0 +1,333 @@
+'''
+
+Native async read path (GET/HEAD) for the API views, for ASGI deployments.
+
+DRF views are sync: under ASGI Django runs every one of them in a worker thread
+(sync_to_async), and the request holds that thread from authentication to rendering,
+including every database round trip. AsyncReadView serves the read actions of an existing
+DRF view as a real `async def` view instead:
+
+    authentication   async versions of Token / JWT / Session authentication (aget, auser)
+    permissions      `ahas_permission()` when a permission class defines one, otherwise its
+                     has_permission() is called directly (it must not query the database)
+    throttles        `aallow_request()` when the throttle class defines one, else in a thread
+    queryset         built by the DRF view itself: get_queryset(), filter backends, ?fields=
+    rows             async ORM: `async for`, aget(), acount() (see apaginate_queryset())
+    serialization    the .values() fast path of app/core/fastpath.py, no model instances
+    rendering        JSONRenderer, returned as a plain HttpResponse (a DRF Response would be
+                     rendered by Django in a thread again)
+
+Every other method (POST/PUT/PATCH/DELETE) is handed to the regular sync view, so the URL
+keeps its full behaviour. The async views only answer with JSON; the browsable API stays on
+the sync path.
+
+Selected per deployment with ASYNC_READ_VIEWS=true (settings.ASYNC_READ_VIEWS), which
+only pays off under an ASGI server (uvicorn/daphne multiplex.asgi:application): under WSGI
+every async view needs its own event loop. `manage.py bench_async` compares both paths.
+
+'''
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.http import HttpResponse
+from django.utils.decorators import classonlymethod
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication, get_authorization_header
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .fastpath import fast_read_enabled
+from .replicas import ReplicaReadMixin, use_primary, use_replica
+from .timing import timed
+
+try:
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+    from rest_framework_simplejwt.utils import get_md5_hash_password
+except ImportError:  # pragma: no cover - simplejwt is optional for this module
+    JWTAuthentication = None
+
+def async_reads_enabled():
+    return getattr(settings, 'ASYNC_READ_VIEWS', False)
+
+
+# -----------------------------
+# Async authentication
+# -----------------------------
+async def token_authenticate(authenticator, request):
+    """TokenAuthentication.authenticate() with aget()."""
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != authenticator.keyword.lower().encode():
+        return None
+    if len(auth) == 1:
+        raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+    if len(auth) > 2:
+        raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise exceptions.AuthenticationFailed(
+            _('Invalid token header. Token string should not contain invalid characters.'))
+    try:
+        token = await authenticator.get_model().objects.select_related('user').aget(key=key)
+    except ObjectDoesNotExist:
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+    return token.user, token
+
+
+async def jwt_authenticate(authenticator, request):
+    """JWTAuthentication.authenticate(): the token checks are CPU only, the user is read with aget()."""
+    header = authenticator.get_header(request)
+    if header is None:
+        return None
+    raw_token = authenticator.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = authenticator.get_validated_token(raw_token)
+    if type(authenticator).get_user is not JWTAuthentication.get_user:
+        # e.g. JWTStatelessUserAuthentication, no database involved
+        return authenticator.get_user(validated_token), validated_token
+
+    try:
+        user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_('Token contained no recognizable user identification'))
+    try:
+        user = await authenticator.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except authenticator.user_model.DoesNotExist:
+        raise exceptions.AuthenticationFailed(_('User not found'), code='user_not_found')
+    if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise exceptions.AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    if jwt_settings.CHECK_REVOKE_TOKEN and \
+            validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+        raise exceptions.AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+    return user, validated_token
+
+
+async def session_authenticate(authenticator, request):
+    """SessionAuthentication.authenticate() with request.auser(); reads need no CSRF check."""
+    auser = getattr(request._request, 'auser', None)  # set by AuthenticationMiddleware
+    if auser is None:
+        return None
+    user = await auser()
+    if not user or not user.is_active:
+        return None
+    return user, None
+
+
+ASYNC_AUTHENTICATORS = {
+    TokenAuthentication: token_authenticate,
+    SessionAuthentication: session_authenticate,
+}
+if JWTAuthentication is not None:
+    ASYNC_AUTHENTICATORS[JWTAuthentication] = jwt_authenticate
+
+
+async def aauthenticate(request):
+    """Async Request._authenticate(): first authenticator returning a user wins."""
+    for authenticator in request.authenticators:
+        if hasattr(authenticator, 'aauthenticate'):
+            user_auth = await authenticator.aauthenticate(request)
+        else:
+            adapter = next((ASYNC_AUTHENTICATORS[cls] for cls in type(authenticator).__mro__
+                            if cls in ASYNC_AUTHENTICATORS), None)
+            if adapter is not None:
+                user_auth = await adapter(authenticator, request)
+            else:
+                # unknown authentication class: correct, just not thread free
+                user_auth = await sync_to_async(authenticator.authenticate)(request)
+        if user_auth is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth
+            return
+    request._authenticator = None
+    request._not_authenticated()
+
+
+async def acheck_permissions(view, request):
+    for permission in view.get_permissions():
+        if hasattr(permission, 'ahas_permission'):
+            allowed = await permission.ahas_permission(request, view)
+        else:
+            allowed = permission.has_permission(request, view)
+        if not allowed:
+            view.permission_denied(
+                request,
+                message=getattr(permission, 'message', None),
+                code=getattr(permission, 'code', None)
+            )
+
+
+async def acheck_throttles(view, request):
+    """view.check_throttles(), with `aallow_request()` when a throttle class defines one."""
+    durations = []
+    for throttle in view.get_throttles():
+        if hasattr(throttle, 'aallow_request'):
+            allowed = await throttle.aallow_request(request, view)
+        else:
+            allowed = await sync_to_async(throttle.allow_request)(request, view)
+        if not allowed:
+            durations.append(throttle.wait())
+    if durations:
+        view.throttled(request, max((d for d in durations if d is not None), default=None))
+
+
+# -----------------------------
+# Views
+# -----------------------------
+class AsyncReadView(View):
+    """
+    Async GET/HEAD for `view_class` (a DRF APIView or ViewSet), everything else goes to
+    the sync view. Subclasses implement `async def read(self, view, request, *args, **kwargs)`
+    returning a DRF Response; `view` is an initialised `view_class` instance.
+
+        path('posts/', PostAsyncReadView.as_view(actions={'get': 'list', 'post': 'create'}))
+    """
+    view_class = None
+    actions = None
+    sync_view = None
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        view_class = initkwargs.get('view_class', cls.view_class)
+        sync_view = view_class.as_view(actions) if actions else view_class.as_view()
+        view = super().as_view(actions=actions, sync_view=sync_view, **initkwargs)
+        # CSRF is DRF's business (SessionAuthentication on unsafe methods, in the sync view)
+        return csrf_exempt(view)
+
+    async def forward(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    post = put = patch = delete = options = forward
+
+    async def get(self, request, *args, **kwargs):
+        view = self.view_class(**({'action_map': self.actions} if self.actions else {}))
+        view.args, view.kwargs = args, kwargs
+        view.format_kwarg = None
+        view.headers = view.default_response_headers
+        if self.actions:
+            # what ViewSetMixin.as_view() does, Allow headers and permissions depend on it
+            for method, action in self.actions.items():
+                setattr(view, method, getattr(view, action))
+            view.action = self.actions.get('get')
+        drf_request = Request(
+            request,
+            parsers=view.get_parsers(),
+            authenticators=view.get_authenticators(),
+            negotiator=view.get_content_negotiator(),
+            parser_context=view.get_parser_context(request),
+        )
+        drf_request.version, drf_request.versioning_scheme = None, None
+        view.request = drf_request
+        try:
+            with timed('auth'):
+                await aauthenticate(drf_request)
+            await acheck_permissions(view, drf_request)
+            await acheck_throttles(view, drf_request)
+            if isinstance(view, ReplicaReadMixin):
+                await sync_to_async(use_replica)(drf_request)  # may connect to the replica
+            response = await self.read(view, drf_request, *args, **kwargs)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        return self.render(view, drf_request, response)
+
+    async def read(self, view, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def render(self, view, request, response):
+        renderer = JSONRenderer()
+        response.accepted_renderer = renderer
+        response.accepted_media_type = renderer.media_type
+        request.accepted_renderer, request.accepted_media_type = renderer, renderer.media_type
+        response = view.finalize_response(request, response)
+        with timed('render'):
+            content = response.rendered_content
+        rendered = HttpResponse(content, status=response.status_code)
+        for header, value in response.items():
+            rendered[header] = value
+        rendered.data = response.data  # like a DRF Response, for tests and middleware
+        return rendered
+
+
+class AsyncModelReadView(AsyncReadView):
+    """
+    list/retrieve of a ModelViewSet (or a generic list/detail view, see `read_action`)
+    that uses FastReadMixin and optionally CachedResponseMixin: same queryset, filters,
+    pagination, cache and JSON. A view's `extend_list_data(data)` hook (e.g. embedded
+    comments) runs in a thread.
+    """
+
+    read_action = None  # for generic (non-ViewSet) views: 'list' or 'retrieve'
+
+    async def read(self, view, request, *args, **kwargs):
+        action = getattr(view, 'action', None) or self.read_action
+        if action not in ('list', 'retrieve'):
+            raise exceptions.MethodNotAllowed(request.method)
+        view.action = action
+        cache = getattr(view, 'response_cache', None)
+        if hasattr(view, 'is_cacheable') and view.is_cacheable(request):
+            return await self.cached(view, request, cache, kwargs)
+        with timed('serialize'):
+            return await getattr(self, action)(view, request, **kwargs)
+
+    async def cached(self, view, request, cache, kwargs):
+        if view.action == 'list':
+            key = await sync_to_async(cache.list_key)(request, view.cache_group(request))
+        else:
+            key = await sync_to_async(cache.detail_key)(request, kwargs[view.lookup_url_kwarg or view.lookup_field])
+        entry = await sync_to_async(cache.get)(key)
+        if entry is not None:
+            status_code, data = entry
+            response = Response(data, status=status_code)
+            response['X-Cache'] = 'HIT'
+            return response
+        use_primary()  # what goes into the cache is read from the primary (cache.py)
+        response = await getattr(self, view.action)(view, request, **kwargs)
+        if response.status_code == 200:
+            await sync_to_async(cache.set)(key, response, view.cache_timeouts.get(view.action))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def _converter(self, view):
+        return view.get_row_converter() if hasattr(view, 'get_row_converter') and fast_read_enabled() else None
+
+    async def list(self, view, request, **kwargs):
+        converter = self._converter(view)
+        queryset = view.filter_queryset(view.get_queryset())
+        if converter is not None:
+            queryset = queryset.values(*view._values_fields(converter))
+        paginator = view.paginator
+        if paginator is not None:
+            page = await paginator.apaginate_queryset(queryset, request, view)
+            data = self.serialize(view, converter, page)
+            if hasattr(view, 'extend_list_data'):
+                data = await sync_to_async(view.extend_list_data)(data)
+            return paginator.get_paginated_response(data)
+        rows = [row async for row in queryset]
+        return Response(self.serialize(view, converter, rows))
+
+    async def retrieve(self, view, request, **kwargs):
+        converter = self._converter(view)
+        queryset = view.filter_queryset(view.get_queryset())
+        if converter is not None:
+            queryset = queryset.values(*view._values_fields(converter))
+        lookup = {view.lookup_field: kwargs[view.lookup_url_kwarg or view.lookup_field]}
+        try:
+            row = await queryset.aget(**lookup)
+        except (ObjectDoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise exceptions.NotFound()
+        view.check_object_permissions(request, row)
+        return Response(converter(row) if converter is not None else view.get_serializer(row).data)
+
+    def serialize(self, view, converter, rows):
+        if converter is not None:
+            return converter.convert_many(rows)
+        return view.get_serializer(rows, many=True).data
@@ -0,0 +1,180 @@
+'''
+
+Query budgets: the most SQL queries one request to a view may run.
+
+    class PostViewSet(...):
+        query_budget = {'list': 5, 'retrieve': 4, 'create': 5}   # per action, or per method
+
+    @query_budget(3)                                             # same thing as a decorator
+    class ReportView(APIView): ...
+
+A budget is an int (every method) or a dict keyed by viewset action ('list', 'bulk_publish')
+or lowercase HTTP method ('get', 'post'; HEAD uses 'get'). Views without one aren't checked.
+
+QueryBudgetMiddleware counts every query of the request, on every database, middleware and
+authentication included. Over budget:
+
+    QUERY_BUDGETS['RAISE']   QueryBudgetExceeded: the request fails. app/conftest.py turns
+                             it on for the whole test suite, so an N+1 fails its tests.
+    otherwise                a warning on the `app.query_budget` logger, the details in
+                             `extra` (view, action, queries, budget, duplicated SQL)
+
+Duplicated SQL is reported by fingerprint (literals and IN lists collapsed): the same
+fingerprint run once per row is the usual N+1.
+
+'''
+
+import contextvars
+import logging
+import re
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('app.query_budget')
+
+
+def budget_settings():
+    defaults = {'ENABLED': True, 'RAISE': False, 'MAX_DUPLICATES': 5}
+    return {**defaults, **getattr(settings, 'QUERY_BUDGETS', {})}
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, report):
+        self.report = report
+        duplicates = ''.join(f"\n  {count}x {sql}" for sql, count in report['duplicates'])
+        super().__init__(f"{report['view']} ({report['action']}) ran {report['queries']} queries, "
+                         f"budget {report['budget']}{duplicates}")
+
+
+def query_budget(budget):
+    """Decorator form of the `query_budget` attribute, for view classes and functions."""
+    def decorate(view):
+        view.query_budget = budget
+        return view
+    return decorate
+
+
+def resolve_budget(view_func, request):
+    """(label, action, budget) of the view handling `request`; budget None: not checked."""
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None and cls is not None:
+        budget = getattr(cls, 'query_budget', None)
+        if budget is None and getattr(cls, 'view_class', None) is not None:
+            budget = getattr(cls.view_class, 'query_budget', None)  # async variants (asyncviews.py)
+    method = 'get' if request.method == 'HEAD' else request.method.lower()
+    # viewsets: as_view(actions); async read views (asyncviews.py) keep them in their initkwargs
+    actions = getattr(view_func, 'actions', None) or getattr(view_func, 'view_initkwargs', {}).get('actions') or {}
+    action = actions.get(method) or method
+    if isinstance(budget, dict):
+        budget = budget.get(action, budget.get(method))
+    label = cls.__name__ if cls is not None else getattr(view_func, '__name__', 'view')
+    return label, action, budget
+
+
+def fingerprint(sql):
+    """SQL with literals and IN lists collapsed: one fingerprint per query shape."""
+    sql = re.sub(r"'(?:[^']|'')*'|%s|\b\d+\b", '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def duplicated(queries, limit):
+    counts = Counter(fingerprint(sql) for sql in queries)
+    return [(sql, count) for sql, count in counts.most_common(limit) if count > 1]
+
+
+# -----------------------------
+# Counting
+# -----------------------------
+class RequestQueries:
+    __slots__ = ('queries', 'view', 'action', 'budget')
+
+    def __init__(self):
+        self.queries = []  # SQL of every query, fingerprinted only when over budget
+        self.view = self.action = self.budget = None
+
+
+request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+def query_counter(execute, sql, params, many, context):
+    state = request_queries.get()
+    if state is not None:
+        state.queries.append(sql)
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    if query_counter not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_counter)
+
+
+connection_created.connect(install_query_counter, dispatch_uid='app.core.budgets.query_counter')
+
+
+# -----------------------------
+# Middleware
+# -----------------------------
+def check_budget(state, config):
+    if state.budget is None or len(state.queries) <= state.budget:
+        return
+    report = {
+        'view': state.view,
+        'action': state.action,
+        'queries': len(state.queries),
+        'budget': state.budget,
+        'duplicates': duplicated(state.queries, config['MAX_DUPLICATES']),
+    }
+    if config['RAISE']:
+        raise QueryBudgetExceeded(report)
+    logger.warning("Query budget exceeded: %s (%s) ran %d queries, budget %d", report['view'],
+                   report['action'], report['queries'], report['budget'], extra={'query_budget': report})
+
+
+class QueryBudgetMiddleware:
+    """Counts the queries of requests to views with a budget (sync and async)."""
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        for alias in connections:
+            install_query_counter(connections[alias])  # opened before this module was imported
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = budget_settings()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        token = request_queries.set(RequestQueries())
+        try:
+            response = self.get_response(request)
+            check_budget(request_queries.get(), config)
+        finally:
+            request_queries.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        config = budget_settings()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+        token = request_queries.set(RequestQueries())
+        try:
+            response = await self.get_response(request)
+            check_budget(request_queries.get(), config)
+        finally:
+            request_queries.reset(token)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = request_queries.get()
+        if state is not None:
+            state.view, state.action, state.budget = resolve_budget(view_func, request)
+        return None
@@ -0,0 +1,194 @@
+'''
+
+Server-side response cache for read-only API endpoints.
+
+Anonymous GETs are served from Django's cache framework (any backend: locmem, file,
+redis...) instead of re-running the query + serializer. Invalidation is done with version
+tokens rather than by deleting keys (we can't enumerate every ?page=/?search= variant):
+
+    <ns>:list:<list token>:<hash of request>                 -> list responses
+    <ns>:list:<list token>.<group token>:<hash of request>   -> lists of a group
+    <ns>:obj:<pk>:<object token>:<hash of request>           -> detail responses
+
+The request hash covers the query params and the scheme + host: cached bodies hold
+absolute next/previous URLs built from them, a forged Host header must not end up in the
+responses served to everyone else.
+
+Changing an object replaces the list token (every cached list goes stale, any list may
+contain it) and that object's token (only its own detail entries go stale). Lists that
+embed related rows (posts ?with_comments=) are cached in a group (the view's
+cache_group()), whose own token the related rows' changes replace. Counter updates
+(comment_count...) only replace the object's token: plain lists catch up within their TTL.
+Stale entries are never read again and simply expire with their TTL. Misses are read from
+the primary database even in views that use read replicas (app/core/replicas.py): what is
+cached must not be older than the invalidation that made the miss.
+
+'''
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .replicas import use_primary
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+class ResponseCache:
+    def __init__(self, namespace, alias=None, timeout=None):
+        self.namespace = namespace
+        self._alias = alias
+        self._timeout = timeout
+
+    # -----------------------------
+    # Settings
+    # -----------------------------
+    @property
+    def config(self):
+        return getattr(settings, 'RESPONSE_CACHE', {})
+
+    @property
+    def cache(self):
+        return caches[self._alias or self.config.get('ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return self._timeout if self._timeout is not None else self.config.get('TIMEOUT', 60)
+
+    @property
+    def enabled(self):
+        return self.config.get('ENABLED', True)
+
+    # -----------------------------
+    # Keys
+    # -----------------------------
+    def _token(self, key):
+        token = self.cache.get(key)
+        if token is None:
+            # add() so that two processes racing here agree on a single token
+            self.cache.add(key, _new_token(), None)
+            token = self.cache.get(key)
+        return token
+
+    def _params_hash(self, request):
+        params = sorted(request.query_params.lists())
+        variant = (request.scheme, request.get_host(), params)
+        return hashlib.sha1(repr(variant).encode()).hexdigest()
+
+    def list_key(self, request, group=None):
+        token = self._token(f'{self.namespace}:list:token')
+        if group:
+            token = f"{token}.{self._token(f'{self.namespace}:list:{group}:token')}"
+        return f'{self.namespace}:list:{token}:{self._params_hash(request)}'
+
+    def detail_key(self, request, pk):
+        token = self._token(f'{self.namespace}:obj:{pk}:token')
+        return f'{self.namespace}:obj:{pk}:{token}:{self._params_hash(request)}'
+
+    # -----------------------------
+    # Read / write / invalidate
+    # -----------------------------
+    def get(self, key):
+        entry = self.cache.get(key)
+        self._count('hits' if entry is not None else 'misses')
+        return entry
+
+    def set(self, key, response, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        self.cache.set(key, (response.status_code, response.data), timeout)
+
+    def invalidate(self, pks=(), lists=True, groups=()):
+        """
+        Call after any change to the underlying rows (save, delete, queryset.update()).
+        lists=False keeps the cached lists: for frequent changes lists may show late
+        (denormalized counters), they catch up within the list TTL. `groups`: the list
+        groups to invalidate anyway (every group goes stale with lists=True).
+        """
+        tokens = {f'{self.namespace}:list:{group}:token': _new_token() for group in groups}
+        if lists:
+            tokens[f'{self.namespace}:list:token'] = _new_token()
+        if tokens:
+            self.cache.set_many(tokens, None)
+        if pks:
+            self.cache.set_many({f'{self.namespace}:obj:{pk}:token': _new_token() for pk in pks}, None)
+
+    # -----------------------------
+    # Hit/miss counters
+    # -----------------------------
+    def _count(self, name):
+        key = f'{self.namespace}:stats:{name}'
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # missing key (first hit, or evicted)
+            self.cache.add(key, 0, None)
+            self.cache.incr(key)
+
+    def stats(self):
+        counters = self.cache.get_many([f'{self.namespace}:stats:hits', f'{self.namespace}:stats:misses'])
+        hits = counters.get(f'{self.namespace}:stats:hits', 0)
+        misses = counters.get(f'{self.namespace}:stats:misses', 0)
+        total = hits + misses
+        return {
+            'namespace': self.namespace,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+
+    def reset_stats(self):
+        self.cache.delete_many([f'{self.namespace}:stats:hits', f'{self.namespace}:stats:misses'])
+
+
+class CachedResponseMixin:
+    """
+    ViewSet mixin: serve list/retrieve for anonymous users from `response_cache`.
+
+    Authenticated requests are never cached (?mine=true and friends depend on the user).
+    TTL per action comes from `cache_timeouts`, falling back to RESPONSE_CACHE['TIMEOUT'].
+    """
+    response_cache = None
+    cache_timeouts = {}
+
+    def cache_group(self, request):
+        """List group of this request (ResponseCache.list_key), None: plain lists."""
+        return None
+
+    def is_cacheable(self, request):
+        return (
+            self.response_cache is not None
+            and self.response_cache.enabled
+            and request.method == 'GET'
+            and not request.user.is_authenticated
+        )
+
+    def _cached(self, key, render):
+        entry = self.response_cache.get(key)
+        if entry is not None:
+            status_code, data = entry
+            response = Response(data, status=status_code)
+            response['X-Cache'] = 'HIT'
+            return response
+        use_primary()
+        response = render()
+        if response.status_code == 200:
+            self.response_cache.set(key, response, self.cache_timeouts.get(self.action))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().list(request, *args, **kwargs)
+        key = self.response_cache.list_key(request, self.cache_group(request))
+        return self._cached(key, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().retrieve(request, *args, **kwargs)
+        key = self.response_cache.detail_key(request, kwargs[self.lookup_url_kwarg or self.lookup_field])
+        return self._cached(key, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
@@ -0,0 +1,83 @@
+'''
+
+Database connection reuse: what settings configure and what the pool reports.
+
+multiplex/settings/base.py picks one of three modes per process (env DB_POOL, DB_CONN_MAX_AGE):
+
+    pool         Django's psycopg pool (OPTIONS['pool'], needs psycopg[pool]): min/max size,
+                 timeout for a free connection, idle connections above min_size closed after
+                 max_idle, every connection recycled after max_lifetime. With
+                 CONN_HEALTH_CHECKS a connection is checked when it leaves the pool.
+    persistent   CONN_MAX_AGE > 0: one connection per worker thread, kept between requests,
+                 checked before reuse with CONN_HEALTH_CHECKS
+    per-request  CONN_MAX_AGE = 0: Django's default, connect + disconnect on every request
+
+pool_stats() reports each database's mode and, for pools, psycopg_pool's counters: in use,
+idle, requests waiting, total and average wait. GET /api/_db/pool/ (admin only) returns
+them for this process; `manage.py bench_db_pool` compares the three modes.
+
+'''
+
+from django.db import connections
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+def connection_mode(settings_dict):
+    if settings_dict.get('OPTIONS', {}).get('pool'):
+        return 'pool'
+    return 'persistent' if settings_dict.get('CONN_MAX_AGE') != 0 else 'per-request'
+
+
+def pool_metrics(stats):
+    """psycopg_pool's get_stats() -> the numbers worth watching."""
+    size, idle = stats.get('pool_size', 0), stats.get('pool_available', 0)
+    queued = stats.get('requests_queued', 0)
+    wait_ms = stats.get('requests_wait_ms', 0)
+    return {
+        'min_size': stats.get('pool_min'),
+        'max_size': stats.get('pool_max'),
+        'size': size,
+        'in_use': size - idle,
+        'idle': idle,
+        'waiting': stats.get('requests_waiting', 0),
+        'requests': stats.get('requests_num', 0),
+        'requests_queued': queued,  # had to wait for a free connection
+        'wait_ms_total': wait_ms,
+        'wait_ms_avg': round(wait_ms / queued, 2) if queued else 0,
+        'timeouts': stats.get('requests_errors', 0),
+        'connections_opened': stats.get('connections_num', 0),
+        'connections_lost': stats.get('connections_lost', 0),
+        'returned_bad': stats.get('returns_bad', 0),
+    }
+
+
+def pool_stats():
+    """{alias: {'mode': ..., pool metrics when pooled}} for every configured database."""
+    result = {}
+    for alias in connections:
+        connection = connections[alias]
+        settings_dict = connection.settings_dict
+        entry = {
+            'mode': connection_mode(settings_dict),
+            'conn_max_age': settings_dict.get('CONN_MAX_AGE'),
+            'health_checks': settings_dict.get('CONN_HEALTH_CHECKS'),
+        }
+        pools = getattr(type(connection), '_connection_pools', {})
+        if alias in pools:  # only pools already opened, pool_stats() must not open one
+            entry.update(pool_metrics(pools[alias].get_stats()))
+        result[alias] = entry
+    return result
+
+
+class DatabasePoolStatsView(APIView):
+    permission_classes = [IsAdminUser]
+    query_budget = 3
+
+    # GET /api/_db/pool/ (admin only): connection mode and pool usage of this process
+    @extend_schema(responses=OpenApiTypes.OBJECT, description="Database connection pool metrics (admin only)")
+    def get(self, request):
+        return Response(pool_stats())
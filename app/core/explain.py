@@ -0,0 +1,76 @@
+'''
+
+EXPLAIN helpers for query-plan regression tests.
+
+    with capture_plans() as plans:
+        client.get('/api/posts/?is_published=true')
+    assert not plans.problems('posts_post')
+
+Every SELECT run inside the block is EXPLAINed afterwards. A "problem" is a full table scan
+or an explicit sort step, i.e. a query that an index should have served and no longer does.
+
+PostgreSQL: EXPLAIN runs with enable_seqscan/enable_sort turned off, so the planner only
+falls back to a Seq Scan or a Sort when no index can serve the query at all. This keeps the
+check meaningful on tiny test tables, where a sequential scan would otherwise always win.
+SQLite:     EXPLAIN QUERY PLAN; "SCAN <table>" without an index and
+            "USE TEMP B-TREE FOR ORDER BY" are the equivalents.
+
+'''
+
+import re
+from contextlib import contextmanager
+
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+def explain(sql, using='default'):
+    """Return the plan of `sql` (fully interpolated) as a list of text lines."""
+    connection = connections[using]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        return [' '.join(str(col) for col in row) for row in cursor.fetchall()]
+
+
+def plan_problems(plan, table, vendor):
+    """Lines of `plan` that scan `table` without an index or sort the result."""
+    if vendor == 'postgresql':
+        bad = [rf'Seq Scan on {table}\b', r'(^|->\s*)(Incremental )?Sort\b']
+    else:
+        bad = [rf'^SCAN {table}(?! USING)', r'USE TEMP B-TREE FOR (ORDER|GROUP) BY']
+    return [line for line in plan if any(re.search(pattern, line.strip()) for pattern in bad)]
+
+
+class CapturedPlans:
+    def __init__(self, using):
+        self.using = using
+        self.vendor = connections[using].vendor
+        self.queries = []
+
+    def for_table(self, table):
+        return [sql for sql in self.queries if f'"{table}"' in sql or f' {table} ' in sql]
+
+    def problems(self, table):
+        """{sql: [offending plan lines]} for every captured query touching `table`."""
+        found = {}
+        for sql in self.for_table(table):
+            lines = plan_problems(explain(sql, self.using), table, self.vendor)
+            if lines:
+                found[sql] = lines
+        return found
+
+
+@contextmanager
+def capture_plans(using='default'):
+    plans = CapturedPlans(using)
+    with CaptureQueriesContext(connections[using]) as ctx:
+        yield plans
+    plans.queries = [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
@@ -0,0 +1,184 @@
+'''
+
+Fast read path for serializers.
+
+A normal list response builds one model instance per row, then walks the serializer's
+field objects for every row (get_attribute -> to_representation per field per row).
+For read-only endpoints most of that work is identical on every row, so it is done once:
+
+    converter = compile_row_converter(PostSerializer(context=...))
+    rows = queryset.values(*converter.values_fields)     # plain dicts, no model instances
+    data = converter.convert_many(rows)                  # same dicts serializer.data gives
+
+compile_row_converter() resolves every field to a .values() key ('user.username' ->
+'user__username', FK -> its id) and a converter (ISO formatting for datetimes, str/bool or
+identity for everything already JSON-ready, the field's own to_representation otherwise). Fields it can't map to a column
+(SerializerMethodField, nested serializers, source='*') make it return None, and the
+caller falls back to the regular serializer.
+
+'''
+
+from django.conf import settings
+from rest_framework import fields as drf_fields
+from django.utils import timezone
+from rest_framework import ISO_8601, relations
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .fieldsets import requested_fieldset
+from .timing import timed
+
+# Field types whose to_representation() returns a DB value unchanged (or an equivalent copy)
+IDENTITY_FIELDS = (drf_fields.ReadOnlyField, drf_fields.IntegerField, drf_fields.FloatField)
+
+# compiled converters per (serializer class, selected fields); ?fields= makes the
+# second part client controlled, hence the cap
+_converters = {}
+MAX_CONVERTERS = 256
+
+
+class RowConverter:
+    def __init__(self, steps):
+        self.steps = steps  # [(output key, values() key, converter, needs timezone)]
+        self.values_fields = [key for _, key, _, _ in steps]
+
+    def bind(self):
+        """
+        Resolve per-request state once per batch: DRF looks the current timezone up for
+        every datetime of every row, which costs more than the formatting itself.
+        """
+        tz = timezone.get_current_timezone()
+        return [(name, key, convert(tz) if needs_tz else convert) for name, key, convert, needs_tz in self.steps]
+
+    def convert_many(self, rows):
+        steps = self.bind()
+        return [
+            {name: value if convert is None or value is None else convert(value)
+             for name, key, convert in steps
+             for value in (row[key],)}
+            for row in rows
+        ]
+
+    def __call__(self, row):
+        return self.convert_many([row])[0]
+
+
+def _iso_datetime(field):
+    """DateTimeField.to_representation for aware datetimes in the default ISO 8601 format."""
+    def bind(tz):
+        def convert(value):
+            if value.tzinfo is None:
+                return field.to_representation(value)
+            value = value.astimezone(tz).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+    return bind
+
+
+def _step(name, field):
+    if field.source == '*' or isinstance(field, (relations.ManyRelatedField, drf_fields.SerializerMethodField)):
+        return None
+    if hasattr(field, 'fields'):  # nested serializer
+        return None
+    key = '__'.join(field.source_attrs)
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        if field.pk_field is not None:
+            return None
+        return name, key, None, False  # .values('user') is already the id
+    if isinstance(field, relations.RelatedField):
+        return None
+    if isinstance(field, IDENTITY_FIELDS):
+        return name, key, None, False
+    if type(field) is drf_fields.CharField:
+        return name, key, str, False  # CharField.to_representation is str(value)
+    if type(field) is drf_fields.BooleanField:
+        return name, key, bool, False  # DB booleans come back as bool/0/1
+    if (type(field) is drf_fields.DateTimeField and settings.USE_TZ and not hasattr(field, 'timezone')
+            and getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601):
+        return name, key, _iso_datetime(field), True
+    return name, key, field.to_representation, False
+
+
+def compile_row_converter(serializer):
+    """RowConverter for `serializer`'s readable fields, or None if they can't all be mapped."""
+    serializer = getattr(serializer, 'child', serializer)
+    # keyed on what decides the field set, so that a cache hit never builds serializer.fields
+    cache_key = (type(serializer), *requested_fieldset(serializer.context.get('request')))
+    if cache_key not in _converters:
+        if len(_converters) >= MAX_CONVERTERS:
+            _converters.clear()
+        steps = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            step = _step(name, field)
+            if step is None:
+                _converters[cache_key] = None
+                break
+            steps.append(step)
+        else:
+            _converters[cache_key] = RowConverter(steps)
+    return _converters[cache_key]
+
+
+def fast_read_enabled():
+    return getattr(settings, 'FAST_READ_SERIALIZATION', True)
+
+
+def serialize_rows(queryset, serializer):
+    """Serialized list for `queryset`, via .values() + converter; None if unsupported."""
+    converter = compile_row_converter(serializer) if fast_read_enabled() else None
+    if converter is None:
+        return None
+    return converter.convert_many(queryset.values(*converter.values_fields))
+
+
+async def aserialize_rows(queryset, serializer):
+    """serialize_rows() for async views, rows read with the async ORM."""
+    converter = compile_row_converter(serializer) if fast_read_enabled() else None
+    if converter is None:
+        return None
+    return converter.convert_many([row async for row in queryset.values(*converter.values_fields)])
+
+
+class FastReadMixin:
+    """
+    ViewSet mixin: list/retrieve through the fast path when the serializer supports it.
+
+    `fast_read_extra` are values() columns the pagination reads from the rows
+    (keyset cursors) without them being part of the response.
+    Object permissions receive the row dict instead of a model instance on retrieve.
+    """
+    fast_read = True
+    fast_read_extra = ('id', 'created_at', 'updated_at')
+
+    def get_row_converter(self):
+        if not (self.fast_read and fast_read_enabled()):
+            return None
+        return compile_row_converter(self.get_serializer())
+
+    def _values_fields(self, converter):
+        return list(dict.fromkeys(converter.values_fields + list(self.fast_read_extra)))
+
+    def list(self, request, *args, **kwargs):
+        with timed('serialize'):  # app/core/metrics.py
+            converter = self.get_row_converter()
+            if converter is None:
+                return super().list(request, *args, **kwargs)
+            queryset = self.filter_queryset(self.get_queryset()).values(*self._values_fields(converter))
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(converter.convert_many(page))
+            return Response(converter.convert_many(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        with timed('serialize'):
+            converter = self.get_row_converter()
+            if converter is None:
+                return super().retrieve(request, *args, **kwargs)
+            queryset = self.filter_queryset(self.get_queryset()).values(*self._values_fields(converter))
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            row = get_object_or_404(queryset, **{self.lookup_field: kwargs[lookup_url_kwarg]})
+            self.check_object_permissions(request, row)
+            return Response(converter(row))
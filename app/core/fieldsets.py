@@ -0,0 +1,117 @@
+'''
+
+Sparse fieldsets: ?fields=id,title,user_username / ?omit=body
+
+The serializer only renders the requested fields, and the queryset only loads the columns
+those fields need (.only()), joining a relation only when a requested field reads through
+it (user_username -> JOIN auth_user). A title-only list never reads the `body` TextField.
+
+    class PostSerializer(SparseFieldsetMixin, serializers.ModelSerializer): ...
+
+    queryset = sparse_queryset(queryset, serializer, always=('id', 'created_at'))
+
+`always` lists columns other code reads from the instances (e.g. the keyset pagination
+cursor), which would otherwise be fetched again row by row as deferred fields.
+
+'''
+
+from django.core.exceptions import FieldDoesNotExist
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def _param_list(request, name):
+    value = request.query_params.get(name, '')
+    return tuple(item.strip() for item in value.split(',') if item.strip())
+
+
+def requested_fieldset(request):
+    """(fields, omit) from the query string; empty tuples when not given."""
+    if request is None:
+        return (), ()
+    return _param_list(request, FIELDS_PARAM), _param_list(request, OMIT_PARAM)
+
+
+class SparseFieldsetMixin:
+    """Serializer mixin: drop the fields not selected by ?fields= / ?omit= (reads only)."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return fields
+        only, omit = requested_fieldset(request)
+        if only:
+            # unknown names are ignored, an empty selection falls back to every field
+            selected = [name for name in only if name in fields]
+            if selected:
+                fields = {name: fields[name] for name in selected}
+        for name in omit:
+            fields.pop(name, None)
+        return fields
+
+
+def _columns_for(model, source_attrs):
+    """
+    ('user', 'username') -> ('user__username', 'user'); ('title',) -> ('title', None)
+    None when the source is not a plain model field (property, method...).
+    """
+    path, relation = [], []
+    for index, attr in enumerate(source_attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None
+        path.append(attr)
+        if index == len(source_attrs) - 1:
+            break
+        if not field.is_relation or field.many_to_many or field.one_to_many:
+            return None
+        relation.append(attr)
+        model = field.related_model
+    return '__'.join(path), '__'.join(relation) or None
+
+
+def sparse_queryset(queryset, serializer, always=('id',)):
+    """Restrict `queryset` to the columns/joins the (already pruned) serializer reads."""
+    request = serializer.context.get('request')
+    if not any(requested_fieldset(request)):
+        return queryset
+
+    fields = getattr(serializer, 'child', serializer).fields
+    columns, relations = set(always), set()
+    for field in fields.values():
+        if field.source in queryset.query.annotations:
+            continue
+        if field.source == '*':
+            return queryset
+        resolved = _columns_for(queryset.model, field.source_attrs)
+        if resolved is None:
+            return queryset
+        column, relation = resolved
+        columns.add(column)
+        if relation:
+            relations.add(relation)
+    queryset = queryset.select_related(None)
+    if relations:
+        # select_related() without arguments would mean "follow every FK"
+        queryset = queryset.select_related(*relations)
+    return queryset.only(*columns)
+
+
+def sparse_fieldset_parameters(serializer_class):
+    """OpenAPI parameters documenting ?fields= / ?omit= for `serializer_class`."""
+    names = ', '.join(serializer_class().fields)
+    return [
+        OpenApiParameter(
+            FIELDS_PARAM, OpenApiTypes.STR, OpenApiParameter.QUERY,
+            description=f'Comma separated fields to return (sparse fieldset). Available: {names}',
+        ),
+        OpenApiParameter(
+            OMIT_PARAM, OpenApiTypes.STR, OpenApiParameter.QUERY,
+            description='Comma separated fields to leave out of the response.',
+        ),
+    ]
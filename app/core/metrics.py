@@ -0,0 +1,290 @@
+'''
+
+Where request time goes: per request timings, per endpoint histograms, Prometheus output.
+
+MetricsMiddleware (first in MIDDLEWARE) measures a sample of the requests
+(METRICS['SAMPLE_RATE']); the others cost one random() call. For a sampled request:
+
+    db          SQL queries and their time, every database, through an execute wrapper
+                installed on each connection (connection.execute_wrappers)
+    auth        authentication (the token / JWT authentication classes, async views)
+    serialize   list/retrieve of the fast read views (FastReadMixin): serializer or row
+                converter, building the queryset and the pagination
+    render      response rendering (JSON)
+    total       the whole request, middleware included
+
+Phases don't include the SQL run inside them, that is counted under `db`. The timings go
+out as a `Server-Timing` header (browser dev tools show them) and into in-process
+histograms per endpoint (method + URL name): fixed log-spaced buckets, so recording is
+O(1) and memory doesn't grow with traffic. p50/p95/p99 are interpolated from the buckets.
+
+GET /api/_metrics serves them in the Prometheus text format, with the counters of the
+password pool, the comment ingest queue (once the process started one) and the database
+pools (staff users, or METRICS['TOKEN'] in an `X-Metrics-Token` header for scrapers).
+Every process reports its own numbers.
+
+'''
+
+import bisect
+import hmac
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from rest_framework.permissions import BasePermission
+from rest_framework.views import APIView
+
+from .timing import RequestRecord, request_record, install_sql_recorder
+
+PHASES = ('db', 'auth', 'serialize', 'render', 'total')
+QUANTILES = (0.5, 0.95, 0.99)
+
+# seconds: 0.1 ms to ~100 s, x1.25 per bucket
+DURATION_BOUNDS = [0.0001 * 1.25 ** i for i in range(63)]
+QUERY_BOUNDS = [0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 40, 50, 75, 100, 150, 200, 300, 500, 1000]
+
+
+def metrics_settings():
+    defaults = {'ENABLED': True, 'SAMPLE_RATE': 1.0, 'SERVER_TIMING': True, 'TOKEN': '', 'MAX_ENDPOINTS': 200}
+    return {**defaults, **getattr(settings, 'METRICS', {})}
+
+
+# -----------------------------
+# Histograms
+# -----------------------------
+class Histogram:
+    """Counts per bucket (value <= bound), sum and count."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)  # last one: above every bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Interpolated inside the bucket holding the q-th value; None when empty."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * max(0.0, rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}  # (method, endpoint) -> {'db': Histogram, ..., 'queries': Histogram}
+
+    def observe(self, method, endpoint, phases, queries, max_endpoints):
+        key = (method, endpoint)
+        with self.lock:
+            histograms = self.endpoints.get(key)
+            if histograms is None:
+                if len(self.endpoints) >= max_endpoints:
+                    key = (method, 'other')
+                    histograms = self.endpoints.get(key)
+                if histograms is None:
+                    histograms = {phase: Histogram(DURATION_BOUNDS) for phase in PHASES}
+                    histograms['queries'] = Histogram(QUERY_BOUNDS)
+                    self.endpoints[key] = histograms
+            for phase, seconds in phases.items():
+                histograms[phase].observe(seconds)
+            histograms['queries'].observe(queries)
+
+    def snapshot(self):
+        """{(method, endpoint): {name: (quantiles, sum, count)}}, consistent per endpoint."""
+        with self.lock:
+            return {
+                key: {name: ([h.quantile(q) for q in QUANTILES], h.sum, h.count) for name, h in histograms.items()}
+                for key, histograms in self.endpoints.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+
+registry = Registry()
+
+
+def endpoint_name(request):
+    """URL name ('post-list', 'comment-list'...), the route without one; bounded label values."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+# -----------------------------
+# Middleware
+# -----------------------------
+def server_timing(record):
+    entries = [f'db;dur={record.sql_time * 1000:.2f};desc="{record.queries} queries"']
+    entries += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in record.phases.items()
+                if name not in ('db', 'total')]
+    entries.append(f'total;dur={record.phases["total"] * 1000:.2f}')
+    return ', '.join(entries)
+
+
+class MetricsMiddleware:
+    """Samples requests, records their phases, adds Server-Timing (sync and async)."""
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        for alias in connections:
+            install_sql_recorder(connections[alias])  # opened before this module was imported
+
+    def start(self):
+        config = metrics_settings()
+        if not config['ENABLED'] or random.random() >= config['SAMPLE_RATE']:
+            return None, config
+        return request_record.set(RequestRecord()), config
+
+    def finish(self, request, response, token, config):
+        record = request_record.get()
+        request_record.reset(token)
+        record.phases['total'] = time.perf_counter() - record.start
+        record.phases['db'] = record.sql_time
+        registry.observe(request.method, endpoint_name(request), record.phases, record.queries,
+                         config['MAX_ENDPOINTS'])
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(record)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token, config = self.start()
+        if token is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            request_record.reset(token)
+            raise
+        return self.finish(request, response, token, config)
+
+    async def __acall__(self, request):
+        token, config = self.start()
+        if token is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            request_record.reset(token)
+            raise
+        return self.finish(request, response, token, config)
+
+    def process_template_response(self, request, response):
+        # called right before the handler renders DRF's Response (this middleware is outermost)
+        record = request_record.get()
+        if record is not None:
+            start, sql_before = time.perf_counter(), record.sql_time
+
+            def rendered(response):
+                record.add_phase('render', time.perf_counter() - start - (record.sql_time - sql_before))
+                return response
+            response.add_post_render_callback(rendered)
+        return response
+
+
+# -----------------------------
+# Prometheus endpoint
+# -----------------------------
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return 'NaN' if value is None else repr(float(value))
+
+
+def prometheus_text():
+    lines = [
+        '# HELP api_request_duration_seconds Sampled request time per endpoint and phase.',
+        '# TYPE api_request_duration_seconds summary',
+    ]
+    queries = [
+        '# HELP api_request_queries SQL queries per sampled request.',
+        '# TYPE api_request_queries summary',
+    ]
+
+    def summary(out, name, labels, stats):
+        quantiles, total, count = stats
+        for q, value in zip(QUANTILES, quantiles):
+            out.append(f'{name}{{{labels},quantile="{q}"}} {_number(value)}')
+        out.append(f'{name}_sum{{{labels}}} {_number(total)}')
+        out.append(f'{name}_count{{{labels}}} {count}')
+
+    for (method, endpoint), stats in sorted(registry.snapshot().items()):
+        labels = f'method="{_label(method)}",endpoint="{_label(endpoint)}"'
+        for phase in PHASES:
+            if stats[phase][2]:  # phases the endpoint never went through (render of a 204...)
+                summary(lines, 'api_request_duration_seconds', f'{labels},phase="{phase}"', stats[phase])
+        summary(queries, 'api_request_queries', labels, stats['queries'])
+    return '\n'.join(lines + queries + component_metrics()) + '\n'
+
+
+def component_metrics():
+    """Counters of the process' pools and queues, as Prometheus lines."""
+    from app.comments.ingest import existing_ingestor
+    from app.users.passwords import password_pool
+    from .dbpool import pool_stats
+
+    lines = ['# TYPE app_password_pool_total counter']
+    for event, count in password_pool.stats().items():
+        lines.append(f'app_password_pool_total{{event="{event}"}} {count}')
+    ingestor = existing_ingestor()  # a scrape must not start the flusher (and replay the spool)
+    if ingestor is not None:
+        stats = ingestor.stats()
+        lines += ['# TYPE app_comment_ingest_total counter']
+        for event in ('accepted', 'rejected', 'written', 'dropped', 'batches', 'failed_batches'):
+            lines.append(f'app_comment_ingest_total{{event="{event}"}} {stats[event]}')
+        lines += ['# TYPE app_comment_ingest_queue_depth gauge', f"app_comment_ingest_queue_depth {stats['queue_depth']}"]
+    lines.append('# TYPE app_db_pool gauge')
+    for alias, stats in pool_stats().items():
+        for name in ('size', 'in_use', 'idle', 'waiting', 'requests_queued', 'timeouts'):
+            if name in stats:
+                lines.append(f'app_db_pool{{database="{_label(alias)}",stat="{name}"}} {stats[name]}')
+    return lines
+
+
+class MetricsPermission(BasePermission):
+    """Staff users, or scrapers sending METRICS['TOKEN'] as X-Metrics-Token."""
+
+    def has_permission(self, request, view):
+        token = metrics_settings()['TOKEN']
+        sent = request.META.get('HTTP_X_METRICS_TOKEN', '')
+        if token and sent and hmac.compare_digest(token, sent):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+class MetricsView(APIView):
+    permission_classes = [MetricsPermission]
+    query_budget = 3
+
+    # GET /api/_metrics: this process' request histograms and pool counters, Prometheus text format
+    @extend_schema(responses={(200, 'text/plain'): OpenApiTypes.STR}, description="Prometheus metrics (staff or X-Metrics-Token)")
+    def get(self, request):
+        return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,301 @@
+'''
+
+Keyset (cursor) pagination.
+
+PageNumberPagination answers "page 5000" with COUNT(*) + OFFSET 49990, so the database
+has to walk every skipped row and deep pages get slower and slower.
+
+Keyset pagination remembers the last row it handed out (its ordering value + id) and asks
+for the rows that come "after" it:
+
+    WHERE (created_at < :v) OR (created_at = :v AND id < :id)
+    ORDER BY created_at DESC, id DESC
+    LIMIT page_size + 1
+
+With an index on (created_at, id) every page costs the same, no matter how deep.
+The position is handed to the client as an opaque base64 cursor in next/previous links.
+
+'''
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.template import loader
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def _row_value(row, name):
+    """Rows are model instances, or dicts when the queryset was built with .values()"""
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate on (<ordering field>, id) without COUNT(*) and without OFFSET.
+
+    The ordering field comes from the view's OrderingFilter (?ordering=-updated_at) when
+    one is used, otherwise from `ordering` below. `id` is always appended as tie-breaker
+    so that rows sharing the same timestamp are never skipped or repeated.
+    """
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'Opaque keyset cursor. Send an empty value to start from the first page.'
+    ordering = '-created_at'
+    tiebreak_field = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+    template = 'rest_framework/pagination/previous_and_next.html'
+
+    # -----------------------------
+    # Pagination API
+    # -----------------------------
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        return self.build_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views (app/core/asyncviews.py)."""
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        return self.build_page([row async for row in page_queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Return the (lazy) queryset for the requested page: filtered after the cursor,
+        ordered on the keyset and limited to page_size + 1 rows (the extra row tells
+        us whether there is a next page).
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        descending = self.field.startswith('-')
+        name = self.field.lstrip('-')
+        reverse = bool(self.cursor and self.cursor['r'])
+        # Walking backwards (previous page) means flipping the direction
+        if reverse:
+            descending = not descending
+
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(prefix + name, prefix + self.tiebreak_field)
+
+        if self.cursor is not None and self.cursor['v'] is not None:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{name}__{lookup}': self.cursor['v']}) |
+                Q(**{name: self.cursor['v'], f'{self.tiebreak_field}__{lookup}': self.cursor['id']})
+            )
+        return queryset[:self.page_size + 1]
+
+    def build_page(self, rows):
+        """Turn the page_size + 1 rows fetched by get_page_queryset() into the page."""
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.cursor is not None and self.cursor['r']:
+            rows.reverse()
+            self.has_next = self.cursor['v'] is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None and self.cursor['v'] is not None
+
+        self.page = rows
+        self.display_page_controls = self.has_next or self.has_previous
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link(),
+        }
+
+    def to_html(self):
+        return loader.get_template(self.template).render(self.get_html_context())
+
+    # -----------------------------
+    # Settings from the request
+    # -----------------------------
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Use the first field chosen by the view's OrderingFilter, otherwise `ordering`.
+        """
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        field = ordering[0] if ordering else self.ordering
+        if '__' in field or field.lstrip('-') in ('pk', self.tiebreak_field):
+            return self.ordering
+        return field
+
+    # -----------------------------
+    # Cursors
+    # -----------------------------
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if cursor['o'] != self.field:
+                # cursor was issued for another ?ordering
+                raise ValueError
+            return {'v': cursor['v'], 'id': int(cursor['id']), 'r': bool(cursor['r'])}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        value = _row_value(row, self.field.lstrip('-'))
+        cursor = {
+            'o': self.field,
+            'v': value.isoformat() if hasattr(value, 'isoformat') else value,
+            'id': _row_value(row, self.tiebreak_field),
+            'r': int(reverse),
+        }
+        encoded = urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Walked backwards past the start: restart from the top
+            return replace_query_param(self.base_url, self.cursor_query_param, '')
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    # -----------------------------
+    # OpenAPI
+    # -----------------------------
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str(self.cursor_query_description),
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results per keyset page (max {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class HybridPagination(PageNumberPagination):
+    """
+    PageNumberPagination by default (?page=3), keyset pagination when the client opts in
+    by sending the cursor parameter (?cursor= for the first page, then follow `next`).
+    """
+    keyset_class = KeysetPagination
+
+    def use_keyset(self, request):
+        return self.keyset_class.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.keyset_class() if self.use_keyset(request) else None
+        if self.keyset is not None:
+            page = self.keyset.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.keyset.display_page_controls
+            return page
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for async views: same pages, COUNT(*) through acount() and the
+        page rows through an async iteration instead of Django's (sync) Paginator.
+        """
+        self.keyset = self.keyset_class() if self.use_keyset(request) else None
+        if self.keyset is not None:
+            page = await self.keyset.apaginate_queryset(queryset, request, view)
+            self.display_page_controls = self.keyset.display_page_controls
+            return page
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()  # cached_property, Page/num_pages read it
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        bottom = (number - 1) * page_size
+        top = bottom + page_size
+        if top + paginator.orphans >= paginator.count:
+            top = paginator.count
+        rows = [row async for row in queryset[bottom:top]] if top > bottom else []
+
+        self.page = paginator._get_page(rows, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + \
+            self.keyset_class().get_schema_operation_parameters(view)
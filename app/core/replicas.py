@@ -0,0 +1,221 @@
+'''
+
+Read replicas: list/detail reads of the busy endpoints go to a replica, everything else to
+the primary (`default`).
+
+    ReplicaReadMixin      views opt in (PostViewSet, CommentListView, UserMeView...): their
+                          GET/HEAD queries after authentication read from a replica
+    use_primary()         back to the primary for the rest of the request: responses about
+                          to be stored in the response cache (app/core/cache.py) are read
+                          from the primary, a lagging replica would keep serving a stale
+                          body for the cache TTL after the invalidation
+    ReplicaMiddleware     per request state; a request that wrote pins its user to the
+                          primary for REPLICAS['STICKY_SECONDS'] (read your own writes)
+    ReplicaRouter         DATABASE_ROUTERS: reads of an opted-in request -> its replica,
+                          unless the request wrote, the user is pinned or a transaction is
+                          open on the primary; writes of a request -> primary, always
+
+Every request that may use a replica picks one replica for all its queries: weighted round
+robin over REPLICAS['ALIASES'] ({alias: weight}). A replica that can't be connected to is
+skipped for REPLICAS['RETRY_AFTER'] seconds (failover to the next one, then to the
+primary). Replicas lag: anything that must see the latest data (writes, checks before a
+write, admin, jobs) never opts in.
+
+Pins live in the Django cache, shared by all processes of the cache backend. With no
+REPLICAS['ALIASES'] nothing changes: every query goes to the primary.
+
+'''
+
+import contextvars
+import itertools
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+
+def replica_settings():
+    defaults = {'ALIASES': {}, 'STICKY_SECONDS': 5, 'RETRY_AFTER': 30, 'CACHE_ALIAS': 'default'}
+    return {**defaults, **getattr(settings, 'REPLICAS', {})}
+
+
+class RequestState:
+    __slots__ = ('replica', 'wrote', 'user_id', 'atomic_depth')
+
+    def __init__(self):
+        self.replica = None  # alias chosen for this request's reads, None: primary
+        self.wrote = False
+        self.user_id = None
+        # transactions already open when the request started (ATOMIC_REQUESTS adds its own later)
+        self.atomic_depth = len(connections[DEFAULT_DB_ALIAS].atomic_blocks)
+
+
+_state = contextvars.ContextVar('replica_state', default=None)
+
+
+# -----------------------------
+# Replica selection
+# -----------------------------
+def weighted_schedule(weights):
+    """{'a': 2, 'b': 1} -> ['a', 'b', 'a']: every alias `weight` times, spread out."""
+    slots = sorted((k / weight, alias) for alias, weight in weights.items() for k in range(weight))
+    return [alias for _, alias in slots]
+
+
+class ReplicaSelector:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.weights, self.schedule = None, []
+        self.down = {}  # alias -> monotonic time it may be tried again
+
+    def choose(self):
+        """A reachable replica in weighted round robin order, None when none is."""
+        config = replica_settings()
+        if not config['ALIASES']:
+            return None
+        with self.lock:
+            if config['ALIASES'] != self.weights:
+                self.weights, self.schedule = dict(config['ALIASES']), weighted_schedule(config['ALIASES'])
+            schedule, start = self.schedule, next(self.counter)
+        now = time.monotonic()
+        for i in range(len(schedule)):
+            alias = schedule[(start + i) % len(schedule)]
+            if self.down.get(alias, 0) > now:
+                continue
+            if self.reachable(alias, config):
+                return alias
+        return None
+
+    def reachable(self, alias, config):
+        try:
+            connections[alias].ensure_connection()  # no-op on an open connection
+        except DatabaseError as exc:
+            self.down[alias] = time.monotonic() + config['RETRY_AFTER']
+            logger.warning("Replica %s unreachable, skipped for %ss: %s", alias, config['RETRY_AFTER'], exc)
+            return False
+        self.down.pop(alias, None)
+        return True
+
+    def reset(self):
+        self.down.clear()
+
+
+selector = ReplicaSelector()
+
+
+# -----------------------------
+# Read your writes
+# -----------------------------
+def _pin_key(user_id):
+    return f'replicas:pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    config = replica_settings()
+    until = time.time() + config['STICKY_SECONDS']
+    caches[config['CACHE_ALIAS']].set(_pin_key(user_id), until, timeout=int(config['STICKY_SECONDS']) + 1)
+
+
+def is_pinned(user_id):
+    config = replica_settings()
+    until = caches[config['CACHE_ALIAS']].get(_pin_key(user_id))
+    return until is not None and until > time.time()
+
+
+def use_replica(request):
+    """Let the rest of this request read from a replica (safe methods, user not pinned)."""
+    state = _state.get()
+    if state is None or request.method not in SAFE_METHODS or not replica_settings()['ALIASES']:
+        return None
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        state.user_id = user.pk
+        if is_pinned(user.pk):
+            return None
+    if not state.wrote:
+        state.replica = selector.choose()
+    return state.replica
+
+
+def use_primary():
+    """The rest of this request reads from the primary again."""
+    state = _state.get()
+    if state is not None:
+        state.replica = None
+
+
+class ReplicaReadMixin:
+    """DRF views: GET/HEAD read from a replica once authentication and permissions passed."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        use_replica(request)
+
+
+# -----------------------------
+# Middleware + router
+# -----------------------------
+def _finish(request, token):
+    state = _state.get()
+    _state.reset(token)
+    if state.wrote and replica_settings()['ALIASES']:
+        user = getattr(request, 'user', None)  # DRF copies its user onto the Django request
+        user_id = user.pk if user is not None and user.is_authenticated else state.user_id
+        if user_id is not None:
+            pin_to_primary(user_id)
+
+
+class ReplicaMiddleware:
+    """Request state for ReplicaRouter; pins users whose request wrote (sync and async)."""
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _state.set(RequestState())
+        try:
+            return self.get_response(request)
+        finally:
+            _finish(request, token)
+
+    async def __acall__(self, request):
+        token = _state.set(RequestState())
+        try:
+            return await self.get_response(request)
+        finally:
+            _finish(request, token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None:
+            return None  # not in a request (commands, jobs, shell): Django's defaults
+        if state.replica is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if len(connections[DEFAULT_DB_ALIAS].atomic_blocks) > state.atomic_depth:
+            return DEFAULT_DB_ALIAS  # reads inside a transaction of this request see its writes
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is None:
+            return None
+        state.wrote = True  # later reads of this request, and of its user for a while: primary
+        return DEFAULT_DB_ALIAS  # also for objects that were read from a replica
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same rows as the primary
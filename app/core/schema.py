@@ -0,0 +1,203 @@
+'''
+
+The OpenAPI schema (/api/schema/), generated once instead of on every request.
+
+drf-spectacular's SpectacularAPIView introspects every view and serializer of the project
+on each hit: hundreds of milliseconds of CPU for a document that only changes with the
+code. CachedSchemaView serves the same document from memory:
+
+    precompiled   `manage.py compile_schema` (build/deploy step, like collectstatic) writes
+                  schema.yaml and schema.json to SCHEMA_CACHE['DIR'], each with a .gz (and
+                  a .br when brotli is installed) variant. Loaded once per process.
+    lazy          no compiled files: the first request generates and compresses the schema,
+                  later ones of the process reuse it
+
+Every representation has a strong ETag (If-None-Match -> 304) and the compressed variant is
+sent as is to clients that accept it. Requests for another language (?lang=) or API version
+go through drf-spectacular's own generation, uncached.
+
+Compiled files are not checked against the code: compile again on every deploy, or remove
+SCHEMA_CACHE['DIR'] to generate lazily.
+
+'''
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import namedtuple
+from importlib.util import find_spec
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SpectacularAPIView
+
+if find_spec('brotli'):
+    import brotli
+else:
+    brotli = None
+
+RENDERERS = {'yaml': OpenApiYamlRenderer, 'json': OpenApiJsonRenderer}
+
+# body: uncompressed bytes; encoded: {'gzip': bytes, 'br': bytes}
+CompiledSchema = namedtuple('CompiledSchema', 'body encoded etag')
+
+
+def schema_settings():
+    defaults = {'DIR': None, 'MAX_AGE': 60}
+    return {**defaults, **getattr(settings, 'SCHEMA_CACHE', {})}
+
+
+def generate_schema():
+    """The schema as SpectacularAPIView builds it (public, default language and version)."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    return generator.get_schema(request=None, public=True)
+
+
+def render_schema(schema, fmt):
+    return RENDERERS[fmt]().render(schema, RENDERERS[fmt].media_type, {})
+
+
+def compress(body):
+    encoded = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}  # mtime=0: same bytes, same build
+    if brotli is not None:
+        encoded['br'] = brotli.compress(body)
+    return encoded
+
+
+def make_compiled(body, encoded):
+    return CompiledSchema(body, encoded, hashlib.sha256(body).hexdigest()[:32])
+
+
+# -----------------------------
+# Build step
+# -----------------------------
+SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def compile_schema(directory):
+    """Write schema.{yaml,json} and their compressed variants; returns {file name: size}."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    schema = generate_schema()
+    written = {}
+    for fmt in RENDERERS:
+        body = render_schema(schema, fmt)
+        files = {f'schema.{fmt}': body}
+        files.update({f'schema.{fmt}{SUFFIXES[coding]}': data for coding, data in compress(body).items()})
+        for name, data in files.items():
+            tmp = directory / f'.{name}.tmp'
+            tmp.write_bytes(data)
+            os.replace(tmp, directory / name)  # atomic: a running server never reads half a file
+            written[name] = len(data)
+    return written
+
+
+def load_compiled(directory, fmt):
+    """The compiled files of `fmt`, None when they weren't built."""
+    if not directory:
+        return None
+    path = Path(directory) / f'schema.{fmt}'
+    try:
+        body = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    encoded = {}
+    for coding, suffix in SUFFIXES.items():
+        variant = path.with_name(path.name + suffix)
+        if variant.exists():
+            encoded[coding] = variant.read_bytes()
+    return make_compiled(body, encoded)
+
+
+# -----------------------------
+# In-process memo
+# -----------------------------
+_compiled = {'config': None, 'schemas': {}}
+_lock = threading.Lock()
+
+
+def get_compiled(fmt):
+    """CompiledSchema of `fmt` ('yaml' or 'json'): compiled files, else generated once."""
+    config = schema_settings()
+    compiled = _compiled['schemas'].get(fmt) if _compiled['config'] == config else None
+    if compiled is not None:
+        return compiled
+    with _lock:
+        if _compiled['config'] != config:
+            _compiled['config'], _compiled['schemas'] = config, {}
+        compiled = _compiled['schemas'].get(fmt)
+        if compiled is None:
+            compiled = load_compiled(config['DIR'], fmt)
+            if compiled is None:
+                body = render_schema(generate_schema(), fmt)
+                compiled = make_compiled(body, compress(body))
+            _compiled['schemas'][fmt] = compiled
+    return compiled
+
+
+def reset_schema_cache():
+    with _lock:
+        _compiled['config'], _compiled['schemas'] = None, {}
+
+
+def accepted_encodings(header):
+    """'gzip, br;q=0.5, deflate;q=0' -> {'gzip', 'br'}."""
+    codings = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        params = params.strip()
+        try:
+            weight = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            continue
+        coding = coding.strip().lower()
+        if coding and weight > 0:
+            codings.add(coding)
+    return codings
+
+
+# -----------------------------
+# View
+# -----------------------------
+class CachedSchemaView(SpectacularAPIView):
+    """SpectacularAPIView served from the precompiled / memoized schema."""
+    query_budget = 2  # authentication only
+
+    @extend_schema(exclude=True)
+    def get(self, request, *args, **kwargs):
+        if (request.GET.get('lang') or request.GET.get('version') or request.version or not self.serve_public
+                or self.api_version or self.custom_settings or self.urlconf or self.patterns):
+            return super().get(request, *args, **kwargs)
+        renderer = request.accepted_renderer
+        compiled = get_compiled(renderer.format)
+
+        coding = None
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for candidate in ('br', 'gzip'):
+            if candidate in compiled.encoded and candidate in accepted:
+                coding = candidate
+                break
+        etag = quote_etag(f'{compiled.etag}-{coding}' if coding else compiled.etag)
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and ({etag, '*'} & set(parse_etags(if_none_match))):
+            response = HttpResponseNotModified()
+        else:
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f'{content_type}; charset={renderer.charset}'
+            response = HttpResponse(compiled.encoded[coding] if coding else compiled.body, content_type=content_type)
+            response['Content-Disposition'] = f'inline; filename="{self._get_filename(request, None)}"'
+            if coding:
+                response['Content-Encoding'] = coding
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=schema_settings()['MAX_AGE'])
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
@@ -0,0 +1,319 @@
+'''
+
+Rate limiting for `throttle_scope` views at O(1) per check.
+
+DRF's ScopedRateThrottle keeps the timestamp of every request of the window in the cache
+and rewrites the whole list on each check: a 1000/hour scope pickles up to 1000 floats per
+request. RateLimitThrottle keeps a couple of numbers per client instead:
+
+    sliding   sliding window counter: this window's count plus the previous window's,
+              weighted by how much of it still overlaps the last `period` seconds
+    bucket    token bucket: `limit` tokens refilled at limit/period per second, allows
+              bursts of up to `limit` requests
+
+Backends (THROTTLING['BACKEND']):
+
+    local     a dict in the process, under a lock: no I/O at all, but every process
+              counts on its own (the effective limit is limit x worker processes)
+    cache     the Django cache (THROTTLING['ALIAS']): shared by every process. The sliding
+              counter is one atomic incr() (the previous window's count is immutable and
+              remembered locally); clients over their limit are remembered locally until
+              Retry-After, so floods cost no round trip. The token bucket is a get and a
+              set, two concurrent requests may both take the last token.
+
+Rates and algorithms per scope in settings:
+
+    THROTTLING = {'RATES': {'user': '600/minute', 'login': '10/minute'}, 'ALGORITHMS': {'login': 'bucket'}}
+
+Responses get `RateLimit-Limit`, `RateLimit-Remaining`, `RateLimit-Reset` and
+`RateLimit-Policy` headers (RateLimitHeadersMiddleware), 429s a `Retry-After` too.
+
+'''
+
+import math
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# retry_after: seconds until the next request is allowed (0 when this one was)
+Decision = namedtuple('Decision', 'allowed limit remaining reset retry_after period')
+
+
+def throttling_settings():
+    defaults = {
+        'BACKEND': 'local',
+        'ALIAS': 'default',
+        'ALGORITHM': 'sliding',
+        'ALGORITHMS': {},
+        'RATES': {},
+        'MAX_KEYS': 100000,
+    }
+    return {**defaults, **getattr(settings, 'THROTTLING', {})}
+
+
+@lru_cache(maxsize=64)
+def parse_rate(rate):
+    """'100/minute', '10/s', '1000/6h' -> (100, 60), (10, 1), (1000, 21600)."""
+    count, period = rate.split('/')
+    match = re.fullmatch(r'(\d*)\s*([smhd])\w*', period.strip())
+    if match is None:
+        raise ValueError(f'Invalid rate {rate!r}')
+    return int(count), int(match.group(1) or 1) * PERIODS[match.group(2)]
+
+
+def sliding_decision(allowed, limit, period, previous, current, elapsed):
+    """Decision of the sliding window counter; `current` includes this request if allowed."""
+    weight = (period - elapsed) / period
+    used = previous * weight + current
+    if allowed:
+        retry_after = 0
+    elif current < limit and previous:
+        # the previous window's share has to shrink below what is left
+        retry_after = period * (1 - (limit - current) / previous) - elapsed
+    else:
+        # next window: this one becomes the previous one
+        retry_after = (period - elapsed) + period * max(0.0, 1 - limit / current)
+    retry_after = max(0.0, retry_after)
+    return Decision(allowed, limit, max(0, math.floor(limit - used)),
+                    period - elapsed if allowed else retry_after, retry_after, period)
+
+
+def bucket_decision(allowed, limit, period, tokens):
+    rate = limit / period
+    return Decision(allowed, limit, math.floor(tokens), (limit - tokens) / rate,
+                    0 if allowed else (1 - tokens) / rate, period)
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+class LocalBackend:
+    """Per process state: key -> (window, previous, current) or (tokens, updated)."""
+
+    def __init__(self, max_keys):
+        self.lock = threading.Lock()
+        self.state = {}
+        self.max_keys = max_keys
+
+    def _store(self, key, value):
+        if len(self.state) >= self.max_keys and key not in self.state:
+            self.state.clear()  # rare: forgetting everyone lets them all in, never locks anyone out
+        self.state[key] = value
+
+    def sliding(self, key, limit, period, now):
+        window = int(now // period)
+        elapsed = now - window * period
+        with self.lock:
+            state = self.state.get(key)
+            if state is None or state[0] < window - 1:
+                previous, current = 0, 0
+            elif state[0] == window - 1:
+                previous, current = state[2], 0
+            else:
+                previous, current = state[1], state[2]
+            allowed = previous * (period - elapsed) / period + current + 1 <= limit
+            if allowed:
+                current += 1
+            self._store(key, (window, previous, current))
+        return sliding_decision(allowed, limit, period, previous, current, elapsed)
+
+    def bucket(self, key, limit, period, now):
+        with self.lock:
+            tokens, updated = self.state.get(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * limit / period)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._store(key, (tokens, now))
+        return bucket_decision(allowed, limit, period, tokens)
+
+    def reset(self):
+        with self.lock:
+            self.state.clear()
+
+
+class CacheBackend:
+    """State in the Django cache, shared by all processes; see the module docstring."""
+
+    prefix = 'ratelimit'
+
+    def __init__(self, alias, max_keys):
+        self.alias = alias
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.previous = {}  # 'key:window' -> count of a window that is over
+        self.blocked = {}   # key -> (until, Decision)
+
+    @property
+    def cache(self):
+        return caches[self.alias]  # cache connections are per thread
+
+    def _remember(self, mapping, key, value):
+        with self.lock:
+            if len(mapping) >= self.max_keys:
+                mapping.clear()
+            mapping[key] = value
+
+    def check_blocked(self, key, now):
+        entry = self.blocked.get(key)
+        if entry is None:
+            return None
+        until, decision = entry
+        if now >= until:
+            self.blocked.pop(key, None)
+            return None
+        return decision._replace(retry_after=until - now, reset=until - now)
+
+    def sliding(self, key, limit, period, now):
+        blocked = self.check_blocked(key, now)
+        if blocked is not None:
+            return blocked
+        window = int(now // period)
+        elapsed = now - window * period
+        current_key = f'{self.prefix}:{key}:{window}'
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            self.cache.add(current_key, 0, timeout=2 * period + 1)
+            current = self.cache.incr(current_key)
+        previous_key = f'{self.prefix}:{key}:{window - 1}'
+        previous = self.previous.get(previous_key)
+        if previous is None:
+            previous = self.cache.get(previous_key, 0)
+            self._remember(self.previous, previous_key, previous)
+        allowed = previous * (period - elapsed) / period + current <= limit
+        if not allowed:
+            current = self.cache.decr(current_key)  # denied requests don't use up the quota
+        decision = sliding_decision(allowed, limit, period, previous, current, elapsed)
+        if not allowed:
+            self._remember(self.blocked, key, (now + decision.retry_after, decision))
+        return decision
+
+    def bucket(self, key, limit, period, now):
+        blocked = self.check_blocked(key, now)
+        if blocked is not None:
+            return blocked
+        cache_key = f'{self.prefix}:{key}:bucket'
+        tokens, updated = self.cache.get(cache_key, (limit, now))
+        tokens = min(limit, tokens + (now - updated) * limit / period)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.cache.set(cache_key, (tokens, now), timeout=period + 1)
+        decision = bucket_decision(allowed, limit, period, tokens)
+        if not allowed:
+            self._remember(self.blocked, key, (now + decision.retry_after, decision))
+        return decision
+
+    def reset(self):
+        with self.lock:
+            self.previous.clear()
+            self.blocked.clear()
+
+
+_backend = {'config': None, 'backend': None}
+_backend_lock = threading.Lock()
+
+
+def get_backend(config=None):
+    config = config or throttling_settings()
+    if _backend['config'] != config:
+        with _backend_lock:
+            if _backend['config'] != config:
+                if config['BACKEND'] == 'cache':
+                    _backend['backend'] = CacheBackend(config['ALIAS'], config['MAX_KEYS'])
+                else:
+                    _backend['backend'] = LocalBackend(config['MAX_KEYS'])
+                _backend['config'] = config
+    return _backend['backend']
+
+
+def reset_throttles():
+    """Forget all local state (tests); shared counters live until their TTL."""
+    if _backend['backend'] is not None:
+        _backend['backend'].reset()
+
+
+# -----------------------------
+# DRF throttle
+# -----------------------------
+class RateLimitThrottle(BaseThrottle):
+    """
+    ScopedRateThrottle replacement: limits views that set `throttle_scope` to
+    THROTTLING['RATES'][scope] (or DRF's DEFAULT_THROTTLE_RATES), per user, or per IP
+    address for anonymous requests. Views without a scope or rate are not limited.
+    """
+    decision = None
+
+    def get_rate(self, view, config):
+        scope = getattr(view, 'throttle_scope', None)
+        if not scope:
+            return None, None
+        rate = config['RATES'].get(scope) or api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        return scope, rate
+
+    def allow_request(self, request, view):
+        config = throttling_settings()
+        scope, rate = self.get_rate(view, config)
+        if rate is None:
+            return True
+        limit, period = parse_rate(rate)
+        user = request.user
+        ident = f'u{user.pk}' if user and user.is_authenticated else f'a{self.get_ident(request)}'
+        backend = get_backend(config)
+        check = backend.bucket if config['ALGORITHMS'].get(scope, config['ALGORITHM']) == 'bucket' else backend.sliding
+        self.decision = check(f'{scope}:{ident}', limit, period, time.time())
+        request._request.ratelimit = self.decision  # RateLimitHeadersMiddleware
+        return self.decision.allowed
+
+    async def aallow_request(self, request, view):
+        """Async views (app/core/asyncviews.py): the local backend needs no thread."""
+        if throttling_settings()['BACKEND'] == 'local':
+            return self.allow_request(request, view)
+        return await sync_to_async(self.allow_request)(request, view)
+
+    def wait(self):
+        return self.decision.retry_after if self.decision is not None else None
+
+
+# -----------------------------
+# Headers
+# -----------------------------
+def add_ratelimit_headers(request, response):
+    decision = getattr(request, 'ratelimit', None)
+    if decision is not None:
+        response['RateLimit-Limit'] = str(decision.limit)
+        response['RateLimit-Remaining'] = str(decision.remaining)
+        response['RateLimit-Reset'] = str(math.ceil(decision.reset))
+        response['RateLimit-Policy'] = f'{decision.limit};w={decision.period}'
+        if not decision.allowed:
+            response['Retry-After'] = str(math.ceil(decision.retry_after))
+    return response
+
+
+class RateLimitHeadersMiddleware:
+    """RateLimit-* headers for the requests RateLimitThrottle looked at (sync and async)."""
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return add_ratelimit_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return add_ratelimit_headers(request, await self.get_response(request))
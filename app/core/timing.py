@@ -0,0 +1,68 @@
+'''
+
+Phase timing of the sampled request (app/core/metrics.py). Kept apart from the middleware
+and the view so that authentication classes and view mixins can import `timed` without
+importing DRF's views.
+
+'''
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.db.backends.signals import connection_created
+
+
+class RequestRecord:
+    __slots__ = ('start', 'queries', 'sql_time', 'phases', 'open')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.phases = {}
+        self.open = set()  # phases being timed: nested blocks of the same phase count once
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+# RequestRecord of the sampled request being handled, None otherwise
+request_record = contextvars.ContextVar('request_metrics', default=None)
+
+
+def sql_recorder(execute, sql, params, many, context):
+    record = request_record.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.queries += 1
+        record.sql_time += time.perf_counter() - start
+
+
+def install_sql_recorder(connection, **kwargs):
+    if sql_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, sql_recorder)
+
+
+# connections of new threads / reconnects; the ones already open get it from the middleware
+connection_created.connect(install_sql_recorder, dispatch_uid='app.core.metrics.sql_recorder')
+
+
+@contextmanager
+def timed(phase):
+    """Add the time of the block, minus its SQL, to `phase` of the sampled request."""
+    record = request_record.get()
+    if record is None or phase in record.open:
+        yield
+        return
+    record.open.add(phase)
+    start, sql_before = time.perf_counter(), record.sql_time
+    try:
+        yield
+    finally:
+        record.open.discard(phase)
+        record.add_phase(phase, time.perf_counter() - start - (record.sql_time - sql_before))
@@ -0,0 +1,69 @@
+from django.contrib import admin
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.html import format_html
+
+from app.core.admin import ScalableAdminMixin
+from .models import Job
+
+# -----------------------------
+# Job Admin
+# -----------------------------
+@admin.register(Job)
+class JobAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'description', 'status', 'progress_bar', 'processed', 'total', 'attempts',
+                    'created_by', 'created_at', 'finished_at')
+    list_display_links = ('id', 'description')
+    list_filter = ('status', 'created_at')
+    list_select_related = ('created_by',)
+    search_fields = ('description', 'task')
+    ordering = ('-id',)
+
+    # everything is written by the runner
+    fieldsets = (
+        ('Job', {'fields': ('description', 'task', 'model', 'status', 'progress_bar', 'cancel_requested')}),
+        ('Progress', {'fields': ('total', 'processed', 'affected', 'last_pk', 'chunk_size')}),
+        ('Attempts', {'fields': ('attempts', 'max_attempts', 'run_after', 'error')}),
+        ('Meta', {'fields': ('worker', 'created_by', 'created_at', 'started_at', 'heartbeat_at', 'finished_at')}),
+    )
+    readonly_fields = [field for section in fieldsets for field in section[1]['fields']]
+
+    actions = ['cancel_jobs', 'retry_jobs']
+
+    def get_queryset(self, request):
+        # the selected primary keys can be a long list and are never shown
+        return super().get_queryset(request).defer('pks')
+
+    @admin.display(description='Progress')
+    def progress_bar(self, obj):
+        return format_html(
+            '<progress value="{}" max="100" title="{}%"></progress> {}%', obj.progress, obj.progress, obj.progress,
+        )
+
+    # -----------------------------
+    # Actions
+    # -----------------------------
+    @admin.action(description="Cancel selected jobs")
+    def cancel_jobs(self, request, queryset):
+        # pending jobs stop right away, running ones after their current chunk
+        cancelled = queryset.filter(status=Job.PENDING).update(status=Job.CANCELLED, finished_at=timezone.now())
+        stopping = queryset.filter(status=Job.RUNNING).update(cancel_requested=True)
+        self.message_user(request, f"{cancelled} job(s) cancelled, {stopping} running job(s) will stop.")
+
+    @admin.action(description="Retry selected jobs")
+    def retry_jobs(self, request, queryset):
+        # resumes after the last chunk done
+        retried = queryset.filter(Q(status=Job.FAILED) | Q(status=Job.CANCELLED)).update(
+            status=Job.PENDING, attempts=0, error='', cancel_requested=False,
+            run_after=timezone.now(), finished_at=None, worker='',
+        )
+        self.message_user(request, f"{retried} job(s) queued again.")
+
+    # -----------------------------
+    # Jobs are created by actions, never by hand
+    # -----------------------------
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return obj is None  # list + actions, the change page is read-only
@@ -0,0 +1,50 @@
+'''
+
+Background job worker (app/jobs/runner.py), no broker needed: polls the jobs table.
+
+    python manage.py run_jobs               # run forever, poll every JOBS['POLL_INTERVAL'] s
+    python manage.py run_jobs --once        # run the due jobs and exit (cron)
+
+Run as many workers as you like: jobs are claimed with a conditional UPDATE. SIGTERM /
+SIGINT stop the worker after the current chunk; its job goes back to the queue and
+resumes where it stopped.
+
+'''
+
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.jobs.runner import jobs_settings, run_pending, worker_name
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (admin bulk actions, maintenance tasks)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the jobs due now and exit")
+        parser.add_argument('--sleep', type=float, help="Seconds between polls (default JOBS['POLL_INTERVAL'])")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        sleep = options['sleep'] if options['sleep'] is not None else jobs_settings()['POLL_INTERVAL']
+        worker = worker_name()
+        self.stdout.write(f"Worker {worker} started")
+
+        while not self.stopping:
+            close_old_connections()
+            for job in run_pending(worker, should_stop=lambda: self.stopping):
+                self.stdout.write(
+                    f"job #{job.pk} {job.description or job.task}: {job.status}, {job.processed}/{job.total} rows"
+                )
+            if options['once']:
+                break
+            time.sleep(sleep)
+
+    def stop(self, signum, frame):
+        self.stdout.write("Stopping after the current chunk...")
+        self.stopping = True
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:02
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_unfinished(apps, schema_editor):
+    # their selection was a pickled query, which is not carried over: re-run the action
+    Job = apps.get_model('jobs', 'Job')
+    Job.objects.filter(status__in=['pending', 'running']).update(
+        status='failed', error='Queued before jobs stored primary keys; run the action again.',
+        finished_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='pks',
+            field=models.JSONField(default=list, encoder=DjangoJSONEncoder),
+        ),
+        migrations.RunPython(fail_unfinished, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='job',
+            name='query',
+        ),
+    ]
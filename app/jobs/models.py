@@ -0,0 +1,69 @@
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+# Create your models here.
+
+class Job(models.Model):
+    """
+    A background job: run a registered task (runner.py) over the rows of a queryset, a
+    chunk of primary keys at a time. The queryset is stored as the primary keys it selected,
+    the progress as the number of keys done, so a retried or interrupted job resumes where
+    it stopped.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    task = models.CharField(max_length=200)  # name in the runner's registry
+    description = models.CharField(max_length=255, blank=True)
+    model = models.CharField(max_length=100)  # app_label.modelname of the queryset
+    pks = models.JSONField(default=list, encoder=DjangoJSONEncoder)  # selected primary keys, in order
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    cancel_requested = models.BooleanField(default=False)
+
+    chunk_size = models.PositiveIntegerField(default=500)
+    total = models.PositiveIntegerField(default=0)  # rows selected when the job was queued
+    processed = models.PositiveIntegerField(default=0)  # rows handed to the task so far
+    affected = models.PositiveIntegerField(default=0)  # rows the task reported as changed
+    last_pk = models.JSONField(null=True, blank=True)  # last primary key done
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    error = models.TextField(blank=True)
+
+    worker = models.CharField(max_length=100, blank=True)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(default=timezone.now)  # retries are delayed
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # updated after every chunk
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'jobs'
+        ordering = ['-id']
+        indexes = [
+            # the worker's poll: WHERE status = 'pending' AND run_after <= now ORDER BY run_after, id
+            models.Index(fields=['status', 'run_after', 'id'], name='job_status_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'#{self.pk} {self.description or self.task}'
+
+    @property
+    def progress(self):
+        """Percentage of the selected rows processed (100 for an empty selection)."""
+        if self.status == self.DONE or not self.total:
+            return 100 if self.status == self.DONE else 0
+        return min(100, round(self.processed * 100 / self.total))
@@ -0,0 +1,245 @@
+'''
+
+Database-backed job runner: no broker, the `jobs` table is the queue and
+`manage.py run_jobs` is the worker.
+
+    @task('comments.reconcile')
+    def reconcile(queryset):                     # called once per chunk of primary keys
+        return len(counters.reconcile(list(queryset.values_list('pk', flat=True))))
+
+    enqueue('comments.reconcile', Post.objects.all(), user=request.user)
+
+The selection is frozen when the job is queued: the job stores the queryset's primary
+keys (JSON, never a pickled query the worker would have to trust) and walks them in order,
+`chunk_size` keys at a time, each chunk re-read through the model's default manager. Each
+chunk runs in its own transaction together with the job's progress update (processed,
+last_pk), so the row locks are held for one chunk only and a job that is retried, or whose
+worker died, resumes after the last chunk that committed.
+
+    cancel      Job.cancel_requested, checked between chunks
+    retry       a failing chunk is retried up to MAX_ATTEMPTS times in all, after RETRY_DELAY,
+                2 * RETRY_DELAY, ... seconds, then the job is failed (the admin "Retry"
+                action re-queues it)
+    stale       a running job without a heartbeat for STALE_AFTER seconds is re-queued
+
+Admin actions opt in with @job_action (below): small selections still run in the request,
+bigger ones are queued and the admin links to the job's progress page.
+
+'''
+
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+from functools import wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}  # name -> callable(queryset) -> number of rows changed (or None)
+
+
+def jobs_settings():
+    defaults = {
+        'CHUNK_SIZE': 500,
+        'INLINE_MAX_ROWS': 500,
+        'MAX_ATTEMPTS': 3,
+        'RETRY_DELAY': 10,
+        'POLL_INTERVAL': 2,
+        'STALE_AFTER': 300,
+    }
+    return {**defaults, **getattr(settings, 'JOBS', {})}
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+def task(name):
+    """Register `func(queryset)` as the task `name`."""
+    def decorator(func):
+        _tasks[name] = func
+        return func
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _tasks[name]
+    except KeyError:
+        raise LookupError(f'Unknown job task {name!r} (not imported by the worker?)')
+
+
+def enqueue(task_name, queryset, user=None, description='', chunk_size=None):
+    """Queue `task_name` over the rows of `queryset` (their primary keys); returns the Job."""
+    get_task(task_name)
+    config = jobs_settings()
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    return Job.objects.create(
+        task=task_name,
+        description=description[:255],
+        model=queryset.model._meta.label_lower,
+        pks=pks,
+        chunk_size=chunk_size or config['CHUNK_SIZE'],
+        total=len(pks),
+        max_attempts=config['MAX_ATTEMPTS'],
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def job_model(job):
+    return apps.get_model(job.model)
+
+
+# -----------------------------
+# Worker side
+# -----------------------------
+def requeue_stale():
+    """Running jobs whose worker stopped sending heartbeats go back to the queue."""
+    limit = timezone.now() - timedelta(seconds=jobs_settings()['STALE_AFTER'])
+    return Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=limit).update(status=Job.PENDING, worker='')
+
+
+def claim(worker, exclude=()):
+    """Take the next due job (conditional UPDATE: two workers never get the same one)."""
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.PENDING, run_after__lte=now).exclude(pk__in=exclude).order_by('run_after', 'id')
+    for pk in due.values_list('pk', flat=True)[:10]:
+        claimed = Job.objects.filter(pk=pk, status=Job.PENDING).update(
+            status=Job.RUNNING, worker=worker, heartbeat_at=now, started_at=Coalesce(F('started_at'), now),
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def _next_chunk(job):
+    # processed and last_pk commit together: the keys after the last chunk done
+    return job.pks[job.processed:job.processed + job.chunk_size]
+
+
+def run_job(job, should_stop=lambda: False):
+    """Run a claimed job chunk by chunk until it is done, cancelled, failing or told to stop."""
+    try:
+        func = get_task(job.task)
+        model = job_model(job)
+    except Exception:  # unknown task or model
+        return _failed(job, traceback.format_exc())
+    while True:
+        if Job.objects.filter(pk=job.pk, cancel_requested=True).exists():
+            return _finish(job, Job.CANCELLED)
+        if should_stop():
+            # worker shutting down: hand the job back, it resumes after last_pk
+            Job.objects.filter(pk=job.pk).update(status=Job.PENDING, worker='')
+            job.status = Job.PENDING
+            return job
+        try:
+            with transaction.atomic():
+                pks = _next_chunk(job)
+                if not pks:
+                    break
+                affected = func(model._default_manager.filter(pk__in=pks))
+                job.processed += len(pks)
+                job.affected += affected or 0
+                job.last_pk = pks[-1]
+                job.heartbeat_at = timezone.now()
+                job.save(update_fields=['processed', 'affected', 'last_pk', 'heartbeat_at'])
+        except Exception:
+            return _failed(job, traceback.format_exc())
+    return _finish(job, Job.DONE)
+
+
+def _finish(job, status):
+    job.status, job.finished_at = status, timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return job
+
+
+def _failed(job, error):
+    # progress of the failed chunk was rolled back with it: a retry redoes that chunk
+    job.refresh_from_db(fields=['processed', 'affected', 'last_pk'])
+    job.attempts += 1
+    job.error = error
+    if job.attempts < job.max_attempts:
+        delay = jobs_settings()['RETRY_DELAY'] * 2 ** (job.attempts - 1)
+        job.status, job.run_after, job.worker = Job.PENDING, timezone.now() + timedelta(seconds=delay), ''
+        logger.warning("Job %s failed (attempt %d), retrying in %ss", job.pk, job.attempts, delay)
+    else:
+        job.status, job.finished_at = Job.FAILED, timezone.now()
+        logger.error("Job %s failed after %d attempts", job.pk, job.attempts)
+    job.save(update_fields=['attempts', 'error', 'status', 'run_after', 'worker', 'finished_at'])
+    return job
+
+
+def run_pending(worker=None, should_stop=lambda: False, max_jobs=None):
+    """
+    Run due jobs until none is left (or `max_jobs` ran); returns the jobs run. A job runs
+    at most once per call: a failed one is retried by the next call, after its delay.
+    """
+    worker = worker or worker_name()
+    done = []
+    requeue_stale()
+    while max_jobs is None or len(done) < max_jobs:
+        if should_stop():
+            break
+        job = claim(worker, exclude=[job.pk for job in done])
+        if job is None:
+            break
+        done.append(run_job(job, should_stop))
+    return done
+
+
+# -----------------------------
+# Admin actions
+# -----------------------------
+def job_action(chunk_size=None):
+    """
+    Run an admin action as a background job once the selection is bigger than
+    JOBS['INLINE_MAX_ROWS']. The action body is then called once per chunk, as
+    `action(model_admin, None, queryset_of_the_chunk)` - no request in the worker - and
+    returns the number of rows it changed:
+
+        @admin.action(description="Mark selected posts as published")
+        @job_action()
+        def make_published(self, request, queryset):
+            return queryset.update(is_published=True)
+    """
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+
+        @task(name)
+        def run_chunk(queryset):
+            return func(admin.site._registry[queryset.model], None, queryset)
+
+        @wraps(func)
+        def action(model_admin, request, queryset):
+            description = str(getattr(action, 'short_description', func.__name__.replace('_', ' ')))
+            total = queryset.count()
+            if total <= jobs_settings()['INLINE_MAX_ROWS']:
+                affected = func(model_admin, request, queryset)
+                model_admin.message_user(request, f'{description}: {affected or 0} of {total} row(s) changed.')
+                return
+            job = enqueue(name, queryset, user=request.user, description=description, chunk_size=chunk_size)
+            url = reverse('admin:jobs_job_change', args=[job.pk])
+            model_admin.message_user(request, format_html(
+                '{}: {} rows queued as <a href="{}">job #{}</a>.', description, job.total, url, job.pk,
+            ))
+
+        action.job_task = name
+        return action
+    return decorator
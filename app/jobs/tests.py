@@ -0,0 +1,162 @@
+import pytest
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from app.jobs.models import Job
+from app.jobs import runner
+from app.posts.models import Post
+from app.users.models import userProfile
+
+# test tasks (the registry is process wide)
+calls = []
+
+@runner.task('tests.record')
+def record(queryset):
+    calls.append(sorted(queryset.values_list('pk', flat=True)))
+    return queryset.count()
+
+@runner.task('tests.flaky')
+def flaky(queryset):
+    calls.append('attempt')
+    if len(calls) == 1:
+        raise RuntimeError('boom')
+    return 0
+
+@runner.task('tests.broken')
+def broken(queryset):
+    raise RuntimeError('always')
+
+
+@pytest.fixture(autouse=True)
+def job_settings(settings):
+    calls.clear()
+    settings.JOBS = {'CHUNK_SIZE': 2, 'INLINE_MAX_ROWS': 0, 'RETRY_DELAY': 0, 'MAX_ATTEMPTS': 3}
+    return settings.JOBS
+
+@pytest.fixture
+def posts(db, user1):
+    return Post.objects.bulk_create(Post(title=f'P{i}', body='B', user=user1) for i in range(5))
+
+
+# ---------------
+# Testcase
+# ---------------
+@pytest.mark.django_db
+class TestJobRunner:
+    def test_chunks_and_progress(self, posts):
+        job = runner.enqueue('tests.record', Post.objects.filter(title__in=['P0', 'P1', 'P2', 'P4']))
+        assert (job.status, job.total, job.progress) == (Job.PENDING, 4, 0)
+        [job] = runner.run_pending()
+        assert calls == [[posts[0].pk, posts[1].pk], [posts[2].pk, posts[4].pk]]
+        assert (job.status, job.processed, job.affected, job.progress) == (Job.DONE, 4, 4, 100)
+        assert job.last_pk == posts[4].pk
+
+    def test_selection_is_frozen_as_primary_keys(self, posts, user1):
+        job = runner.enqueue('tests.record', Post.objects.filter(title__startswith='P'))
+        assert Job.objects.get().pks == [p.pk for p in posts]
+        Post.objects.create(title='P5', body='B', user=user1)  # added after queueing: not part of the job
+        posts[0].delete()  # gone: skipped
+        [job] = runner.run_pending()
+        assert calls == [[posts[1].pk], [posts[2].pk, posts[3].pk], [posts[4].pk]]
+        assert (job.status, job.processed, job.affected) == (Job.DONE, 5, 4)
+
+    def test_one_transaction_per_chunk(self, posts):
+        runner.enqueue('tests.record', Post.objects.all())
+        with CaptureQueriesContext(connection) as ctx:
+            runner.run_pending()
+        savepoints = [q for q in ctx.captured_queries if q['sql'].startswith('SAVEPOINT')]
+        assert len(savepoints) == 4  # 3 chunks + the empty one that ends the job
+
+    def test_cancel_between_chunks(self, posts):
+        job = runner.enqueue('tests.record', Post.objects.all())
+        claimed = runner.claim('test')
+        stop_after_first = iter([False, True])
+        Job.objects.filter(pk=job.pk).update(cancel_requested=True)
+        job = runner.run_job(claimed, should_stop=lambda: next(stop_after_first))
+        assert job.status == Job.CANCELLED and job.processed == 0
+
+    def test_worker_stop_hands_the_job_back(self, posts):
+        runner.enqueue('tests.record', Post.objects.all())
+        [job] = runner.run_pending(should_stop=lambda: bool(calls))  # stop after the first chunk
+        assert (job.status, job.processed) == (Job.PENDING, 2)
+        [job] = runner.run_pending()  # resumes after last_pk
+        assert (job.status, job.processed) == (Job.DONE, 5)
+        assert calls[-2:] == [[posts[2].pk, posts[3].pk], [posts[4].pk]]
+
+    def test_retry_then_success(self, posts):
+        job = runner.enqueue('tests.flaky', Post.objects.all())
+        [job] = runner.run_pending(max_jobs=1)
+        assert (job.status, job.attempts) == (Job.PENDING, 1)
+        assert 'boom' in job.error
+        [job] = runner.run_pending()
+        assert (job.status, job.processed) == (Job.DONE, 5)
+
+    def test_retry_is_delayed(self, posts, job_settings):
+        job_settings['RETRY_DELAY'] = 60
+        runner.enqueue('tests.flaky', Post.objects.all())
+        runner.run_pending()
+        assert runner.run_pending() == []
+
+    def test_fails_after_max_attempts(self, posts):
+        runner.enqueue('tests.broken', Post.objects.all())
+        runner.run_pending(), runner.run_pending()
+        [job] = runner.run_pending()
+        assert (job.status, job.attempts) == (Job.FAILED, 3)
+        assert job.finished_at is not None
+
+    def test_stale_job_requeued(self, posts):
+        job = runner.enqueue('tests.record', Post.objects.all())
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, heartbeat_at=timezone.now() - timedelta(hours=1))
+        [job] = runner.run_pending()
+        assert job.status == Job.DONE
+
+    def test_run_jobs_command(self, posts, monkeypatch):
+        # the worker closes stale connections every poll: not the test's, it runs in a transaction
+        monkeypatch.setattr('app.jobs.management.commands.run_jobs.close_old_connections', lambda: None)
+        runner.enqueue('tests.record', Post.objects.all(), description='Record')
+        out = StringIO()
+        call_command('run_jobs', once=True, stdout=out)
+        assert 'Record: done, 5/5 rows' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestJobAdmin:
+    def test_big_selection_queued(self, admin_client, posts, job_settings):
+        resp = admin_client.post('/admin/posts/post/', {
+            'action': 'make_published', '_selected_action': [p.pk for p in posts],
+        }, follow=True)
+        job = Job.objects.get()
+        assert f'/admin/jobs/job/{job.pk}/change/' in resp.content.decode()
+        assert (job.total, job.description, job.created_by.username) == (5, 'Mark selected posts as published', 'admin')
+        assert not Post.objects.filter(is_published=True).exists()
+        runner.run_pending()
+        assert Post.objects.filter(is_published=True).count() == 5
+
+    def test_small_selection_runs_inline(self, admin_client, posts, job_settings):
+        job_settings['INLINE_MAX_ROWS'] = 10
+        admin_client.post('/admin/posts/post/', {'action': 'make_published', '_selected_action': [posts[0].pk]})
+        assert not Job.objects.exists()
+        assert Post.objects.filter(is_published=True).count() == 1
+
+    def test_profile_levels(self, admin_client, user1, user2):
+        profiles = [userProfile.objects.create(user=u, level=0) for u in (user1, user2)]
+        admin_client.post('/admin/users/userprofile/', {
+            'action': 'set_level_2', '_selected_action': [p.pk for p in profiles],
+        })
+        runner.run_pending()
+        assert set(userProfile.objects.values_list('level', flat=True)) == {2}
+
+    def test_status_pages_cancel_and_retry(self, admin_client, posts):
+        job = runner.enqueue('tests.broken', Post.objects.all(), description='Broken')
+        assert admin_client.get('/admin/jobs/job/').status_code == 200
+        admin_client.post('/admin/jobs/job/', {'action': 'cancel_jobs', '_selected_action': [job.pk]})
+        job.refresh_from_db()
+        assert job.status == Job.CANCELLED
+        admin_client.post('/admin/jobs/job/', {'action': 'retry_jobs', '_selected_action': [job.pk]})
+        job.refresh_from_db()
+        assert job.status == Job.PENDING
+        resp = admin_client.get(f'/admin/jobs/job/{job.pk}/change/')
+        assert resp.status_code == 200 and '<progress value="0"' in resp.content.decode()
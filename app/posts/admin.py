@@ -1,6 +1,11 @@
 from django.contrib import admin
+from django.db.models import Q
 from .models import Post
+from .search import get_search_backend
+from .cache import post_cache
 from app.comments.models import Comment
+from app.core.admin import CappedInlineFormSet, ScalableAdminMixin, owner_filter
+from app.jobs.runner import job_action
 
 # -----------------------------
 # Inline example (if Post had comments, tasks, etc.)
@@ -11,18 +16,27 @@ class CommentInline(admin.TabularInline):
     readonly_fields = ['created_at', 'updated_at']
     fields = ('author', 'content', 'created_at', 'updated_at')
     show_change_link = True
+    # only the newest comments (ADMIN_SCALE['INLINE_MAX']), the rest on the comment changelist
+    formset = CappedInlineFormSet
+    verbose_name_plural = 'Latest comments'
+    # a <select> of every user in every row otherwise
+    autocomplete_fields = ('author',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author')
 
 # -----------------------------
 # Post Admin
 # -----------------------------
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableAdminMixin, admin.ModelAdmin):
     # Fields to display in the list view
     list_display = (
         'id', 
         'title', 
         'user', 
         'is_published', 
+        'comment_count',
         'created_at', 
         'updated_at'
     )
@@ -30,17 +44,21 @@ class PostAdmin(admin.ModelAdmin):
     # Make some fields clickable to go to change form
     list_display_links = ('id', 'title')
 
-    # Filters on right sidebar
-    list_filter = ('is_published', 'created_at', 'user')
+    # User column without one query per row
+    list_select_related = ('user',)
+
+    # Filters on right sidebar (owner_filter: not one entry per user)
+    list_filter = ('is_published', 'created_at', owner_filter('user'))
     
     # Add search capability for quick lookup
+    # (title/body go through the full-text index, see get_search_results below)
     search_fields = ('title', 'body', 'user__username')
     
     # Fields that are read-only in admin form
-    readonly_fields = ('id', 'user', 'created_at', 'updated_at')
+    readonly_fields = ('id', 'user', 'created_at', 'updated_at', 'comment_count', 'last_comment_at')
     
     # Fields shown in the edit/add form
-    fields = ('title', 'body', 'user', 'is_published', 'created_at', 'updated_at')
+    fields = ('title', 'body', 'user', 'is_published', 'created_at', 'updated_at', 'comment_count', 'last_comment_at')
     
     # Inline related objects
     inlines = [CommentInline]
@@ -54,15 +72,35 @@ class PostAdmin(admin.ModelAdmin):
     # -----------------------------
     # Modern style actions
     # -----------------------------
+    actions = ['make_published', 'make_unpublished']
+
+    # big selections run as background jobs, in chunks (app/jobs/runner.py)
     @admin.action(description="Mark selected posts as published")
+    @job_action()
     def make_published(self, request, queryset):
+        pks = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_published=True)
-        self.message_user(request, f"{updated} post(s) marked as published.")
+        post_cache.invalidate(pks)  # update() sends no post_save signal
+        return updated
 
     @admin.action(description="Mark selected posts as unpublished")
+    @job_action()
     def make_unpublished(self, request, queryset):
+        pks = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(is_published=False)
-        self.message_user(request, f"{updated} post(s) marked as unpublished.")
+        post_cache.invalidate(pks)  # update() sends no post_save signal
+        return updated
+
+    # -----------------------------
+    # Full-text search instead of ILIKE '%term%'
+    # -----------------------------
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        matches = get_search_backend(queryset.db).filter(Post.objects.all(), search_term).values('pk')
+        queryset = queryset.filter(Q(pk__in=matches) | Q(user__username__iexact=search_term))
+        return queryset, False
 
     # -----------------------------
     # Auto-set user on save
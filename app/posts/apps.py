@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app.posts'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (registers receivers)
+        from .search import install_sqlite_fts
+        post_migrate.connect(install_sqlite_fts, sender=self)
@@ -0,0 +1,143 @@
+'''
+
+Batch writes for PostViewSet (/api/posts/bulk/, /api/posts/bulk-publish/).
+
+One request carries many posts: every item is validated with PostCreateUpdateSerializer in a
+single pass, the valid ones are written with bulk_create()/bulk_update() in chunks of
+BATCH_SIZE inside one transaction, and the response reports the outcome of every item:
+
+    {"results": [{"index": 0, "status": 201, "data": {...}},
+                 {"index": 1, "status": 400, "errors": {"title": ["This field is required."]}}]}
+
+bulk_create()/bulk_update()/update() send no model signals, so the response cache is
+invalidated here explicitly.
+
+'''
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .cache import post_cache
+from .models import Post
+from .serializers import PostCreateUpdateSerializer, PostSerializer
+
+
+def bulk_settings():
+    defaults = {'BATCH_SIZE': 500, 'MAX_ITEMS': 5000}
+    return {**defaults, **getattr(settings, 'POSTS_BULK', {})}
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _validate(items, partial=False):
+    """
+    Validate every item, return ({index: validated_data}, {index: errors}).
+    One serializer instance is reused for all items instead of building one per item.
+    """
+    validator = PostCreateUpdateSerializer(partial=partial)
+    valid, errors = {}, {}
+    for index, item in enumerate(items):
+        try:
+            valid[index] = validator.run_validation(item)
+        except serializers.ValidationError as exc:
+            errors[index] = exc.detail
+    return valid, errors
+
+
+def _results(ok, errors):
+    results = [{'index': i, **entry} for i, entry in ok.items()]
+    results += [{'index': i, 'status': 400, 'errors': detail} for i, detail in errors.items()]
+    return sorted(results, key=lambda r: r['index'])
+
+
+def bulk_create_posts(user, items):
+    batch_size = bulk_settings()['BATCH_SIZE']
+    valid, errors = _validate(items)
+
+    posts = [Post(user=user, **data) for data in valid.values()]
+    with transaction.atomic():
+        for chunk in _chunks(posts, batch_size):
+            Post.objects.bulk_create(chunk)
+    post_cache.invalidate()
+
+    data = PostSerializer(posts, many=True).data
+    ok = {index: {'status': 201, 'data': row} for index, row in zip(valid, data)}
+    return _results(ok, errors)
+
+
+def bulk_update_posts(items, owned_queryset):
+    """
+    `owned_queryset` is already restricted to the posts request.user may change
+    (IsOwnerOrReadOnly.filter_queryset), so ownership costs one query for the whole batch.
+
+    The posts are read locked (SELECT ... FOR UPDATE, in pk order) in the transaction that
+    writes them, and every post is written with the fields its item changed only: posts
+    patched with the same fields share a bulk_update(). An id repeated in the batch is an
+    error on the later items.
+    """
+    batch_size = bulk_settings()['BATCH_SIZE']
+
+    ids, errors, seen = {}, {}, {}
+    for index, item in enumerate(items):
+        pk = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(pk, int):
+            errors[index] = {'id': ['A valid integer is required.']}
+        elif pk in seen:
+            errors[index] = {'id': [f'Duplicate of item {seen[pk]}.']}
+        else:
+            ids[index], seen[pk] = pk, index
+    valid, invalid = _validate([items[i] for i in ids], partial=True)
+    indexes = list(ids)
+    valid = {indexes[i]: data for i, data in valid.items()}
+    errors.update({indexes[i]: detail for i, detail in invalid.items()})
+
+    ok, changed, groups = {}, [], {}
+    with transaction.atomic():
+        posts = (owned_queryset.select_for_update(of=('self',)).select_related('user').order_by('pk')
+                 .in_bulk([ids[i] for i in valid]))
+        now = timezone.now()
+        for index, data in valid.items():
+            post = posts.get(ids[index])
+            if post is None:
+                # missing and not-yours look the same, like a 404 from get_object()
+                ok[index] = {'status': 404, 'errors': {'detail': 'Not found.'}}
+                continue
+            for field, value in data.items():
+                setattr(post, field, value)
+            post.updated_at = now  # auto_now is not applied by bulk_update()
+            changed.append((index, post))
+            groups.setdefault(tuple(sorted({'updated_at', *data})), []).append(post)
+        for fields, group in groups.items():
+            for chunk in _chunks(group, batch_size):
+                Post.objects.bulk_update(chunk, fields)
+    post_cache.invalidate([post.pk for _, post in changed])
+
+    data = PostSerializer([post for _, post in changed], many=True).data
+    ok.update({index: {'status': 200, 'data': row} for (index, _), row in zip(changed, data)})
+    return _results(ok, errors)
+
+
+def bulk_publish_posts(ids):
+    batch_size = bulk_settings()['BATCH_SIZE']
+    existing = dict(Post.objects.filter(pk__in=ids).values_list('pk', 'is_published'))
+    to_publish = {pk for pk, published in existing.items() if not published}
+
+    with transaction.atomic():
+        now = timezone.now()
+        for chunk in _chunks(sorted(to_publish), batch_size):
+            Post.objects.filter(pk__in=chunk).update(is_published=True, updated_at=now)
+    post_cache.invalidate(to_publish)
+
+    results = []
+    for index, pk in enumerate(ids):
+        if pk not in existing:
+            results.append({'index': index, 'id': pk, 'status': 404, 'errors': {'detail': 'Not found.'}})
+        else:
+            state = 'published' if pk in to_publish else 'already published'
+            results.append({'index': index, 'id': pk, 'status': 200, 'data': {'status': state}})
+    return results
@@ -0,0 +1,10 @@
+from app.core.cache import ResponseCache
+
+# Response cache of PostViewSet (see app/core/cache.py).
+# Anything that changes posts without Post.save()/delete() (queryset.update(),
+# bulk_create(), raw SQL) must call post_cache.invalidate(pks) itself.
+post_cache = ResponseCache('posts')
+
+# list group of the lists embedding comments (?with_comments=): comment changes invalidate
+# it, plain post lists don't show comments and aren't invalidated by them
+COMMENT_LISTS = 'comments'
@@ -0,0 +1,173 @@
+'''
+
+Load test of the read endpoints under ASGI: sync DRF views vs the native async views
+(app/core/asyncviews.py, ASYNC_READ_VIEWS).
+
+    python manage.py bench_async --requests 5000 --concurrency 200
+    python manage.py bench_async --path '/api/posts/?cursor=' --path /api/comments/ --auth
+
+The URLconf is fixed when Django starts, so every mode runs in its own child process
+(same command with --child sync|async and ASYNC_READ_VIEWS set accordingly). A child
+drives multiplex.asgi:application directly from asyncio, `concurrency` requests in flight
+at any time, no HTTP server or client library in between, and reports requests/sec and
+latency percentiles.
+
+The posts/comments are committed before the children start (they need to see them) and
+deleted again at the end. Run it against PostgreSQL: SQLite serializes every query and
+hides the difference.
+
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+
+from app.comments.models import Comment
+from app.posts.models import Post
+
+BENCH_USERNAME = 'bench-async'
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def request(app, path, headers):
+    """One GET through the ASGI application, returns the status code."""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost')] + headers,
+        'server': ('localhost', 80), 'client': ('127.0.0.1', 50000),
+    }
+    sent = False
+    status = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.Event().wait()  # no disconnect, Django cancels this when done
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def load(app, path, headers, total, concurrency):
+    latencies, statuses = [], Counter()
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            statuses[await request(app, path, headers)] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rps': total / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': latencies[-1] * 1000,
+        'statuses': dict(statuses),
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare requests/sec and tail latency of the sync and async read paths under ASGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--rows', type=int, default=500)
+        parser.add_argument('--path', action='append', dest='paths',
+                            help="Endpoint to load (repeatable), default /api/posts/ and /api/comments/")
+        parser.add_argument('--auth', action='store_true', help="Send a token (authenticated, uncached reads)")
+        parser.add_argument('--child', choices=['sync', 'async'], help=argparse.SUPPRESS)
+        parser.add_argument('--token', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/api/posts/', '/api/comments/']
+        if options['child']:
+            return self.child(paths, options)
+
+        user = self.seed(options['rows'])
+        try:
+            token = Token.objects.create(user=user).key if options['auth'] else ''
+            results = {mode: self.spawn(mode, paths, token, options) for mode in ('sync', 'async')}
+        finally:
+            user.delete()  # cascades to the posts, comments and token
+
+        self.stdout.write(f"{options['requests']} requests per endpoint, concurrency {options['concurrency']}")
+        self.stdout.write(f"{'endpoint':<28}{'mode':<7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}  status")
+        for path in paths:
+            for mode, by_path in results.items():
+                r = by_path[path]
+                self.stdout.write(
+                    f"{path:<28}{mode:<7}{r['rps']:>9.0f}{r['p50']:>9.1f}{r['p95']:>9.1f}"
+                    f"{r['p99']:>9.1f}{r['max']:>9.1f}  {r['statuses']}"
+                )
+
+    def seed(self, rows):
+        User = get_user_model()
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create_user(username=BENCH_USERNAME, password='x')
+        posts = Post.objects.bulk_create(
+            Post(title=f'Post {i}', body='Lorem ipsum dolor sit amet ' * 20, user=user, is_published=True)
+            for i in range(rows)
+        )
+        Comment.objects.bulk_create(
+            Comment(author=user, post=posts[i % len(posts)], content=f'Comment {i}') for i in range(rows)
+        )
+        return user
+
+    def spawn(self, mode, paths, token, options):
+        cmd = [sys.executable, sys.argv[0], 'bench_async', '--child', mode,
+               '--requests', str(options['requests']), '--concurrency', str(options['concurrency'])]
+        for path in paths:
+            cmd += ['--path', path]
+        if token:
+            cmd += ['--token', token]
+        if options['settings']:
+            cmd += ['--settings', options['settings']]
+        env = {**os.environ, 'ASYNC_READ_VIEWS': 'true' if mode == 'async' else 'false'}
+        output = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def child(self, paths, options):
+        from django.core.asgi import get_asgi_application
+
+        app = get_asgi_application()
+        headers = [(b'authorization', f"Token {options['token']}".encode())] if options['token'] else []
+
+        async def run():
+            results = {}
+            for path in paths:
+                await load(app, path, headers, min(100, options['requests']), options['concurrency'])  # warm up
+                results[path] = await load(app, path, headers, options['requests'], options['concurrency'])
+            return results
+
+        self.stdout.write(json.dumps(asyncio.run(run())))
@@ -0,0 +1,104 @@
+'''
+
+Benchmark against PostgreSQL: connection per request vs persistent connections vs the
+psycopg pool (app/core/dbpool.py).
+
+    python manage.py bench_db_pool --threads 16 --requests 200
+
+Each thread plays `--requests` requests the way Django handles them: the connection is
+checked / released at request start and end (close_if_unusable_or_obsolete), in between
+one small query on the posts table. Every mode runs on its own copy of
+DATABASES['default'], so the settings of the process don't matter. Reports requests/s,
+latency and how many server connections were opened. The pool mode needs psycopg[pool].
+
+'''
+
+import statistics
+import threading
+import time
+from importlib.util import find_spec
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from app.core.dbpool import pool_stats
+from app.posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Requests/s and connections opened: per-request vs persistent vs pooled connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=200, help="per thread")
+        parser.add_argument('--pool-size', type=int, default=8)
+
+    def handle(self, *args, **options):
+        base = connections['default'].settings_dict
+        if base['ENGINE'] != 'django.db.backends.postgresql':
+            raise CommandError("bench_db_pool needs DATABASES['default'] on PostgreSQL")
+        options_without_pool = {k: v for k, v in base['OPTIONS'].items() if k != 'pool'}
+        modes = [
+            ('per-request', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': options_without_pool}),
+            ('persistent', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True, 'OPTIONS': options_without_pool}),
+        ]
+        if find_spec('psycopg_pool'):
+            pool = {'min_size': 2, 'max_size': options['pool_size'], 'timeout': 30}
+            modes.append(('pool', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True,
+                                   'OPTIONS': {**options_without_pool, 'pool': pool}}))
+        else:
+            self.stdout.write("psycopg_pool not installed: skipping the pool mode")
+
+        self.stdout.write(f"{options['threads']} threads x {options['requests']} requests")
+        self.stdout.write(f"{'mode':<13}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'connections':>13}")
+        for name, overrides in modes:
+            alias = f'bench_{name}'
+            connections.settings[alias] = connections.configure_settings({alias: {**base, **overrides}})[alias]
+            try:
+                rate, latencies, opened = self.run(alias, options['threads'], options['requests'])
+                extra = ''
+                if name == 'pool':
+                    # connection_created fires on every checkout from the pool: use its own count
+                    stats = pool_stats()[alias]
+                    opened = stats['connections_opened']
+                    extra = f"  (pool size {stats['size']}, queued {stats['requests_queued']}, avg wait {stats['wait_ms_avg']} ms)"
+                    connections[alias].close_pool()
+            finally:
+                del connections.settings[alias]
+            p50 = statistics.median(latencies) * 1000
+            p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+            self.stdout.write(f'{name:<13}{rate:>9.0f}{p50:>9.2f}{p95:>9.2f}{opened:>13}{extra}')
+
+    def run(self, alias, threads, requests):
+        latencies, opened = [], []
+        sql = f'SELECT id, title FROM {Post._meta.db_table} ORDER BY id DESC LIMIT 10'
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == alias:
+                opened.append(1)
+
+        def worker():
+            connection = connections[alias]
+            for _ in range(requests):
+                start = time.perf_counter()
+                connection.close_if_unusable_or_obsolete()  # request_started
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+                    cursor.fetchall()
+                connection.close_if_unusable_or_obsolete()  # request_finished
+                latencies.append(time.perf_counter() - start)
+            connection.close()
+
+        connection_created.connect(count)
+        try:
+            workers = [threading.Thread(target=worker) for _ in range(threads)]
+            start = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            connection_created.disconnect(count)
+        return threads * requests / elapsed, latencies, len(opened)
@@ -0,0 +1,79 @@
+'''
+
+Micro-benchmark: regular serializer vs the .values() fast path (app/core/fastpath.py).
+
+    python manage.py bench_serializers --rows 1000 --repeat 20
+
+Seeds posts/comments inside a transaction that is rolled back at the end, so it can run
+against any database without leaving data behind.
+
+'''
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.comments.models import Comment
+from app.comments.serializers import CommentListSerializer
+from app.core.fastpath import serialize_rows
+from app.posts.models import Post
+from app.posts.serializers import PostSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare serializer throughput of the regular and the fast read path"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-sizes', default='10,100,1000')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, rows):
+        user = get_user_model().objects.create_user(username='bench-serializers', password='x')
+        posts = Post.objects.bulk_create(
+            Post(title=f'Post {i}', body='Lorem ipsum dolor sit amet ' * 20, user=user, is_published=bool(i % 2))
+            for i in range(rows)
+        )
+        Comment.objects.bulk_create(
+            Comment(author=user, post=posts[i % len(posts)], content=f'Comment {i}') for i in range(rows)
+        )
+
+    def timed(self, repeat, func):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def run(self, options):
+        self.seed(options['rows'])
+        page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        cases = [
+            ('posts', Post.objects.select_related('user'), PostSerializer),
+            ('comments', Comment.objects.all(), CommentListSerializer),
+        ]
+        self.stdout.write(f"{'endpoint':<10}{'page':>6}{'serializer ms':>15}{'fast ms':>10}{'rows/s fast':>14}{'speedup':>9}")
+        for name, queryset, serializer_class in cases:
+            for size in page_sizes:
+                page = queryset.order_by('-id')[:size]
+                slow = self.timed(options['repeat'], lambda: serializer_class(list(page), many=True).data)
+                fast = self.timed(options['repeat'], lambda: serialize_rows(page, serializer_class()))
+                self.stdout.write(
+                    f'{name:<10}{size:>6}{slow * 1000:>15.2f}{fast * 1000:>10.2f}'
+                    f'{size / fast:>14.0f}{slow / fast:>8.1f}x'
+                )
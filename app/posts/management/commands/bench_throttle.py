@@ -0,0 +1,72 @@
+'''
+
+Micro-benchmark: per-check cost of DRF's ScopedRateThrottle vs RateLimitThrottle
+(app/core/throttling.py), for one client whose history grows.
+
+    python manage.py bench_throttle --checks 5000
+
+The rate is high enough that no check is refused: the cost measured is the bookkeeping.
+DRF's throttle keeps one timestamp per request of the window, so its checks get slower as
+the client's history grows; the counters stay O(1). No database access.
+
+'''
+
+import time
+from types import SimpleNamespace
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import ScopedRateThrottle
+
+from app.core.throttling import RateLimitThrottle, reset_throttles
+
+RATE = '1000000/hour'
+
+
+class Command(BaseCommand):
+    help = "Per-check overhead of DRF's ScopedRateThrottle and of RateLimitThrottle"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=5000)
+        parser.add_argument('--alias', default='default', help="cache of DRF's throttle and the cache backend")
+
+    def handle(self, *args, **options):
+        checks, alias = options['checks'], options['alias']
+        request = Request(APIRequestFactory().get('/api/posts/'))
+        request.user = SimpleNamespace(pk=1, is_authenticated=True)
+        view = SimpleNamespace(throttle_scope='bench')
+
+        def drf():
+            throttle = ScopedRateThrottle()
+            throttle.THROTTLE_RATES = {'bench': RATE}
+            throttle.cache = caches[alias]
+            return throttle
+
+        cases = [
+            ("DRF ScopedRateThrottle", drf, {}),
+            ('sliding, local', RateLimitThrottle, {'BACKEND': 'local', 'ALGORITHM': 'sliding'}),
+            ('bucket, local', RateLimitThrottle, {'BACKEND': 'local', 'ALGORITHM': 'bucket'}),
+            ('sliding, cache', RateLimitThrottle, {'BACKEND': 'cache', 'ALGORITHM': 'sliding', 'ALIAS': alias}),
+            ('bucket, cache', RateLimitThrottle, {'BACKEND': 'cache', 'ALGORITHM': 'bucket', 'ALIAS': alias}),
+        ]
+        quarter = checks // 4
+        self.stdout.write(f"{checks} checks of one client, cache {alias!r} ({caches[alias].__class__.__name__})")
+        self.stdout.write(f"{'throttle':<24}{'first us/check':>16}{'last us/check':>16}")
+        for name, make, config in cases:
+            caches[alias].clear()
+            reset_throttles()
+            with override_settings(THROTTLING={**config, 'RATES': {'bench': RATE}}):
+                timings = []
+                for _ in range(checks):
+                    throttle = make()  # DRF makes one per request
+                    start = time.perf_counter()
+                    assert throttle.allow_request(request, view)
+                    timings.append(time.perf_counter() - start)
+            first = sum(timings[:quarter]) / quarter * 1e6
+            last = sum(timings[-quarter:]) / quarter * 1e6
+            self.stdout.write(f'{name:<24}{first:>16.1f}{last:>16.1f}')
+        caches[alias].clear()
+        reset_throttles()
@@ -0,0 +1,35 @@
+'''
+
+Build step: write the OpenAPI schema served by /api/schema/ (app/core/schema.py).
+
+    python manage.py compile_schema [--dir build/schema]
+
+Writes schema.yaml, schema.json and their compressed variants (.gz, .br with brotli) to
+SCHEMA_CACHE['DIR']. Run it with the deploy, after the code changed: servers load the files
+on their first schema request.
+
+'''
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.core.schema import compile_schema, schema_settings
+
+
+class Command(BaseCommand):
+    help = "Precompile the OpenAPI schema (YAML, JSON, compressed variants) for /api/schema/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help="default: SCHEMA_CACHE['DIR']")
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or schema_settings()['DIR']
+        if not directory:
+            raise CommandError("No directory: pass --dir or set SCHEMA_CACHE['DIR']")
+        start = time.perf_counter()
+        written = compile_schema(directory)
+        elapsed = (time.perf_counter() - start) * 1000
+        for name, size in written.items():
+            self.stdout.write(f'{name:<20}{size:>10} bytes')
+        self.stdout.write(f"Schema compiled to {directory} in {elapsed:.0f} ms")
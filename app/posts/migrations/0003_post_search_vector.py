@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+# PostgreSQL only: a generated tsvector column + GIN index for full-text search.
+# Being GENERATED ... STORED, Postgres keeps it in sync on every INSERT/UPDATE, including
+# bulk_create() and queryset.update(). SQLite gets an FTS5 table instead, which is created
+# by the post_migrate hook in app/posts/search.py (see install_sqlite_fts for why).
+ADD_SEARCH_VECTOR = [
+    """
+    ALTER TABLE posts_post ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX posts_post_search_vector_gin ON posts_post USING gin (search_vector)",
+]
+
+DROP_SEARCH_VECTOR = [
+    "DROP INDEX IF EXISTS posts_post_search_vector_gin",
+    "ALTER TABLE posts_post DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in ADD_SEARCH_VECTOR:
+            schema_editor.execute(sql)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in DROP_SEARCH_VECTOR:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_alter_post_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
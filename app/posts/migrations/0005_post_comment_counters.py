@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:21
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+BATCH_SIZE = 1000
+
+
+def backfill_comment_counters(apps, schema_editor):
+    """Fill the new counters from post_comments, BATCH_SIZE posts at a time."""
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('comments', 'Comment')
+    db = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        pks = list(
+            Post.objects.using(db).filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE]
+        )
+        if not pks:
+            break
+        totals = (
+            Comment.objects.using(db).filter(post_id__in=pks)
+            .values('post_id').annotate(count=Count('id'), last=Max('created_at')).order_by()
+        )
+        posts = [Post(pk=row['post_id'], comment_count=row['count'], last_comment_at=row['last']) for row in totals]
+        Post.objects.using(db).bulk_update(posts, ['comment_count', 'last_comment_at'])
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_indexes'),
+        ('comments', '0002_comment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_comment_counters, migrations.RunPython.noop),
+    ]
@@ -23,9 +23,43 @@ class Post(models.Model):
     is_published = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized from post_comments, maintained by app/comments/counters.py with F() updates.
+    # Never written by a regular save() (see save below), `manage.py reconcile_comment_counts` fixes drift.
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    COUNTER_FIELDS = ('comment_count', 'last_comment_at')
 
     class Meta:
-        ordering = ['-created_at']
+        # id breaks ties between rows created in the same microsecond (keyset pagination relies on it)
+        ordering = ['-created_at', '-id']
+        # One index per access path of PostViewSet, column order = WHERE columns, then ORDER BY
+        indexes = [
+            # default list + keyset pagination: ORDER BY created_at DESC, id DESC
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+            # ?is_published=true (the public feed): partial index, drafts never enter it
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='post_published_created_idx',
+                condition=models.Q(is_published=True),
+            ),
+            # ?mine=true: WHERE user_id = ? ORDER BY created_at
+            models.Index(fields=['user', 'created_at', 'id'], name='post_user_created_idx'),
+            # ?ordering=updated_at
+            models.Index(fields=['updated_at', 'id'], name='post_updated_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        """
+        Updating a loaded post must not write back its (possibly stale) comment counters:
+        a comment added between our SELECT and this UPDATE would be lost.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,225 @@
+'''
+
+Full-text search for posts.
+
+`SearchFilter` turns ?search=django into `title ILIKE '%django%' OR body ILIKE '%django%'`,
+which no B-tree index can serve, so every search is a sequential scan of posts_post.
+
+Instead every database gets a real inverted index:
+
+    PostgreSQL -> generated `search_vector tsvector` column + GIN index (migration 0003),
+                  matched with websearch_to_tsquery, ranked with ts_rank_cd,
+                  highlighted with ts_headline
+    SQLite     -> FTS5 external-content table `posts_post_fts` kept in sync by triggers,
+                  ranked with bm25(), highlighted with snippet()
+    others     -> icontains fallback (same behaviour as SearchFilter)
+
+Both indexes are maintained by the database itself (generated column / triggers), so they
+stay correct for save(), bulk_create() and queryset.update() alike.
+
+Snippets are raw body text: the database marks the matches with control characters and
+highlight() HTML-escapes the text before turning those into <mark> tags, so a post body
+can't inject markup into search results.
+
+'''
+
+import html
+import re
+import sqlite3
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from .models import Post
+
+SEARCH_CONFIG = 'english'
+SNIPPET_START = '<mark>'
+SNIPPET_STOP = '</mark>'
+# what the database puts around matches (ts_headline / snippet()), replaced after escaping
+MATCH_START = '\x02'
+MATCH_STOP = '\x03'
+
+POST_TABLE = Post._meta.db_table
+FTS_TABLE = f'{POST_TABLE}_fts'
+
+
+# -----------------------------
+# PostgreSQL: tsvector + GIN
+# -----------------------------
+class PostgresSearchBackend:
+    vector = f'"{POST_TABLE}"."search_vector"'
+    tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+
+    def filter(self, queryset, term):
+        return queryset.filter(
+            RawSQL(f'{self.vector} @@ {self.tsquery}', [SEARCH_CONFIG, term], output_field=BooleanField())
+        )
+
+    def search(self, queryset, term):
+        headline_options = f'StartSel="{MATCH_START}", StopSel="{MATCH_STOP}", MaxFragments=2, MaxWords=30'
+        return self.filter(queryset, term).annotate(
+            search_rank=RawSQL(
+                f'ts_rank_cd({self.vector}, {self.tsquery})',
+                [SEARCH_CONFIG, term],
+                output_field=FloatField(),
+            ),
+            search_snippet=RawSQL(
+                f'ts_headline(%s::regconfig, "{POST_TABLE}"."body", {self.tsquery}, %s)',
+                [SEARCH_CONFIG, SEARCH_CONFIG, term, headline_options],
+                output_field=TextField(),
+            ),
+        )
+
+
+# -----------------------------
+# SQLite: FTS5
+# -----------------------------
+class SQLiteSearchBackend:
+    match = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+
+    @staticmethod
+    def to_fts_query(term):
+        """
+        Quote every word so user input can never be parsed as FTS5 syntax
+        (AND/OR/NEAR, column filters, unbalanced quotes...). Words are AND-ed.
+        """
+        return ' '.join(f'"{word}"' for word in re.findall(r'\w+', term))
+
+    def filter(self, queryset, term):
+        query = self.to_fts_query(term)
+        if not query:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(self.match, [query]))
+
+    def search(self, queryset, term):
+        query = self.to_fts_query(term)
+        # correlated on rowid, so the FTS index is only probed for the matched rows
+        correlated = f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = "{POST_TABLE}"."id"'
+        return self.filter(queryset, term).annotate(
+            # bm25() is "lower is better"; negate so that ordering by -search_rank works everywhere
+            search_rank=RawSQL(f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) {correlated}', [query], output_field=FloatField()),
+            search_snippet=RawSQL(
+                f"SELECT snippet({FTS_TABLE}, 1, %s, %s, '…', 30) {correlated}",
+                [MATCH_START, MATCH_STOP, query],
+                output_field=TextField(),
+            ),
+        )
+
+
+# -----------------------------
+# Anything else: icontains
+# -----------------------------
+class LikeSearchBackend:
+    def filter(self, queryset, term):
+        return queryset.filter(Q(title__icontains=term) | Q(body__icontains=term))
+
+    def search(self, queryset, term):
+        return self.filter(queryset, term).annotate(
+            search_rank=Value(0.0, output_field=FloatField()),
+            search_snippet=Value(None, output_field=TextField()),
+        )
+
+
+def highlight(snippet):
+    """Database snippet -> HTML: the text escaped, the matches in <mark>."""
+    snippet = html.escape(snippet, quote=False)
+    return snippet.replace(MATCH_START, SNIPPET_START).replace(MATCH_STOP, SNIPPET_STOP)
+
+
+def _fts5_available():
+    try:
+        sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE probe USING fts5(x)')
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+FTS5_AVAILABLE = _fts5_available()
+
+
+def get_search_backend(using='default'):
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if vendor == 'sqlite' and FTS5_AVAILABLE:
+        return SQLiteSearchBackend()
+    return LikeSearchBackend()
+
+
+def install_sqlite_fts(sender=None, using='default', **kwargs):
+    """
+    post_migrate hook: create the FTS5 table and its sync triggers on SQLite.
+
+    SQLite migrations rebuild a table (copy + drop + rename) whenever a column is altered,
+    and dropping the old table drops its triggers too. So this runs after every migrate and
+    re-creates anything missing, rebuilding the index from posts_post when it does.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not FTS5_AVAILABLE:
+        return
+    if POST_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = %s", [f'{FTS_TABLE}_au'])
+        if cursor.fetchone():
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"title, body, content='{POST_TABLE}', content_rowid='id', tokenize='porter unicode61')"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {POST_TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {POST_TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, body ON {POST_TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+# -----------------------------
+# DRF filter backend
+# -----------------------------
+class PostSearchFilter(BaseFilterBackend):
+    """
+    Drop-in replacement for SearchFilter on PostViewSet: same ?search= parameter, but
+    served by the full-text index and ordered by relevance (unless ?ordering= is given).
+    Matched rows carry `search_rank` and `search_snippet` annotations, unless the view sets
+    `rank_search_results = False` (filter only, e.g. exports).
+    """
+    search_param = api_settings.SEARCH_PARAM
+    ordering_param = api_settings.ORDERING_PARAM
+
+    def get_search_term(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        term = self.get_search_term(request)
+        if not term:
+            return queryset
+        if not getattr(view, 'rank_search_results', True):
+            return get_search_backend(queryset.db).filter(queryset, term)
+        queryset = get_search_backend(queryset.db).search(queryset, term)
+        if not request.query_params.get(self.ordering_param):
+            queryset = queryset.order_by('-search_rank', '-created_at', '-id')
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.search_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Full-text search on title and body, results ordered by relevance.',
+                'schema': {'type': 'string'},
+            },
+        ]
@@ -9,14 +9,32 @@ Creates or updates model instances from validated data.
 
 from rest_framework import serializers
 from .models import Post
+from .search import highlight
+from app.core.fieldsets import SparseFieldsetMixin
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user_username = serializers.ReadOnlyField(source='user.username')
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'body', 'user', 'user_username','is_published', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'user', 'user_username', 'created_at', 'updated_at']
+        fields = ['id', 'title', 'body', 'user', 'user_username','is_published', 'created_at', 'updated_at',
+                  'comment_count', 'last_comment_at']
+        read_only_fields = ['id', 'user', 'user_username', 'created_at', 'updated_at',
+                            'comment_count', 'last_comment_at']
+
+class SnippetField(serializers.CharField):
+    """Search snippet as escaped HTML, matches in <mark> (search.highlight)."""
+
+    def to_representation(self, value):
+        return highlight(str(value))
+
+class PostSearchResultSerializer(PostSerializer):
+    """PostSerializer + relevance and highlighted snippet for ?search= results."""
+    search_rank = serializers.FloatField(read_only=True)
+    search_snippet = SnippetField(read_only=True, allow_null=True)
+
+    class Meta(PostSerializer.Meta):
+        fields = PostSerializer.Meta.fields + ['search_rank', 'search_snippet']
 
 class PostCreateUpdateSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.id')  # read-only
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import post_cache
+from .models import Post
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_cache(sender, instance, **kwargs):
+    post_cache.invalidate([instance.pk])
@@ -1,9 +1,18 @@
 # app/post/tests/test_post_api.py
+import json
+import os
 import pytest
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework.authtoken.models import Token
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync
 from .models import Post
+from .views import PostAsyncReadView, PostViewSet
+from app.comments.models import Comment
+from app.core.explain import capture_plans
 
 User = get_user_model()
 
@@ -86,3 +95,943 @@ class TestPostAPI:
         """Custom action /publish/ should be admin-only; non-admin should get 403."""
         resp = auth_client.post(f'/api/posts/{post1.id}/publish/')
         assert resp.status_code == 403
+
+
+@pytest.mark.django_db
+class TestPostKeysetPagination:
+    """?cursor= switches the list endpoint from page numbers to keyset pagination."""
+
+    @pytest.fixture
+    def many_posts(self, user, user2):
+        posts = [
+            Post.objects.create(title=f'Post {i}', body='Body', user=user if i % 2 else user2, is_published=i % 3 != 0)
+            for i in range(25)
+        ]
+        return posts
+
+    def walk(self, client, url):
+        """Follow `next` links until the end, return all ids seen."""
+        ids = []
+        while url:
+            resp = client.get(url)
+            assert resp.status_code == 200
+            assert 'count' not in resp.data  # no COUNT(*) in keyset mode
+            ids += [row['id'] for row in resp.data['results']]
+            url = resp.data['next']
+        return ids
+
+    def test_walk_all_pages(self, api_client, many_posts):
+        ids = self.walk(api_client, '/api/posts/?cursor=')
+        expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        assert ids == expected
+
+    def test_previous_link(self, api_client, many_posts):
+        first = api_client.get('/api/posts/?cursor=').data
+        assert first['previous'] is None
+        second = api_client.get(first['next']).data
+        back = api_client.get(second['previous']).data
+        assert [r['id'] for r in back['results']] == [r['id'] for r in first['results']]
+
+    def test_with_filter_and_ordering(self, api_client, many_posts):
+        ids = self.walk(api_client, '/api/posts/?cursor=&is_published=true&ordering=updated_at')
+        expected = list(
+            Post.objects.filter(is_published=True).order_by('updated_at', 'id').values_list('id', flat=True)
+        )
+        assert ids == expected
+
+    def test_mine(self, auth_client, user, many_posts):
+        ids = self.walk(auth_client, '/api/posts/?cursor=&mine=true&page_size=4')
+        assert sorted(ids) == sorted(p.id for p in many_posts if p.user_id == user.id)
+
+    def test_invalid_cursor(self, api_client, many_posts):
+        resp = api_client.get('/api/posts/?cursor=garbage')
+        assert resp.status_code == 404
+
+
+@pytest.mark.django_db
+class TestPostSearch:
+    """?search= goes through the full-text index, ranked and highlighted."""
+
+    @pytest.fixture
+    def posts(self, user):
+        return [
+            Post.objects.create(title='Django tips', body='Use select_related to avoid queries', user=user),
+            Post.objects.create(title='Cooking', body='Django reinhardt played guitar while cooking', user=user),
+            Post.objects.create(title='Gardening', body='Tomatoes need sun', user=user),
+        ]
+
+    def test_search_ranks_and_highlights(self, api_client, posts):
+        resp = api_client.get('/api/posts/?search=django')
+        assert resp.status_code == 200
+        results = resp.data['results']
+        assert {r['id'] for r in results} == {posts[0].id, posts[1].id}
+        assert results[0]['search_rank'] >= results[1]['search_rank']
+        assert all('search_snippet' in r for r in results)
+
+    def test_snippet_marks_match(self, api_client, posts):
+        results = api_client.get('/api/posts/?search=guitar').data['results']
+        assert [r['id'] for r in results] == [posts[1].id]
+        assert '<mark>guitar</mark>' in results[0]['search_snippet']
+
+    def test_snippet_is_escaped(self, api_client, user):
+        Post.objects.create(title='XSS', body='<img src=x onerror=alert(1)> guitar & <b>amp</b>', user=user)
+        snippet = api_client.get('/api/posts/?search=guitar').data['results'][0]['search_snippet']
+        assert '<img' not in snippet and '&lt;img src=x onerror=alert(1)&gt;' in snippet
+        assert '<mark>guitar</mark> &amp; &lt;b&gt;' in snippet
+
+    def test_index_follows_bulk_update(self, api_client, posts):
+        Post.objects.filter(pk=posts[2].pk).update(body='Tomatoes and django')
+        results = api_client.get('/api/posts/?search=tomatoes django').data['results']
+        assert [r['id'] for r in results] == [posts[2].id]
+
+    def test_search_is_not_fts_syntax(self, api_client, posts):
+        resp = api_client.get('/api/posts/?search="django OR (')
+        assert resp.status_code == 200
+
+    def test_plain_list_has_no_search_fields(self, api_client, posts):
+        results = api_client.get('/api/posts/').data['results']
+        assert 'search_rank' not in results[0]
+
+
+@pytest.mark.django_db
+class TestPostQueryPlans:
+    """
+    Plan regression suite: every query of the post endpoints must be served by an index,
+    never by a full scan of posts_post or by a sort step. See app/core/explain.py.
+    """
+
+    @pytest.fixture(autouse=True)
+    def seed(self, user, user2):
+        Post.objects.bulk_create(
+            Post(title=f'Post {i}', body='Body', user=user if i % 2 else user2, is_published=i % 3 != 0)
+            for i in range(200)
+        )
+
+    @pytest.mark.parametrize('url', [
+        '/api/posts/',
+        '/api/posts/?page=3',
+        '/api/posts/?cursor=',
+        '/api/posts/?is_published=true',
+        '/api/posts/?is_published=true&cursor=',
+        '/api/posts/?mine=true&cursor=',
+        '/api/posts/?mine=true&cursor=&ordering=created_at',
+        '/api/posts/?cursor=&ordering=-updated_at',
+    ])
+    def test_list_plans(self, auth_client, url):
+        with capture_plans() as plans:
+            resp = auth_client.get(url)
+        assert resp.status_code == 200
+        assert plans.for_table('posts_post')
+        assert plans.problems('posts_post') == {}
+
+    def test_retrieve_plan(self, api_client):
+        post = Post.objects.first()
+        with capture_plans() as plans:
+            resp = api_client.get(f'/api/posts/{post.id}/')
+        assert resp.status_code == 200
+        assert plans.problems('posts_post') == {}
+
+
+@pytest.mark.django_db
+class TestPostResponseCache:
+    """Anonymous list/retrieve responses are cached and invalidated on every Post change."""
+
+    def test_list_hit_and_miss(self, api_client, post1):
+        assert api_client.get('/api/posts/')['X-Cache'] == 'MISS'
+        assert api_client.get('/api/posts/')['X-Cache'] == 'HIT'
+        # query params (page, filters) are part of the key
+        assert api_client.get('/api/posts/?is_published=false')['X-Cache'] == 'MISS'
+
+    def test_host_is_part_of_the_key(self, api_client, post1, user):
+        for i in range(10):
+            Post.objects.create(title=f'Post {i}', body='Body', user=user)
+        forged = api_client.get('/api/posts/', HTTP_HOST='evil.example')
+        assert forged.data['next'].startswith('http://evil.example/')
+        resp = api_client.get('/api/posts/')
+        assert resp['X-Cache'] == 'MISS'
+        assert resp.data['next'].startswith('http://testserver/')
+
+    def test_authenticated_not_cached(self, auth_client, post1):
+        auth_client.get('/api/posts/')
+        assert 'X-Cache' not in auth_client.get('/api/posts/')
+
+    def test_save_invalidates(self, api_client, post1):
+        api_client.get('/api/posts/')
+        post1.title = 'Changed'
+        post1.save()
+        resp = api_client.get('/api/posts/')
+        assert resp['X-Cache'] == 'MISS'
+        assert resp.data['results'][0]['title'] == 'Changed'
+
+    def test_detail_invalidation_is_per_object(self, api_client, user, post1):
+        other = Post.objects.create(title='Other', body='Body', user=user)
+        api_client.get(f'/api/posts/{post1.id}/')
+        other.delete()
+        assert api_client.get(f'/api/posts/{post1.id}/')['X-Cache'] == 'HIT'
+        pk = post1.pk
+        post1.delete()
+        assert api_client.get(f'/api/posts/{pk}/').status_code == 404
+
+    def test_admin_bulk_action_invalidates(self, api_client, admin_client, post1):
+        assert api_client.get('/api/posts/?is_published=true').data['count'] == 0
+        admin_client.post('/admin/posts/post/', {'action': 'make_published', '_selected_action': [post1.id]})
+        assert api_client.get('/api/posts/?is_published=true').data['count'] == 1
+
+    def test_file_backend(self, api_client, post1, settings, tmp_path):
+        settings.CACHES = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': str(tmp_path),
+            }
+        }
+        assert api_client.get('/api/posts/')['X-Cache'] == 'MISS'
+        assert api_client.get('/api/posts/')['X-Cache'] == 'HIT'
+
+    def test_stats(self, api_client, admin_client, post1):
+        api_client.get('/api/posts/')
+        api_client.get('/api/posts/')
+        stats = admin_client.get('/api/posts/cache-stats/').json()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+
+@pytest.mark.django_db
+class TestPostAdminScale:
+    """Admin pages cost the same number of queries with 3 or 30 posts/users/comments."""
+
+    def queries(self, client, url):
+        client.get(url)  # warm up (content types, session)
+        with CaptureQueriesContext(connection) as ctx:
+            assert client.get(url).status_code == 200
+        return len(ctx.captured_queries)
+
+    def add_posts(self, count):
+        User = get_user_model()
+        start = User.objects.count()
+        # no create_user(): password hashing would dominate the test
+        owners = User.objects.bulk_create(User(username=f'owner{start + i}', password='!') for i in range(count))
+        for i, owner in enumerate(owners):
+            post = Post.objects.create(title=f'T{i}', body='B', user=owner)
+            Comment.objects.create(post=post, author=owner, content='c')
+
+    def test_changelist_constant_queries(self, admin_client):
+        self.add_posts(3)
+        few = self.queries(admin_client, '/admin/posts/post/')
+        self.add_posts(30)
+        assert self.queries(admin_client, '/admin/posts/post/') == few
+        assert self.queries(admin_client, '/admin/posts/post/?is_published__exact=0') == few
+
+    def test_owner_filter_lists_no_users(self, admin_client, user):
+        self.add_posts(3)
+        resp = admin_client.get(f'/admin/posts/post/?user__id__exact={user.id}')
+        content = resp.content.decode()
+        assert 'Mine' in content and user.username in content
+        assert 'owner1' not in content.split('id="changelist-filter"')[1]
+
+    def test_change_page_caps_inline(self, admin_client, post1, settings):
+        settings.ADMIN_SCALE = {'INLINE_MAX': 5}
+        url = f'/admin/posts/post/{post1.id}/change/'
+        Comment.objects.create(post=post1, author=post1.user, content='first')
+        for i in range(5):
+            Comment.objects.create(post=post1, author=post1.user, content=f'early {i}')
+        # the author widget looks its label up per shown row: bounded by INLINE_MAX
+        few = self.queries(admin_client, url)
+        for i in range(20):
+            Comment.objects.create(post=post1, author=post1.user, content=f'c{i}')
+        assert self.queries(admin_client, url) == few
+        resp = admin_client.get(url)
+        assert resp.context['inline_admin_formsets'][0].formset.initial_form_count() == 5
+        assert 'c19' in resp.content.decode() and '>first<' not in resp.content.decode()
+
+    def test_capped_count(self, admin_client, settings):
+        settings.ADMIN_SCALE = {'MAX_COUNT': 10}
+        self.add_posts(12)
+        resp = admin_client.get('/admin/posts/post/')
+        assert resp.context['cl'].result_count == 10
+
+
+@pytest.mark.django_db
+class TestPostBulkEndpoints:
+    """/api/posts/bulk/ and /api/posts/bulk-publish/ validate and write many posts at once."""
+
+    def test_bulk_create(self, auth_client, user):
+        items = [{'title': f'T{i}', 'body': 'B'} for i in range(5)]
+        resp = auth_client.post('/api/posts/bulk/', items, format='json')
+        assert resp.status_code == 201
+        assert [r['status'] for r in resp.data['results']] == [201] * 5
+        assert Post.objects.filter(user=user).count() == 5
+        assert resp.data['results'][0]['data']['user_username'] == user.username
+
+    def test_bulk_create_reports_errors_per_item(self, auth_client, settings):
+        settings.POSTS_BULK = {'BATCH_SIZE': 2}
+        items = [{'title': 'ok', 'body': 'B'}, {'body': 'no title'}, {'title': 'ok2', 'body': 'B'}]
+        resp = auth_client.post('/api/posts/bulk/', items, format='json')
+        assert resp.status_code == 207
+        assert [r['status'] for r in resp.data['results']] == [201, 400, 201]
+        assert 'title' in resp.data['results'][1]['errors']
+        assert Post.objects.count() == 2
+
+    def test_bulk_create_needs_a_list(self, auth_client):
+        resp = auth_client.post('/api/posts/bulk/', {'title': 'x'}, format='json')
+        assert resp.status_code == 400
+
+    def test_bulk_update_enforces_ownership(self, auth_client, user2, post1, django_assert_max_num_queries):
+        other = Post.objects.create(title='Bob', body='B', user=user2)
+        items = [{'id': post1.id, 'title': 'Mine'}, {'id': other.id, 'title': 'Not mine'}, {'title': 'no id'}]
+        with django_assert_max_num_queries(8):
+            resp = auth_client.patch('/api/posts/bulk/', items, format='json')
+        assert resp.status_code == 207
+        assert [r['status'] for r in resp.data['results']] == [200, 404, 400]
+        post1.refresh_from_db()
+        other.refresh_from_db()
+        assert post1.title == 'Mine'
+        assert other.title == 'Bob'
+
+    def test_bulk_update_writes_only_the_changed_fields(self, auth_client, user, post1):
+        other = Post.objects.create(title='Other', body='B', user=user)
+        items = [{'id': post1.id, 'title': 'New title'}, {'id': other.id, 'body': 'New body'},
+                 {'id': post1.id, 'body': 'Again'}]
+        concurrent = []
+
+        def edit_meanwhile(execute, sql, params, many, context):
+            if not concurrent and sql.startswith('UPDATE'):
+                concurrent.append(sql)  # once: the concurrent UPDATE comes through here too
+                Post.objects.filter(pk=post1.pk).update(body='Edited meanwhile')
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(edit_meanwhile):
+            resp = auth_client.patch('/api/posts/bulk/', items, format='json')
+        assert [r['status'] for r in resp.data['results']] == [200, 200, 400]
+        assert resp.data['results'][2]['errors'] == {'id': ['Duplicate of item 0.']}
+        post1.refresh_from_db()
+        other.refresh_from_db()
+        assert (post1.title, post1.body) == ('New title', 'Edited meanwhile')  # body not written back
+        assert (other.title, other.body) == ('Other', 'New body')
+
+    def test_bulk_publish_admin_only(self, auth_client, post1):
+        resp = auth_client.post('/api/posts/bulk-publish/', {'ids': [post1.id]}, format='json')
+        assert resp.status_code == 403
+
+    def test_bulk_publish(self, admin_client, post1):
+        resp = admin_client.post(
+            '/api/posts/bulk-publish/', {'ids': [post1.id, 999999]}, content_type='application/json'
+        )
+        assert resp.status_code == 207
+        assert [r['status'] for r in resp.json()['results']] == [200, 404]
+        post1.refresh_from_db()
+        assert post1.is_published
+
+
+@pytest.mark.django_db
+class TestPostSparseFieldsets:
+    """?fields= / ?omit= trim the response and the columns loaded from the database."""
+
+    def test_fields(self, api_client, post1):
+        resp = api_client.get('/api/posts/?fields=id,title,user_username')
+        assert list(resp.data['results'][0]) == ['id', 'title', 'user_username']
+
+    def test_omit(self, api_client, post1):
+        resp = api_client.get(f'/api/posts/{post1.id}/?omit=body,updated_at')
+        assert 'body' not in resp.data
+        assert 'updated_at' not in resp.data
+        assert resp.data['title'] == 'Hello'
+
+    def test_columns_not_loaded(self, api_client, post1):
+        with CaptureQueriesContext(connection) as ctx:
+            api_client.get('/api/posts/?fields=id,title&cursor=')
+        selects = [q['sql'] for q in ctx.captured_queries if 'FROM "posts_post"' in q['sql']]
+        assert len(selects) == 1
+        assert '"body"' not in selects[0]
+        assert 'auth_user' not in selects[0]
+
+    def test_join_only_when_needed(self, api_client, post1):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = api_client.get('/api/posts/?fields=title,user_username&cursor=')
+        assert resp.data['results'][0]['user_username'] == 'alice'
+        assert len(ctx.captured_queries) == 1
+        assert 'auth_user' in ctx.captured_queries[0]['sql']
+
+
+@pytest.mark.django_db
+class TestPostFastReadPath:
+    """The .values() fast path must produce exactly the JSON of PostSerializer."""
+
+    @pytest.fixture
+    def posts(self, user, user2):
+        return [
+            Post.objects.create(title=f'Django {i}', body='Body', user=user if i % 2 else user2, is_published=bool(i % 2))
+            for i in range(5)
+        ]
+
+    @pytest.mark.parametrize('url', [
+        '/api/posts/',
+        '/api/posts/?cursor=&page_size=2',
+        '/api/posts/?search=django',
+        '/api/posts/?fields=title,user_username,created_at',
+        '/api/posts/{id}/',
+    ])
+    def test_same_json_as_serializer(self, api_client, posts, settings, url):
+        url = url.format(id=posts[0].id)
+        settings.TIME_ZONE = 'Asia/Kolkata'
+        settings.RESPONSE_CACHE = {'ENABLED': False}
+        settings.FAST_READ_SERIALIZATION = True
+        fast = api_client.get(url).content
+        settings.FAST_READ_SERIALIZATION = False
+        slow = api_client.get(url).content
+        assert fast == slow
+
+    def test_single_query(self, api_client, posts):
+        with CaptureQueriesContext(connection) as ctx:
+            api_client.get('/api/posts/?cursor=')
+        assert len(ctx.captured_queries) == 1
+
+
+@pytest.mark.django_db
+class TestPostExport:
+    """Streaming NDJSON/CSV export honours the list filters and resumes after an id."""
+
+    @pytest.fixture
+    def posts(self, user, user2):
+        return [
+            Post.objects.create(title=f'Django {i}', body='Body', user=user if i % 2 else user2, is_published=bool(i % 2))
+            for i in range(6)
+        ]
+
+    def lines(self, response):
+        assert response.streaming
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_ndjson_in_id_order(self, api_client, posts, settings):
+        settings.EXPORT = {'CHUNK_SIZE': 2}
+        resp = api_client.get('/api/posts/export/')
+        assert resp['Content-Type'] == 'application/x-ndjson'
+        rows = [json.loads(line) for line in self.lines(resp)]
+        assert [row['id'] for row in rows] == [p.id for p in posts]
+        # same representation as the detail endpoint
+        assert rows[0] == json.loads(api_client.get(f'/api/posts/{posts[0].id}/').content)
+
+    def test_filters_and_resume(self, api_client, posts):
+        published = [p.id for p in posts if p.is_published]
+        resp = api_client.get(f'/api/posts/export/?is_published=true&after={published[0]}')
+        assert [json.loads(line)['id'] for line in self.lines(resp)] == published[1:]
+
+    def test_search_filter(self, api_client, posts):
+        Post.objects.create(title='Flask', body='Other', user=posts[0].user)
+        resp = api_client.get('/api/posts/export/?search=django&fields=id,title')
+        rows = [json.loads(line) for line in self.lines(resp)]
+        assert {row['title'] for row in rows} == {p.title for p in posts}
+        assert set(rows[0]) == {'id', 'title'}
+
+    def test_csv(self, api_client, posts):
+        resp = api_client.get('/api/posts/export/?export_format=csv&fields=id,title,is_published')
+        assert resp['Content-Type'].startswith('text/csv')
+        lines = self.lines(resp)
+        assert lines[0] == 'id,title,is_published'
+        assert lines[1] == f'{posts[0].id},Django 0,False'
+        assert len(lines) == len(posts) + 1
+
+    def test_invalid_params(self, api_client):
+        assert api_client.get('/api/posts/export/?export_format=xml').status_code == 400
+        assert api_client.get('/api/posts/export/?after=abc').status_code == 400
+
+
+@pytest.mark.django_db
+class TestPostFeedComments:
+    """?with_comments=N: newest N comments per post of the page, one extra query."""
+
+    @pytest.fixture
+    def feed(self, user, user2):
+        posts = [Post.objects.create(title=f'P{i}', body='B', user=user, is_published=True) for i in range(4)]
+        for post in posts[:3]:
+            for i in range(5):
+                Comment.objects.create(post=post, author=user2, content=f'{post.title} c{i}')
+        return posts
+
+    def test_latest_comments_per_post(self, api_client, feed, user2):
+        resp = api_client.get('/api/posts/?with_comments=2&ordering=created_at')
+        by_id = {row['id']: row for row in resp.data['results']}
+        assert [c['content'] for c in by_id[feed[0].id]['latest_comments']] == ['P0 c4', 'P0 c3']
+        assert by_id[feed[3].id]['latest_comments'] == []
+        assert by_id[feed[1].id]['latest_comments'][0]['author_username'] == user2.username
+
+    def test_one_query_for_the_page(self, api_client, feed, settings):
+        settings.RESPONSE_CACHE = {'ENABLED': False}
+        with CaptureQueriesContext(connection) as plain:
+            api_client.get('/api/posts/?cursor=')
+        with CaptureQueriesContext(connection) as ctx:
+            api_client.get('/api/posts/?cursor=&with_comments=3')
+        assert len(ctx.captured_queries) == len(plain.captured_queries) + 1
+        assert 'ROW_NUMBER()' in ctx.captured_queries[-1]['sql']
+
+    def test_same_without_fast_path(self, api_client, feed, settings):
+        settings.RESPONSE_CACHE = {'ENABLED': False}
+        fast = api_client.get('/api/posts/?with_comments=3&fields=id,title').content
+        settings.FAST_READ_SERIALIZATION = False
+        assert api_client.get('/api/posts/?with_comments=3&fields=id,title').content == fast
+
+    def test_cached_list_sees_edited_comment(self, api_client, feed):
+        api_client.get('/api/posts/?with_comments=1')
+        comment = Comment.objects.filter(post=feed[0]).latest('id')
+        comment.content = 'edited'
+        comment.save()
+        resp = api_client.get('/api/posts/?with_comments=1')
+        assert resp['X-Cache'] == 'MISS'
+        row = next(r for r in resp.data['results'] if r['id'] == feed[0].id)
+        assert row['latest_comments'][0]['content'] == 'edited'
+
+    def test_invalid(self, api_client, feed):
+        assert api_client.get('/api/posts/?with_comments=abc').status_code == 400
+        assert api_client.get('/api/posts/?with_comments=11').status_code == 400
+        assert api_client.get('/api/posts/?with_comments=1&fields=title').status_code == 400
+
+    def test_nested_comments_route(self, api_client, feed):
+        resp = api_client.get(f'/api/posts/{feed[0].id}/comments/?page_size=2')
+        assert [c['content'] for c in resp.data['results']] == ['P0 c0', 'P0 c1']
+        assert resp.data['count'] == 5
+        resp = api_client.get(f'/api/posts/{feed[0].id}/comments/?cursor=&fields=id,content')
+        assert {c['content'] for c in resp.data['results']} == {f'P0 c{i}' for i in range(5)}
+        assert api_client.get(f'/api/posts/{feed[3].id}/comments/').data['results'] == []
+        assert api_client.get('/api/posts/0/comments/').status_code == 404
+
+
+@pytest.mark.django_db
+class TestPostAsyncReadPath:
+    """The async views (ASYNC_READ_VIEWS) must answer exactly like PostViewSet."""
+
+    @pytest.fixture
+    def posts(self, user, user2):
+        return [
+            Post.objects.create(title=f'Django {i}', body='Body', user=user if i % 2 else user2, is_published=bool(i % 2))
+            for i in range(15)
+        ]
+
+    def call(self, actions, request, **kwargs):
+        view = PostAsyncReadView.as_view(actions=actions)
+        return async_to_sync(view)(request, **kwargs)
+
+    @pytest.mark.parametrize('query', [
+        '', '?page=2', '?page=99', '?cursor=&page_size=4', '?is_published=true&ordering=-updated_at',
+        '?search=django', '?fields=id,title', '?with_comments=2',
+    ])
+    def test_list_same_as_sync(self, api_client, posts, settings, query):
+        settings.RESPONSE_CACHE = {'ENABLED': False}
+        resp = self.call({'get': 'list'}, APIRequestFactory().get('/api/posts/' + query))
+        expected = api_client.get('/api/posts/' + query)
+        assert resp.status_code == expected.status_code
+        assert json.loads(resp.content) == json.loads(expected.content)
+
+    def test_retrieve(self, api_client, posts):
+        pk = posts[0].pk
+        resp = self.call({'get': 'retrieve'}, APIRequestFactory().get(f'/api/posts/{pk}/'), pk=str(pk))
+        assert json.loads(resp.content) == json.loads(api_client.get(f'/api/posts/{pk}/').content)
+        resp = self.call({'get': 'retrieve'}, APIRequestFactory().get('/api/posts/0/'), pk='0')
+        assert resp.status_code == 404
+
+    def test_token_auth_and_mine(self, posts, user):
+        token = Token.objects.create(user=user)
+        request = APIRequestFactory().get('/api/posts/?mine=true&page_size=50', HTTP_AUTHORIZATION=f'Token {token.key}')
+        resp = self.call({'get': 'list'}, request)
+        assert {row['user'] for row in json.loads(resp.content)['results']} == {user.id}
+        request = APIRequestFactory().get('/api/posts/', HTTP_AUTHORIZATION='Token nope')
+        resp = self.call({'get': 'list'}, request)
+        assert resp.status_code == 401
+        assert resp['WWW-Authenticate'] == 'Token'
+
+    def test_writes_go_to_the_sync_view(self, user):
+        token = Token.objects.create(user=user)
+        request = APIRequestFactory().post('/api/posts/', {'title': 'T', 'body': 'B'}, format='json',
+                                           HTTP_AUTHORIZATION=f'Token {token.key}')
+        resp = self.call({'get': 'list', 'post': 'create'}, request)
+        assert resp.status_code == 201
+        assert Post.objects.filter(title='T', user=user).exists()
+
+    def test_anonymous_responses_cached(self, posts):
+        first = self.call({'get': 'list'}, APIRequestFactory().get('/api/posts/'))
+        second = self.call({'get': 'list'}, APIRequestFactory().get('/api/posts/'))
+        assert (first['X-Cache'], second['X-Cache']) == ('MISS', 'HIT')
+        assert first.content == second.content
+
+
+@pytest.mark.django_db
+class TestPostRateLimit:
+    """throttle_scope = 'user' through app/core/throttling.py: O(1) counters, RateLimit-* headers."""
+
+    @pytest.fixture
+    def rates(self, settings):
+        settings.THROTTLING = {'RATES': {'user': '3/minute'}}
+        return settings.THROTTLING
+
+    def test_headers(self, api_client, post1):
+        resp = api_client.get('/api/posts/')
+        assert (resp['RateLimit-Limit'], resp['RateLimit-Remaining'], resp['RateLimit-Policy']) == ('600', '599', '600;w=60')
+        assert api_client.get('/api/posts/')['RateLimit-Remaining'] == '598'
+        assert 'RateLimit-Limit' not in api_client.get('/api/comments/')  # no throttle_scope
+
+    def test_limit_then_429(self, api_client, auth_client, rates):
+        for _ in range(3):
+            assert auth_client.get('/api/posts/').status_code == 200
+        resp = auth_client.get('/api/posts/')
+        assert resp.status_code == 429 and resp['RateLimit-Remaining'] == '0'
+        assert 0 < int(resp['Retry-After']) <= 120
+        assert APIClient().get('/api/posts/').status_code == 200  # anonymous: counted per IP
+
+    def test_shared_cache_backend(self, auth_client, rates):
+        from app.core.throttling import reset_throttles
+        rates['BACKEND'] = 'cache'
+        for _ in range(3):
+            auth_client.get('/api/posts/')
+        reset_throttles()  # another process: nothing local, the counter is in the cache
+        assert auth_client.get('/api/posts/').status_code == 429
+
+    def test_async_view(self, user, rates):
+        token = Token.objects.create(user=user)
+        view = PostAsyncReadView.as_view(actions={'get': 'list'})
+        statuses = [async_to_sync(view)(APIRequestFactory().get('/api/posts/', HTTP_AUTHORIZATION=f'Token {token.key}')).status_code
+                    for _ in range(4)]
+        assert statuses == [200, 200, 200, 429]
+
+    def test_sliding_window_counter(self):
+        from app.core.throttling import LocalBackend
+        backend = LocalBackend(100)
+        assert [backend.sliding('k', 4, 60, 10).allowed for _ in range(5)] == [True] * 4 + [False]
+        # a quarter into the next window 3/4 of the previous 4 still count: one more fits
+        assert [backend.sliding('k', 4, 60, 75).allowed for _ in range(2)] == [True, False]
+        assert backend.sliding('k', 4, 60, 200).allowed  # two windows later: forgotten
+
+    def test_token_bucket(self):
+        from app.core.throttling import LocalBackend
+        backend = LocalBackend(100)
+        assert [backend.bucket('k', 2, 10, 0).allowed for _ in range(3)] == [True, True, False]
+        assert backend.bucket('k', 2, 10, 1).retry_after == pytest.approx(4)  # 5 s per token
+        assert backend.bucket('k', 2, 10, 5).allowed
+
+    def test_parse_rate(self):
+        from app.core.throttling import parse_rate
+        assert [parse_rate(r) for r in ('100/minute', '10/s', '1000/6h', '5/day')] == [(100, 60), (10, 1), (1000, 21600), (5, 86400)]
+
+
+@pytest.mark.django_db
+class TestDatabasePoolStats:
+    """Connection mode + psycopg pool counters (app/core/dbpool.py), GET /api/_db/pool/."""
+
+    def test_connection_modes(self):
+        from app.core.dbpool import connection_mode
+        assert connection_mode({'CONN_MAX_AGE': 0, 'OPTIONS': {'pool': {'max_size': 4}}}) == 'pool'
+        assert connection_mode({'CONN_MAX_AGE': 60, 'OPTIONS': {}}) == 'persistent'
+        assert connection_mode({'CONN_MAX_AGE': None, 'OPTIONS': {}}) == 'persistent'  # unlimited
+        assert connection_mode({'CONN_MAX_AGE': 0, 'OPTIONS': {}}) == 'per-request'
+
+    def test_pool_metrics(self):
+        from app.core.dbpool import pool_metrics
+        metrics = pool_metrics({'pool_min': 2, 'pool_max': 10, 'pool_size': 6, 'pool_available': 1,
+                                'requests_waiting': 3, 'requests_num': 500, 'requests_queued': 40,
+                                'requests_wait_ms': 100, 'requests_errors': 1, 'connections_num': 7})
+        assert (metrics['in_use'], metrics['idle'], metrics['waiting']) == (5, 1, 3)
+        assert (metrics['wait_ms_avg'], metrics['timeouts'], metrics['connections_opened']) == (2.5, 1, 7)
+
+    def test_endpoint_admin_only(self, auth_client, admin_client):
+        assert APIClient().get('/api/_db/pool/').status_code == 401
+        assert auth_client.get('/api/_db/pool/').status_code == 403
+        resp = admin_client.get('/api/_db/pool/')
+        assert resp.status_code == 200 and resp.json()['default']['mode'] in ('pool', 'persistent', 'per-request')
+
+
+@pytest.mark.skipif('replica' not in settings.DATABASES, reason="needs a 'replica' test database")
+@pytest.mark.django_db(databases=['default', 'replica'])
+class TestPostReadReplicas:
+    """
+    ReplicaRouter (app/core/replicas.py). The test 'replica' database is not replicated: rows
+    written to it directly show which database a request read from.
+    """
+
+    @pytest.fixture(autouse=True)
+    def replicas(self, settings):
+        from app.core.replicas import selector
+        settings.REPLICAS = {'ALIASES': {'replica': 1}, 'STICKY_SECONDS': 5}
+        settings.RESPONSE_CACHE = {'ENABLED': False}
+        selector.reset()
+        yield settings.REPLICAS
+        selector.reset()
+
+    @pytest.fixture
+    def replica_post(self):
+        owner = User.objects.db_manager('replica').create_user(username='carol', password='pass1234')
+        return Post.objects.using('replica').create(title='On the replica', body='x', user=owner, is_published=True)
+
+    def titles(self, client):
+        resp = client.get('/api/posts/')
+        assert resp.status_code == 200
+        return [p['title'] for p in resp.json()['results']]
+
+    def test_reads_go_to_the_replica(self, api_client, post1, replica_post, settings):
+        assert self.titles(api_client) == ['On the replica']
+        resp = api_client.get(f'/api/posts/{replica_post.pk}/')
+        assert resp.status_code == 200 and resp.json()['title'] == 'On the replica'
+        settings.REPLICAS = {'ALIASES': {}}
+        assert self.titles(api_client) == ['Hello']
+
+    def test_writer_pinned_to_primary(self, auth_client, post1, replica_post, monkeypatch):
+        import time
+        from app.core import replicas
+        resp = auth_client.post('/api/posts/', {'title': 'New', 'body': 'b'}, format='json')
+        assert resp.status_code == 201
+        assert set(self.titles(auth_client)) == {'Hello', 'New'}  # read your writes
+        assert self.titles(APIClient()) == ['On the replica']  # other clients: replica
+        later = time.time() + 6  # STICKY_SECONDS passed
+        monkeypatch.setattr(replicas, 'time', type('clock', (), {'time': lambda: later, 'monotonic': time.monotonic}))
+        assert self.titles(auth_client) == ['On the replica']
+
+    def test_cached_responses_read_the_primary(self, auth_client, post1, replica_post, settings):
+        settings.RESPONSE_CACHE = {'ENABLED': True}
+        anonymous = APIClient()
+        assert self.titles(anonymous) == ['Hello']  # miss: filled from the primary
+        resp = anonymous.get('/api/posts/')
+        assert resp['X-Cache'] == 'HIT' and [p['title'] for p in resp.json()['results']] == ['Hello']
+        assert self.titles(auth_client) == ['On the replica']  # not cached: replica
+
+    def test_writes_never_go_to_the_replica(self, auth_client, replica_post):
+        assert auth_client.post('/api/posts/', {'title': 'New', 'body': 'b'}, format='json').status_code == 201
+        assert Post.objects.filter(title='New').exists()
+        assert not Post.objects.using('replica').filter(title='New').exists()
+
+    def test_transactions_read_the_primary(self):
+        from django.db import transaction
+        from app.core.replicas import ReplicaRouter, RequestState, _state
+        state = RequestState()
+        state.replica = 'replica'
+        token = _state.set(state)
+        try:
+            router = ReplicaRouter()
+            assert router.db_for_read(Post) == 'replica'
+            with transaction.atomic():
+                assert router.db_for_read(Post) == 'default'
+            assert router.db_for_read(Post) == 'replica'
+            assert router.db_for_write(Post) == 'default'
+            assert router.db_for_read(Post) == 'default'  # the request wrote
+        finally:
+            _state.reset(token)
+        assert ReplicaRouter().db_for_read(Post) is None  # outside requests: Django's default
+
+    def test_failover_to_primary(self, api_client, post1, replica_post, monkeypatch):
+        from django.db import OperationalError, connections
+        from app.core.replicas import selector
+
+        def unreachable():
+            raise OperationalError('connection refused')
+        monkeypatch.setattr(connections['replica'], 'ensure_connection', unreachable)
+        assert self.titles(api_client) == ['Hello']
+        assert 'replica' in selector.down
+        monkeypatch.undo()
+        assert self.titles(api_client) == ['Hello']  # skipped until RETRY_AFTER
+        selector.reset()
+        assert self.titles(api_client) == ['On the replica']
+
+    def test_comment_list_reads_the_replica(self, api_client, post1, replica_post):
+        Comment.objects.using('replica').create(post=replica_post, author=replica_post.user, content='replicated')
+        resp = api_client.get('/api/comments/')
+        assert resp.status_code == 200
+        assert [c['content'] for c in resp.json()['results']] == ['replicated']
+
+    def test_weighted_schedule(self):
+        from app.core.replicas import weighted_schedule
+        assert weighted_schedule({'a': 2, 'b': 1}) == ['a', 'b', 'a']
+        assert sorted(weighted_schedule({'a': 3, 'b': 1, 'c': 2})) == ['a'] * 3 + ['b'] + ['c'] * 2
+
+
+@pytest.mark.django_db
+class TestSchemaCache:
+    """/api/schema/ from the precompiled or memoized schema (app/core/schema.py)."""
+
+    @pytest.fixture(autouse=True)
+    def schema_cache(self, settings, tmp_path):
+        from app.core.schema import reset_schema_cache
+        settings.SCHEMA_CACHE = {'DIR': str(tmp_path / 'schema'), 'MAX_AGE': 60}
+        reset_schema_cache()
+        yield settings.SCHEMA_CACHE
+        reset_schema_cache()
+
+    def test_same_schema_as_spectacular(self, api_client):
+        from drf_spectacular.views import SpectacularAPIView
+        expected = SpectacularAPIView.as_view()(APIRequestFactory().get('/api/schema/', {'format': 'json'}))
+        expected.render()
+        resp = api_client.get('/api/schema/', {'format': 'json'})
+        assert resp.status_code == 200 and resp['Content-Type'] == 'application/vnd.oai.openapi+json'
+        assert json.loads(resp.content) == json.loads(expected.content)
+        resp = api_client.get('/api/schema/')  # YAML by default, like drf-spectacular
+        assert resp['Content-Type'].startswith('application/vnd.oai.openapi;') and b'openapi: 3' in resp.content
+
+    def test_precompiled_files(self, api_client, schema_cache, monkeypatch):
+        from django.core.management import call_command
+        from app.core import schema
+        call_command('compile_schema', stdout=open(os.devnull, 'w'))
+        monkeypatch.setattr(schema, 'generate_schema', lambda: pytest.fail("generated at runtime"))
+        resp = api_client.get('/api/schema/', {'format': 'json'})
+        with open(os.path.join(schema_cache['DIR'], 'schema.json'), 'rb') as f:
+            assert resp.content == f.read()
+
+    def test_lazy_generation_memoized(self, api_client, schema_cache, monkeypatch):
+        from app.core import schema
+        calls = []
+        generate = schema.generate_schema
+        monkeypatch.setattr(schema, 'generate_schema', lambda: calls.append(1) or generate())
+        first = api_client.get('/api/schema/', {'format': 'json'})
+        assert api_client.get('/api/schema/', {'format': 'json'}).content == first.content
+        assert calls == [1] and not os.path.exists(schema_cache['DIR'])
+
+    def test_etag_and_gzip(self, api_client):
+        import gzip
+        resp = api_client.get('/api/schema/')
+        etag = resp['ETag']
+        assert resp['Cache-Control'] == 'public, max-age=60' and 'Accept-Encoding' in resp['Vary']
+        assert api_client.get('/api/schema/', HTTP_IF_NONE_MATCH=etag).status_code == 304
+        assert api_client.get('/api/schema/', {'format': 'json'}, HTTP_IF_NONE_MATCH=etag).status_code == 200
+        zipped = api_client.get('/api/schema/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        assert zipped['Content-Encoding'] == 'gzip' and zipped['ETag'] != etag
+        assert gzip.decompress(zipped.content) == resp.content
+        assert 'Content-Encoding' not in api_client.get('/api/schema/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+
+    def test_accepted_encodings(self):
+        from app.core.schema import accepted_encodings
+        assert accepted_encodings('gzip, br;q=0.5, deflate;q=0') == {'gzip', 'br'}
+        assert accepted_encodings('') == set()
+
+
+@pytest.mark.django_db
+class TestRequestMetrics:
+    """MetricsMiddleware (app/core/metrics.py): Server-Timing, histograms, /api/_metrics."""
+
+    @pytest.fixture(autouse=True)
+    def metrics(self, settings):
+        from app.core.metrics import registry
+        settings.METRICS = {'SAMPLE_RATE': 1.0, 'TOKEN': 'scrape-me'}
+        settings.RESPONSE_CACHE = {'ENABLED': False}
+        registry.reset()
+        yield settings.METRICS
+        registry.reset()
+
+    def timings(self, resp):
+        entries = {}
+        for entry in resp['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            entries[name] = dict(param.split('=', 1) for param in params)
+        return entries
+
+    def test_server_timing(self, auth_client, post1):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = auth_client.get('/api/posts/')
+        timings = self.timings(resp)
+        assert set(timings) == {'db', 'auth', 'serialize', 'render', 'total'}
+        assert timings['db']['desc'] == f'"{len(ctx.captured_queries)} queries"'
+        assert float(timings['total']['dur']) >= float(timings['db']['dur'])
+
+    def test_sampling(self, api_client, metrics):
+        from app.core.metrics import registry
+        metrics['SAMPLE_RATE'] = 0
+        assert 'Server-Timing' not in api_client.get('/api/posts/')
+        assert registry.snapshot() == {}
+
+    def test_histograms(self, api_client, post1):
+        from app.core.metrics import registry
+        for _ in range(5):
+            api_client.get('/api/posts/')
+        api_client.get('/api/comments/')
+        stats = registry.snapshot()
+        quantiles, total, count = stats[('GET', 'post-list')]['total']
+        assert count == 5 and total > 0 and quantiles[0] <= quantiles[1] <= quantiles[2]
+        assert stats[('GET', 'post-list')]['queries'][2] == 5
+        assert ('GET', 'comment-list-create') in stats
+
+    def test_histogram_quantiles(self):
+        from app.core.metrics import Histogram
+        histogram = Histogram([1, 2, 4, 8])
+        for value in [0.5] * 50 + [3] * 45 + [7] * 5:
+            histogram.observe(value)
+        assert histogram.quantile(0.5) == 1  # top of the first bucket
+        assert 2 < histogram.quantile(0.95) <= 4 and 4 < histogram.quantile(0.99) <= 8
+        assert Histogram([1]).quantile(0.5) is None
+
+    def test_prometheus_endpoint(self, api_client, auth_client, post1, admin_client):
+        auth_client.get('/api/posts/')
+        assert APIClient().get('/api/_metrics').status_code == 401
+        assert auth_client.get('/api/_metrics').status_code == 403
+        resp = APIClient().get('/api/_metrics', HTTP_X_METRICS_TOKEN='scrape-me')
+        assert resp.status_code == 200 and resp['Content-Type'].startswith('text/plain; version=0.0.4')
+        text = resp.content.decode()
+        assert '# TYPE api_request_duration_seconds summary' in text
+        assert 'api_request_duration_seconds{method="GET",endpoint="post-list",phase="total",quantile="0.99"}' in text
+        assert 'api_request_queries_count{method="GET",endpoint="post-list"} 1' in text
+        assert 'app_password_pool_total{event="completed"}' in text
+        assert admin_client.get('/api/_metrics').status_code == 200
+
+    def test_scrape_does_not_start_the_ingestor(self, settings):
+        from app.comments import ingest
+        settings.COMMENT_INGEST = {'ENABLED': True, 'AUTOSTART': False}
+        ingest.reset_ingestor()
+        try:
+            text = APIClient().get('/api/_metrics', HTTP_X_METRICS_TOKEN='scrape-me').content.decode()
+            assert 'app_comment_ingest_total' not in text and ingest.existing_ingestor() is None
+            ingest.get_ingestor()
+            text = APIClient().get('/api/_metrics', HTTP_X_METRICS_TOKEN='scrape-me').content.decode()
+            assert 'app_comment_ingest_total{event="accepted"} 0' in text
+        finally:
+            ingest.reset_ingestor()
+
+    def test_async_view(self, user):
+        token = Token.objects.create(user=user)
+        view = PostAsyncReadView.as_view(actions={'get': 'list'})
+        from app.core.metrics import MetricsMiddleware
+        middleware = MetricsMiddleware(view)
+        resp = async_to_sync(middleware)(APIRequestFactory().get('/api/posts/', HTTP_AUTHORIZATION=f'Token {token.key}'))
+        assert {'db', 'auth', 'serialize', 'render', 'total'} <= set(self.timings(resp))
+
+
+@pytest.mark.django_db
+class TestQueryBudgets:
+    """query_budget of the views (app/core/budgets.py), enforced for every test by app/conftest.py."""
+
+    @pytest.fixture
+    def n_plus_one(self, settings, monkeypatch, user, user2):
+        # the user of every row loaded on its own, like a serializer without select_related
+        settings.FAST_READ_SERIALIZATION = False
+        settings.RESPONSE_CACHE = {'ENABLED': False}
+        monkeypatch.setattr(PostViewSet, 'queryset', Post.objects.all())
+        for i, owner in enumerate([user, user2, user, user2]):
+            Post.objects.create(title=f'P{i}', body='b', user=owner, is_published=True)
+
+    def test_over_budget_raises_in_tests(self, api_client, n_plus_one):
+        from app.core.budgets import QueryBudgetExceeded
+        with pytest.raises(QueryBudgetExceeded) as exc:
+            api_client.get('/api/posts/')
+        report = exc.value.report
+        assert (report['view'], report['action'], report['budget']) == ('PostViewSet', 'list', 5)
+        assert report['queries'] == 6  # COUNT, page, 4 users
+        (sql, count), = report['duplicates']
+        assert count == 4 and 'FROM "auth_user"' in sql and '= ?' in sql
+
+    def test_over_budget_logs_in_production(self, api_client, n_plus_one, settings, caplog):
+        settings.QUERY_BUDGETS = {'RAISE': False}
+        with caplog.at_level('WARNING', logger='app.query_budget'):
+            assert api_client.get('/api/posts/').status_code == 200
+        record, = caplog.records
+        assert record.query_budget['queries'] == 6 and record.query_budget['duplicates'][0][1] == 4
+
+    def test_within_budget(self, auth_client, post1):
+        assert auth_client.get('/api/posts/').status_code == 200
+        assert auth_client.get('/api/comments/').status_code == 200
+        assert auth_client.get('/api/user/me/').status_code == 200
+
+    def test_resolve_budget(self):
+        from app.comments.views import CommentListView
+        from app.core.budgets import query_budget, resolve_budget
+        factory = APIRequestFactory()
+        view = PostViewSet.as_view({'get': 'list', 'post': 'create'})
+        assert resolve_budget(view, factory.head('/api/posts/')) == ('PostViewSet', 'list', 5)
+        assert resolve_budget(view, factory.post('/api/posts/')) == ('PostViewSet', 'create', 5)
+        assert resolve_budget(CommentListView.as_view(), factory.post('/')) == ('CommentListView', 'post', 8)
+        assert resolve_budget(PostAsyncReadView.as_view(actions={'get': 'list'}), factory.get('/'))[2] == 5
+        assert resolve_budget(query_budget(1)(lambda request: None), factory.get('/'))[2] == 1
+
+    def test_fingerprint(self):
+        from app.core.budgets import fingerprint
+        assert fingerprint('SELECT * FROM t WHERE id = 12 AND name = \'it\'\'s\'') == 'SELECT * FROM t WHERE id = ? AND name = ?'
+        assert fingerprint('SELECT * FROM t WHERE id IN (%s, %s,  %s)') == fingerprint('SELECT * FROM t WHERE id IN (%s)')
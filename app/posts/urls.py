@@ -1,10 +1,22 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
-from .views import PostViewSet
+from .views import PostViewSet, PostAsyncReadView
+from app.core.asyncviews import async_reads_enabled
 
 router = DefaultRouter()
 router.register(r'posts', PostViewSet, basename='post')
 
-urlpatterns = [
+urlpatterns = []
+if async_reads_enabled():
+    # GET/HEAD served by async views, other methods fall through to PostViewSet
+    # (<int:pk> so that the extra actions, /posts/bulk/, /posts/export/..., still reach the router)
+    urlpatterns += [
+        path('posts/', PostAsyncReadView.as_view(actions={'get': 'list', 'post': 'create'}), name='post-list'),
+        path('posts/<int:pk>/', PostAsyncReadView.as_view(actions={
+            'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+        }), name='post-detail'),
+    ]
+
+urlpatterns += [
     path('', include(router.urls)),
 ]
@@ -8,3 +8,9 @@ class IsOwnerOrReadOnly(BasePermission):
             return True
         # Write permissions only for owner
         return obj.user == request.user
+
+    def filter_queryset(self, request, queryset):
+        """Set-wise version of has_object_permission, for views that write many rows at once"""
+        if request.method in SAFE_METHODS:
+            return queryset
+        return queryset.filter(user=request.user)
@@ -2,41 +2,76 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAdminUser
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
-from rest_framework.exceptions import NotFound
-from rest_framework.filters import SearchFilter, OrderingFilter
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.authentication import SessionAuthentication
+from app.users.authentication import CachedTokenAuthentication
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 # from rest_framework.schemas import AutoSchema
-from .serializers import PostSerializer, PostCreateUpdateSerializer
+from .serializers import PostSerializer, PostCreateUpdateSerializer, PostSearchResultSerializer
 from .models import Post
 from .utils import IsOwnerOrReadOnly
+from .search import PostSearchFilter
+from .bulk import bulk_create_posts, bulk_update_posts, bulk_publish_posts, bulk_settings
+from .cache import COMMENT_LISTS, post_cache
+from app.core.pagination import HybridPagination
+from app.core.cache import CachedResponseMixin
+from app.core.fieldsets import sparse_queryset, sparse_fieldset_parameters
+from app.core.fastpath import FastReadMixin
+from app.core.export import streaming_export, export_parameters
+from app.core.asyncviews import AsyncModelReadView
+from app.core.replicas import ReplicaReadMixin
+from app.comments.feeds import MAX_COMMENTS_PER_POST, attach_latest_comments
 
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.openapi import AutoSchema
 
 @extend_schema(tags=["Blogs"])
-class PostViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    list=extend_schema(parameters=sparse_fieldset_parameters(PostSerializer) + [
+        OpenApiParameter('with_comments', OpenApiTypes.INT, OpenApiParameter.QUERY,
+                         description=f'Embed the N newest comments of every post as latest_comments '
+                                     f'(max {MAX_COMMENTS_PER_POST}), in one query for the whole page.'),
+    ]),
+    retrieve=extend_schema(parameters=sparse_fieldset_parameters(PostSerializer)),
+)
+class PostViewSet(ReplicaReadMixin, CachedResponseMixin, FastReadMixin, viewsets.ModelViewSet):
     """
     Full CRUD for Post model using only default DRF components.
     """
     queryset = Post.objects.select_related('user').all()
     # get_serializer_class() might return None then use this serializer_class
     serializer_class = PostSerializer  # DRF uses it whenever get_serializer_class() is not overridden.
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
-    throttle_scope = 'user'  # use DRF's default throttles
-    pagination_class = PageNumberPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    throttle_scope = 'user'  # THROTTLING['RATES']['user'] (app/core/throttling.py)
+    pagination_class = HybridPagination  # ?page=N by default, keyset with ?cursor=
+    # PostSearchFilter serves ?search= from the full-text index (see search.py) instead of ILIKE
+    filter_backends = [DjangoFilterBackend, PostSearchFilter, OrderingFilter]
     filterset_fields = ['is_published'] # , 'user__username'
-    search_fields = ['title', 'body']
     ordering_fields = ['created_at', 'updated_at']
     schema = AutoSchema() # per-view schema generator used to build API documentation (OpenAPI/Swagger).
+    # anonymous list/retrieve responses are cached, invalidated on every Post change
+    response_cache = post_cache
+    cache_timeouts = {'list': 30, 'retrieve': 300}
+    # columns loaded even when ?fields= leaves them out (keyset cursors read them)
+    sparse_always_load = ('id', 'created_at', 'updated_at')
+    # list/retrieve read rows with .values() and a precompiled converter (app/core/fastpath.py)
+    fast_read_extra = sparse_always_load
+    # most queries per request (app/core/budgets.py), authentication included; bulk writes one
+    # statement per BATCH_SIZE items (MAX_ITEMS / BATCH_SIZE = 10 by default)
+    query_budget = {
+        'list': 5, 'retrieve': 4, 'create': 5, 'update': 5, 'partial_update': 5, 'destroy': 8,
+        'publish': 4, 'bulk': 30, 'bulk_publish': 30, 'cache_stats': 3, 'export': 3,
+    }
 
     # Overriding get_serializer_class
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return PostCreateUpdateSerializer
+        if self.action == 'list' and self.request and PostSearchFilter().get_search_term(self.request):
+            return PostSearchResultSerializer
         return PostSerializer
 
     def get_queryset(self):
@@ -50,10 +85,47 @@ class PostViewSet(viewsets.ModelViewSet):
             qs = qs.filter(user=self.request.user)
         return qs
 
+    def filter_queryset(self, queryset):
+        """
+        ?fields= / ?omit= => only load the columns (and joins) the response needs
+        """
+        queryset = super().filter_queryset(queryset)
+        if self.action in ('list', 'retrieve', 'export'):
+            queryset = sparse_queryset(queryset, self.get_serializer(), always=self.sparse_always_load)
+        return queryset
+
     def perform_create(self, serializer):
         # Set user automatically
         serializer.save(user=self.request.user)
 
+    def with_comments(self):
+        value = self.request.query_params.get('with_comments')
+        if value in (None, ''):
+            return 0
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({'with_comments': 'A valid integer is required.'})
+        if not 0 <= value <= MAX_COMMENTS_PER_POST:
+            raise ValidationError({'with_comments': f'Must be between 0 and {MAX_COMMENTS_PER_POST}.'})
+        return value
+
+    def cache_group(self, request):
+        # validated by with_comments() when the list is rendered; errors aren't cached
+        return COMMENT_LISTS if request.query_params.get('with_comments') not in (None, '', '0') else None
+
+    def extend_list_data(self, data):
+        """?with_comments=N => latest_comments on every post of the page (comments/feeds.py)"""
+        limit = self.with_comments()
+        if limit:
+            if data and 'id' not in data[0]:
+                raise ValidationError({'with_comments': 'Needs the id field, add it to ?fields=.'})
+            attach_latest_comments(data, limit)
+        return data
+
+    def get_paginated_response(self, data):
+        return super().get_paginated_response(self.extend_list_data(data))
+
 
     # What @action(detail=True) means
     # detail=True → this action applies to a single object (so it requires the {id} in the URL).
@@ -72,3 +144,71 @@ class PostViewSet(viewsets.ModelViewSet):
         post.save(update_fields=['is_published'])
         return Response({'status': 'published'}, status=status.HTTP_200_OK)
     # detail=False → URL: /api/posts/publish/ (collection-level action, you must handle id manually).
+
+    # -----------------------------
+    # Batch endpoints (see bulk.py)
+    # -----------------------------
+    def _bulk_payload(self, data):
+        if not isinstance(data, list) or not data:
+            raise ValidationError({'detail': 'Expected a non-empty list.'})
+        max_items = bulk_settings()['MAX_ITEMS']
+        if len(data) > max_items:
+            raise ValidationError({'detail': f'At most {max_items} items per request.'})
+        return data
+
+    def _bulk_response(self, results, success):
+        ok = sum(1 for r in results if r['status'] == success)
+        if ok == len(results):
+            code = success
+        elif ok:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response({'results': results}, status=code)
+
+    # POST /api/posts/bulk/   -> [{title, body, is_published}, ...]
+    # PATCH /api/posts/bulk/  -> [{id, ...changed fields}, ...] (own posts only)
+    @extend_schema(request=PostCreateUpdateSerializer(many=True), responses=OpenApiTypes.OBJECT,
+                   description="Create (POST) or partially update (PATCH) many posts in one request")
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        items = self._bulk_payload(request.data)
+        if request.method == 'POST':
+            return self._bulk_response(bulk_create_posts(request.user, items), status.HTTP_201_CREATED)
+        owned = IsOwnerOrReadOnly().filter_queryset(request, self.get_queryset())
+        return self._bulk_response(bulk_update_posts(items, owned), status.HTTP_200_OK)
+
+    # POST /api/posts/bulk-publish/ -> {"ids": [1, 2, 3]} (admin only, like publish)
+    @extend_schema(request=OpenApiTypes.OBJECT, responses=OpenApiTypes.OBJECT,
+                   description="Publish many posts in one request")
+    @action(detail=False, methods=['post'], url_path='bulk-publish', permission_classes=[IsAdminUser])
+    def bulk_publish(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        ids = self._bulk_payload(ids)
+        if not all(isinstance(pk, int) for pk in ids):
+            raise ValidationError({'ids': 'Expected a list of integer ids.'})
+        return self._bulk_response(bulk_publish_posts(ids), status.HTTP_200_OK)
+
+    # GET /api/posts/cache-stats/
+    @extend_schema(responses=OpenApiTypes.OBJECT, description="Response cache hit/miss counters (admin only)")
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        return Response(self.response_cache.stats())
+
+    # GET /api/posts/export/?export_format=ndjson|csv&after=<last id>
+    @extend_schema(parameters=export_parameters() + sparse_fieldset_parameters(PostSerializer),
+                   responses={(200, 'application/x-ndjson'): OpenApiTypes.STR, (200, 'text/csv'): OpenApiTypes.STR},
+                   description="Stream every post matching the list filters as NDJSON or CSV, in id order")
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        self.rank_search_results = False  # ?search= filters only, relevance is meaningless in id order
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_export(queryset, self.get_serializer(), request, filename='posts')
+
+
+class PostAsyncReadView(AsyncModelReadView):
+    """
+    PostViewSet list/retrieve as native async views (ASYNC_READ_VIEWS=true, see urls.py),
+    writes are still served by PostViewSet.
+    """
+    view_class = PostViewSet
@@ -1,30 +1,44 @@
 from django.contrib import admin
 from app.users.models import userProfile
+from app.core.admin import ScalableAdminMixin
+from app.jobs.runner import job_action
+from app.users.authentication import token_user_cache
 
 @admin.register(userProfile)
-class userAdmin(admin.ModelAdmin):
+class userAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'username', 'email', 'level')
     list_display_links = ('username',)
-    list_filter = ('email',)
+    list_select_related = ('user',)  # username column
+    list_filter = ('level',)  # not ('email',): one sidebar entry per distinct email
     search_fields = ('email', 'user__username')  # '__' ORM is works for onnly search
     ordering = ('-id',)
     readonly_fields = ('id', 'username')
 
     fieldsets = (
         ('Main', {'fields': ('email', 'level')}),
-        ('Meta', {'fields': ('id', 'user__username')} ),
+        ('Meta', {'fields': ('id', 'username')} ),
     )
 
     actions = ['set_level_1', 'set_level_2']
 
+    @job_action()
     def set_level_1(self, request, queryset):
-        queryset.update(level=1)
+        return self.set_level(queryset, 1)
     set_level_1.short_description = 'Level 1'
 
+    @job_action()
     def set_level_2(self, request, queryset):
-        queryset.update(level=2)
+        return self.set_level(queryset, 2)
     set_level_2.short_description = 'Level 2'
 
+    def set_level(self, queryset, level):
+        # update() sends no post_save: drop the cached token users (authentication.py) here
+        user_ids = list(queryset.values_list('user_id', flat=True))
+        updated = queryset.update(level=level)
+        for user_id in user_ids:
+            token_user_cache.invalidate_user(user_id)
+        return updated
+
     # short_description - header title
     def username(self, obj):
         return obj.user.username
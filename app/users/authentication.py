@@ -0,0 +1,228 @@
+'''
+
+Token authentication without a database query per request.
+
+TokenAuthentication reads authtoken_token JOIN auth_user on every request, and
+/api/user/me/ then reads the profile. CachedTokenAuthentication keeps token -> user
+(with its profile) in two tiers:
+
+    local    per process LRU (LOCAL_MAX_ENTRIES), entries live LOCAL_TTL seconds
+    shared   the Django cache (AUTH_TOKEN_CACHE['ALIAS']), entries live TIMEOUT seconds
+    miss     one query: token JOIN user LEFT JOIN profile
+
+The profile rides along in the user's relation cache, so `request.user.userprofile` costs
+nothing either (None is cached too: no profile -> DoesNotExist without a query).
+Entries are pickled: every request unpickles its own User, nothing is shared between
+threads.
+
+Invalidation (signals.py): deleting a token, saving or deleting a user or a profile
+drops the entries from the shared cache and from this process' LRU. Other processes drop
+their local copy after LOCAL_TTL at the latest, keep it short. Bulk changes that send no
+signals (queryset.update(is_active=False)) must call invalidate_user() themselves.
+
+A miss racing with an invalidation (row read, user deactivated, stale entry written)
+must not keep the old user for TIMEOUT: invalidations take a number from a shared
+generation counter and record it per user, a fill notes the counter before its query and
+drops what it wrote when the user was invalidated since. Inside a transaction the
+invalidation is repeated once it commits, fills in between still read the old row.
+
+'''
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+from app.core.timing import timed
+
+from .models import userProfile
+
+PROFILE_RELATION = userProfile.user.field.remote_field  # User -> userprofile (reverse one-to-one)
+
+
+def token_cache_settings():
+    defaults = {'ENABLED': True, 'ALIAS': 'default', 'TIMEOUT': 300, 'LOCAL_TTL': 5, 'LOCAL_MAX_ENTRIES': 10000}
+    return {**defaults, **getattr(settings, 'AUTH_TOKEN_CACHE', {})}
+
+
+class LocalLRU:
+    """Thread-safe LRU with per entry TTL (monotonic clock)."""
+
+    def __init__(self):
+        self.entries = OrderedDict()  # key -> (expires, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl, max_entries):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TokenUserCache:
+    namespace = 'authtoken'
+
+    def __init__(self):
+        self.local = LocalLRU()
+
+    @property
+    def config(self):
+        return token_cache_settings()
+
+    @property
+    def shared(self):
+        return caches[self.config['ALIAS']]
+
+    def _key(self, key):
+        return f'{self.namespace}:key:{key}'
+
+    def _user_key(self, user_id):
+        return f'{self.namespace}:user:{user_id}'
+
+    def _invalidated_key(self, user_id):
+        return f'{self.namespace}:invalidated:{user_id}'
+
+    @property
+    def _generation_key(self):
+        return f'{self.namespace}:generation'
+
+    def generation(self):
+        """Current invalidation generation; read it before loading an entry from the database."""
+        return self.shared.get(self._generation_key, 0)
+
+    def get(self, key, local_only=False):
+        """Pickled (user, token) for token `key`, None on a miss."""
+        entry = self.local.get(key)
+        if entry is None and not local_only:
+            entry = self.shared.get(self._key(key))
+            if entry is not None:
+                self._set_local(key, entry)
+        return entry
+
+    def set(self, key, user_id, entry, generation):
+        """Store an entry loaded at `generation`; False (nothing kept) if the user changed since."""
+        config = self.config
+        # user -> token key, so that changes to the user find the entry without a query
+        self.shared.set_many({self._key(key): entry, self._user_key(user_id): key}, config['TIMEOUT'])
+        # checked after the write: a later invalidation finds the entry through the user key
+        invalidated = self.shared.get(self._invalidated_key(user_id))
+        if invalidated is not None and invalidated > generation:
+            self.invalidate_key(key)
+            return False
+        self._set_local(key, entry)
+        return True
+
+    def _set_local(self, key, entry):
+        config = self.config
+        self.local.set(key, entry, config['LOCAL_TTL'], config['LOCAL_MAX_ENTRIES'])
+
+    def invalidate_key(self, key):
+        self.shared.delete(self._key(key))
+        self.local.delete(key)
+
+    def invalidate_user(self, user_id):
+        self._invalidate_user(user_id)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self._invalidate_user(user_id), robust=True)
+
+    def _invalidate_user(self, user_id):
+        try:
+            generation = self.shared.incr(self._generation_key)
+        except ValueError:
+            # missing key (first invalidation, or evicted)
+            self.shared.add(self._generation_key, 0, None)
+            generation = self.shared.incr(self._generation_key)
+        self.shared.set(self._invalidated_key(user_id), generation, self.config['TIMEOUT'])
+        key = self.shared.get(self._user_key(user_id))
+        if key is not None:
+            self.shared.delete_many([self._key(key), self._user_key(user_id)])
+            self.local.delete(key)
+
+    def clear_local(self):
+        self.local.clear()
+
+
+token_user_cache = TokenUserCache()
+
+
+def cached_profile(user):
+    """(True, profile or None) when the profile was loaded with the user, (False, None) otherwise."""
+    if PROFILE_RELATION.is_cached(user):
+        return True, PROFILE_RELATION.get_cached_value(user)
+    return False, None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication served from TokenUserCache; same header, errors and request.auth."""
+
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        if not token_cache_settings()['ENABLED']:
+            return super().authenticate_credentials(key)
+        entry = token_user_cache.get(key)
+        if entry is None:
+            generation = token_user_cache.generation()
+            token = self._load(key)
+            entry = pickle.dumps(token, pickle.HIGHEST_PROTOCOL)
+            token_user_cache.set(key, token.user_id, entry, generation)
+        else:
+            token = pickle.loads(entry)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, token
+
+    def _load(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user', 'user__userprofile').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not PROFILE_RELATION.is_cached(token.user):
+            PROFILE_RELATION.set_cached_value(token.user, None)  # no profile: remember that too
+        return token
+
+    async def aauthenticate(self, request):
+        """Async views (app/core/asyncviews.py): local hits without a thread, the rest in one."""
+        from asgiref.sync import sync_to_async
+
+        auth = get_authorization_header(request).split()
+        if len(auth) == 2 and auth[0].lower() == self.keyword.lower().encode() and token_cache_settings()['ENABLED']:
+            try:
+                entry = token_user_cache.get(auth[1].decode(), local_only=True)
+            except UnicodeError:
+                entry = None
+            if entry is not None:
+                token = pickle.loads(entry)
+                if token.user.is_active:
+                    return token.user, token
+        return await sync_to_async(self.authenticate)(request)
@@ -0,0 +1,90 @@
+'''
+
+Benchmark of authentication on GET /api/user/me/: DRF's TokenAuthentication vs
+CachedTokenAuthentication (app/users/authentication.py) with a cold and a warm cache, and
+simplejwt's JWTAuthentication vs the stateless ClaimsJWTAuthentication (app/users/tokens.py).
+
+    python manage.py bench_auth --requests 2000
+
+Reports queries per request and requests/sec through the view (no HTTP server). The user,
+profile and token are created inside a transaction that is rolled back at the end.
+
+'''
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from app.users.authentication import CachedTokenAuthentication, token_user_cache
+from app.users.models import userProfile
+from app.users.tokens import ClaimsJWTAuthentication, ProfileRefreshToken
+from app.users.views import UserMeView
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Queries per request and throughput of plain vs cached token authentication"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['requests'])
+                raise Rollback
+        except Rollback:
+            pass
+        token_user_cache.clear_local()
+
+    def run(self, total):
+        user = get_user_model().objects.create_user(username='bench-auth', password='x')
+        userProfile.objects.create(user=user, email='bench@example.com', level=1)
+        key = Token.objects.create(user=user).key
+        token_request = APIRequestFactory().get('/api/user/me/', HTTP_AUTHORIZATION=f'Token {key}')
+        access = ProfileRefreshToken.for_user(user).access_token
+        jwt_request = APIRequestFactory().get('/api/user/me/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+        def cold():
+            token_user_cache.invalidate_key(key)
+
+        cases = [
+            ('TokenAuthentication', TokenAuthentication, token_request, None),
+            ('cached, cold', CachedTokenAuthentication, token_request, cold),
+            ('cached, warm', CachedTokenAuthentication, token_request, None),
+            ('JWTAuthentication', JWTAuthentication, jwt_request, None),
+            ('JWT claims', ClaimsJWTAuthentication, jwt_request, None),
+        ]
+        self.stdout.write(f"{total} requests per case")
+        self.stdout.write(f"{'authentication':<22}{'queries/req':>12}{'req/s':>10}{'us/req':>9}")
+        for name, authentication, request, before in cases:
+            view = UserMeView.as_view(authentication_classes=[authentication])
+            view(request)  # warm up (and fill the cache)
+            queries = []
+
+            def count(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count):
+                elapsed = 0.0
+                for _ in range(total):
+                    if before:
+                        before()
+                    start = time.perf_counter()
+                    response = view(request)
+                    elapsed += time.perf_counter() - start
+                    assert response.status_code == 200, response.data
+            self.stdout.write(
+                f'{name:<22}{len(queries) / total:>12.2f}{total / elapsed:>10.0f}'
+                f'{elapsed / total * 1e6:>9.0f}'
+            )
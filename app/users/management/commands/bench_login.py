@@ -0,0 +1,84 @@
+'''
+
+Benchmark of a login burst: logins/sec and what it does to GET /api/posts/ latency.
+
+    python manage.py bench_login --clients 16 --seconds 5
+
+`--clients` threads log in back to back while one more thread reads /api/posts/. Runs
+once with the password checks inline (PASSWORD_POOL['ENABLED'] = False) and once through
+the bounded pool (app/users/passwords.py), whose refusals (503) are counted apart. The
+benchmark users are created for the run and deleted afterwards (threads need committed rows).
+
+'''
+
+import statistics
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from app.users.passwords import password_pool_settings
+
+
+class Command(BaseCommand):
+    help = "Login throughput and concurrent read latency, password checks inline vs pooled"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--workers', type=int, help="PASSWORD_POOL['MAX_WORKERS'] for the pooled run")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = [User.objects.create_user(username=f'bench-login-{i}', password='bench-pass')
+                 for i in range(options['clients'])]
+        pool = password_pool_settings()
+        if options['workers']:
+            pool['MAX_WORKERS'] = options['workers']
+        try:
+            self.stdout.write(f"{options['clients']} clients logging in for {options['seconds']}s, "
+                              f"pool of {pool['MAX_WORKERS']} workers")
+            self.stdout.write(f"{'passwords':<10}{'logins/s':>10}{'503/s':>8}{'posts p50 ms':>14}{'posts p95 ms':>14}")
+            for name, config in (('inline', {**pool, 'ENABLED': False}), ('pool', {**pool, 'ENABLED': True})):
+                with override_settings(PASSWORD_POOL=config):
+                    logins, refused, latencies = self.burst(users, options['seconds'])
+                seconds = options['seconds']
+                p50 = statistics.median(latencies) * 1000
+                p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else p50
+                self.stdout.write(f'{name:<10}{logins / seconds:>10.1f}{refused / seconds:>8.1f}{p50:>14.1f}{p95:>14.1f}')
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def burst(self, users, seconds):
+        stop = time.monotonic() + seconds
+        results = {'logins': 0, 'refused': 0}
+        latencies = []
+        lock = threading.Lock()
+
+        def login(username):
+            client = Client()
+            while time.monotonic() < stop:
+                status = client.post('/api/login/', {'username': username, 'password': 'bench-pass'},
+                                     content_type='application/json').status_code
+                with lock:
+                    results['logins' if status == 200 else 'refused'] += 1
+            connection.close()
+
+        def read():
+            client = Client()
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                client.get('/api/posts/')
+                latencies.append(time.perf_counter() - start)
+            connection.close()
+
+        threads = [threading.Thread(target=login, args=(user.username,)) for user in users]
+        threads.append(threading.Thread(target=read))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results['logins'], results['refused'], latencies
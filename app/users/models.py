@@ -6,3 +6,16 @@ class userProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     email = models.CharField(max_length=255, blank=True, null=True, default='')
     level = models.IntegerField(blank=True, null=True, default=0)
+
+
+class ClaimsUser(User):
+    """User rebuilt from the claims of a verified JWT (tokens.py), never loaded or saved."""
+
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise TypeError('ClaimsUser is built from a token: load the User to change it')
+
+    def delete(self, *args, **kwargs):
+        raise TypeError('ClaimsUser is built from a token: load the User to delete it')
@@ -0,0 +1,175 @@
+'''
+
+Password checks off the request thread, with a bound on how many run at once.
+
+A password check is ~0.3 s of CPU by design (PBKDF2, 1M iterations). Run inline, a burst
+of logins takes every worker thread and every core, and unrelated requests queue behind
+them. PooledModelBackend (ModelBackend, AUTHENTICATION_BACKENDS) does the user lookup in
+the request and hands the hash to a small executor instead:
+
+    MAX_WORKERS     hashes running at once per process (hashlib and argon2 release the GIL)
+    MAX_WAITING     logins queued behind them; one more is refused at once
+    QUEUE_TIMEOUT   seconds a queued login waits for a worker before it is refused
+
+A refused login raises PasswordPoolBusy, answered 503 + Retry-After by /api/login/, and by
+PasswordPoolBusyMiddleware for the other login forms (admin, DRF's browsable API): the
+client retries later instead of every request timing out together. authenticate() calls
+without a request (Client.login(), scripts) hash in the calling thread, there is no
+request to shed.
+
+Hasher upgrade: Django rehashes a password with PASSWORD_HASHERS[0] when its user logs in
+and the stored hash uses another hasher or other parameters. That rehash runs in the pool
+too, only the save is done by the request. settings keep Django's default hashers, with
+TunedArgon2PasswordHasher in place of Argon2PasswordHasher (it checks any argon2 hash), and
+put it first when argon2-cffi is installed and PASSWORD_ARGON2 is on: argon2id with the
+ARGON2 parameters (OWASP's m=19 MiB, t=2, p=1 by default), much cheaper per login than
+PBKDF2 at a comparable strength.
+
+'''
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import Argon2PasswordHasher, check_password, make_password
+from django.http import HttpResponse
+
+
+def password_pool_settings():
+    defaults = {'ENABLED': True, 'MAX_WORKERS': 2, 'MAX_WAITING': 16, 'QUEUE_TIMEOUT': 2.0}
+    return {**defaults, **getattr(settings, 'PASSWORD_POOL', {})}
+
+
+class PasswordPoolBusy(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Too many logins in progress, retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+class PasswordPool:
+    """ThreadPoolExecutor whose queue is bounded in length (slots) and in time (deadline)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.config = None
+        self.executor = self.slots = None
+        self.counts = {'completed': 0, 'refused': 0, 'timed_out': 0}
+
+    def _current(self, config):
+        with self.lock:
+            if config != self.config:
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                self.executor = ThreadPoolExecutor(config['MAX_WORKERS'], thread_name_prefix='password')
+                self.slots = threading.BoundedSemaphore(config['MAX_WORKERS'] + config['MAX_WAITING'])
+                self.config = config
+            return self.executor, self.slots
+
+    def run(self, func, *args):
+        """func(*args) in the pool; PasswordPoolBusy when the queue is full or too slow."""
+        config = password_pool_settings()
+        if not config['ENABLED']:
+            return func(*args)
+        executor, slots = self._current(config)
+        retry_after = max(1, math.ceil(config['QUEUE_TIMEOUT']))
+        if not slots.acquire(blocking=False):
+            self.counts['refused'] += 1
+            raise PasswordPoolBusy(retry_after)
+        try:
+            deadline = time.monotonic() + config['QUEUE_TIMEOUT']
+            result = executor.submit(self._call, deadline, retry_after, func, args).result()
+        finally:
+            slots.release()
+        self.counts['completed'] += 1
+        return result
+
+    def _call(self, deadline, retry_after, func, args):
+        if time.monotonic() > deadline:
+            # waited too long for a worker: don't spend the CPU, the client is about to give up
+            self.counts['timed_out'] += 1
+            raise PasswordPoolBusy(retry_after)
+        return func(*args)
+
+    def stats(self):
+        return dict(self.counts)
+
+
+password_pool = PasswordPool()
+
+
+def verify_password(password, encoded):
+    """(valid, new hash or None): check_password() and, when Django asks for it, the rehash."""
+    upgraded = []
+    valid = check_password(password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return valid, upgraded[0] if upgraded else None
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend hashing in the password pool; the queries and the save stay in the request."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        run = password_pool.run if request is not None else lambda func, *args: func(*args)
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway, or the response time tells which usernames exist
+            run(make_password, password)
+            return None
+        valid, upgraded = run(verify_password, password, user.password)
+        if upgraded:
+            user.password = upgraded
+            user.save(update_fields=['password'])
+        if valid and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+class PasswordPoolBusyMiddleware:
+    """503 + Retry-After for PasswordPoolBusy out of any login view (sync and async)."""
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, PasswordPoolBusy):
+            return None
+        response = HttpResponse(str(exception), status=503, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(exception.retry_after)
+        return response
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """argon2id with the ARGON2 settings; hashes with other parameters are redone at login."""
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'ARGON2', {}).get('TIME_COST', 2)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'ARGON2', {}).get('MEMORY_COST', 19456)  # KiB
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'ARGON2', {}).get('PARALLELISM', 1)
@@ -0,0 +1,33 @@
+'''
+
+Drop cached token -> user entries (authentication.py) when what they hold changes:
+a token is deleted (logout, rotation, user deleted), a user is saved (deactivated,
+renamed, password changed...) or deleted, a profile is saved or deleted.
+
+'''
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_user_cache
+from .models import userProfile
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_user_cache.invalidate_key(instance.key)
+    token_user_cache.invalidate_user(instance.user_id)  # a fill racing with the delete
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    token_user_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=userProfile)
+@receiver(post_delete, sender=userProfile)
+def profile_changed(sender, instance, **kwargs):
+    token_user_cache.invalidate_user(instance.user_id)
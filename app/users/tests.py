@@ -1,8 +1,12 @@
 # app/users/tests.py
+import json
 import pytest
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import get_user_model
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIRequestFactory
 from app.users.models import userProfile
+from app.users.views import UserMeAsyncView
 
 
 
@@ -23,6 +27,14 @@ class TestUserAPI:
         assert resp.status_code == 200
         assert resp.data["username"] == user3.username
 
+    def test_user_me_async(self, auth_client, user3):
+        token = Token.objects.get(user=user3)
+        request = APIRequestFactory().get("/api/user/me/", HTTP_AUTHORIZATION=f"Token {token.key}")
+        resp = async_to_sync(UserMeAsyncView.as_view())(request)
+        assert json.loads(resp.content) == auth_client.get("/api/user/me/").data
+        resp = async_to_sync(UserMeAsyncView.as_view())(APIRequestFactory().get("/api/user/me/"))
+        assert resp.status_code == 401
+
     def test_token_refresh(self, auth_client, user1):
         # login first to get refresh token
         login_data = {"username": user1.username, "password": "pass123"}
@@ -32,3 +44,358 @@ class TestUserAPI:
         resp = auth_client.post(f"/api/token/refresh/", {"refresh": refresh_token}, format="json")
         assert resp.status_code == 200
         assert 'access' in resp.data
+
+
+@pytest.mark.django_db
+class TestUserProfileAdmin:
+    """Profile changelist without a query per row; the change page renders (username fieldset)."""
+
+    def queries(self, client, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        client.get(url)  # warm up (content types, session)
+        with CaptureQueriesContext(connection) as ctx:
+            assert client.get(url).status_code == 200
+        return len(ctx.captured_queries)
+
+    def add_profiles(self, count):
+        User = get_user_model()
+        start = User.objects.count()
+        users = User.objects.bulk_create(User(username=f'member{start + i}', password='!') for i in range(count))
+        userProfile.objects.bulk_create(
+            userProfile(user=user, email=f'{user.username}@example.com', level=i % 3) for i, user in enumerate(users)
+        )
+
+    def test_changelist_constant_queries(self, admin_client):
+        self.add_profiles(3)
+        few = self.queries(admin_client, '/admin/users/userprofile/')
+        self.add_profiles(30)
+        assert self.queries(admin_client, '/admin/users/userprofile/') == few
+
+    def test_change_page(self, admin_client, user1):
+        profile = userProfile.objects.create(user=user1, email='santa@example.com', level=1)
+        resp = admin_client.get(f'/admin/users/userprofile/{profile.id}/change/')
+        assert resp.status_code == 200
+        assert user1.username in resp.content.decode()
+
+
+@pytest.mark.django_db
+class TestCachedTokenAuthentication:
+    """token -> user (+ profile) from the cache: no query once warm, invalidated on changes."""
+
+    def queries(self, client, url="/api/user/me/"):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.get(url)
+        return resp, len(ctx.captured_queries)
+
+    def test_warm_cache_no_queries(self, auth_client, user1):
+        userProfile.objects.create(user=user1, email='santa@example.com', level=2)
+        resp, cold = self.queries(auth_client)
+        assert cold == 1  # token JOIN user LEFT JOIN profile
+        resp, warm = self.queries(auth_client)
+        assert warm == 0
+        assert resp.data == {'username': 'santa', 'email': 'santa@example.com', 'level': 2}
+
+    def test_user_without_profile_cached(self, auth_client):
+        self.queries(auth_client)
+        resp, warm = self.queries(auth_client)
+        assert warm == 0 and resp.data['level'] is None
+
+    def test_shared_tier_after_local_expiry(self, auth_client):
+        from app.users.authentication import token_user_cache
+        self.queries(auth_client)
+        token_user_cache.clear_local()  # another process, or the local TTL ran out
+        assert self.queries(auth_client)[1] == 0
+
+    def test_token_deleted(self, auth_client, user1):
+        self.queries(auth_client)
+        Token.objects.filter(user=user1).get().delete()
+        assert auth_client.get("/api/user/me/").status_code == 401
+
+    def test_user_deactivated(self, auth_client, user1):
+        self.queries(auth_client)
+        user1.is_active = False
+        user1.save()
+        assert auth_client.get("/api/user/me/").status_code == 401
+
+    def test_fill_racing_with_deactivation(self, auth_client, user1, monkeypatch):
+        from django.contrib.auth.models import User
+        from app.users.authentication import CachedTokenAuthentication, token_user_cache
+        load = CachedTokenAuthentication._load
+
+        def load_then_deactivate(self, key):
+            token = load(self, key)  # read while the user was still active
+            User.objects.filter(pk=user1.pk).update(is_active=False)
+            token_user_cache.invalidate_user(user1.pk)
+            return token
+
+        monkeypatch.setattr(CachedTokenAuthentication, '_load', load_then_deactivate)
+        auth_client.get("/api/user/me/")
+        monkeypatch.setattr(CachedTokenAuthentication, '_load', load)
+        assert auth_client.get("/api/user/me/").status_code == 401  # the stale entry wasn't kept
+
+    def test_profile_edited(self, auth_client, user1):
+        profile = userProfile.objects.create(user=user1, email='old@example.com', level=1)
+        self.queries(auth_client)
+        profile.email = 'new@example.com'
+        profile.save()
+        assert auth_client.get("/api/user/me/").data['email'] == 'new@example.com'
+
+    def test_posts_use_the_cache(self, auth_client):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        auth_client.get("/api/posts/?mine=true")
+        with CaptureQueriesContext(connection) as ctx:
+            assert auth_client.get("/api/posts/?mine=true").status_code == 200
+        assert not [q for q in ctx.captured_queries if 'authtoken_token' in q['sql']]
+
+    def test_disabled(self, auth_client, settings):
+        settings.AUTH_TOKEN_CACHE = {'ENABLED': False}
+        self.queries(auth_client)
+        assert self.queries(auth_client)[1] == 2
+
+    def test_async_view_local_hit(self, auth_client, user1):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        auth_client.get("/api/user/me/")
+        token = Token.objects.get(user=user1)
+        request = APIRequestFactory().get("/api/user/me/", HTTP_AUTHORIZATION=f"Token {token.key}")
+        with CaptureQueriesContext(connection) as ctx:
+            resp = async_to_sync(UserMeAsyncView.as_view())(request)
+        assert resp.status_code == 200 and not ctx.captured_queries
+
+    def test_local_lru(self):
+        from app.users.authentication import LocalLRU
+        lru = LocalLRU()
+        lru.set('a', 1, 60, 2)
+        lru.set('b', 2, 60, 2)
+        lru.get('a')
+        lru.set('c', 3, 60, 2)  # evicts b, the least recently used
+        assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+        lru.set('d', 4, -1, 2)
+        assert lru.get('d') is None
+
+
+@pytest.mark.django_db
+class TestStatelessJWT:
+    """JWT access tokens carry username/email/level: no query to authenticate or for /user/me/."""
+
+    HS_KEYS = {'old': {'signing_key': 'o' * 32}, 'new': {'signing_key': 'n' * 32}}
+
+    def login(self, api_client, user):
+        resp = api_client.post("/api/login/", {"username": user.username, "password": "pass123"}, format="json")
+        return resp.data
+
+    def me(self, api_client, access):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        with CaptureQueriesContext(connection) as ctx:
+            resp = api_client.get("/api/user/me/")
+        return resp, len(ctx.captured_queries)
+
+    def test_claims_no_queries(self, api_client, user1):
+        userProfile.objects.create(user=user1, email='santa@example.com', level=2)
+        resp, queries = self.me(api_client, self.login(api_client, user1)['access'])
+        assert resp.data == {'username': 'santa', 'email': 'santa@example.com', 'level': 2}
+        assert queries == 0
+
+    def test_without_profile(self, api_client, user1):
+        resp, queries = self.me(api_client, self.login(api_client, user1)['access'])
+        assert resp.data == {'username': 'santa', 'email': '', 'level': None} and queries == 0
+
+    def test_refresh_reloads_claims(self, api_client, user1):
+        profile = userProfile.objects.create(user=user1, email='santa@example.com', level=1)
+        tokens = self.login(api_client, user1)
+        profile.level = 3
+        profile.save()
+        access = api_client.post("/api/token/refresh/", {"refresh": tokens['refresh']}, format="json").data['access']
+        assert self.me(api_client, access)[0].data['level'] == 3
+
+    def test_claims_user_writes(self, api_client, user1):
+        from app.comments.models import Comment
+        from app.posts.models import Post
+        post = Post.objects.create(title='T', body='B', user=user1)
+        self.me(api_client, self.login(api_client, user1)['access'])
+        resp = api_client.post("/api/comments/", {"post": post.id, "content": "hi"}, format="json")
+        assert resp.status_code == 201
+        assert Comment.objects.get().author_id == user1.pk
+
+    def test_stateless_off(self, api_client, user1, settings):
+        settings.JWT_KEYS = {'STATELESS': False}
+        resp, queries = self.me(api_client, self.login(api_client, user1)['access'])
+        assert resp.status_code == 200 and queries == 2  # user, profile
+
+    def test_async_view(self, api_client, user1):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        access = self.login(api_client, user1)['access']
+        request = APIRequestFactory().get("/api/user/me/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        with CaptureQueriesContext(connection) as ctx:
+            resp = async_to_sync(UserMeAsyncView.as_view())(request)
+        assert json.loads(resp.content)['username'] == 'santa' and not ctx.captured_queries
+
+    def test_key_rotation(self, api_client, user1, settings):
+        settings.JWT_KEYS = {'ACTIVE_KID': 'old', 'KEYS': self.HS_KEYS}
+        old = self.login(api_client, user1)['access']
+        settings.JWT_KEYS = {'ACTIVE_KID': 'new', 'KEYS': self.HS_KEYS}
+        new = self.login(api_client, user1)['access']
+        import jwt
+        assert jwt.get_unverified_header(new)['kid'] == 'new'
+        assert self.me(api_client, old)[0].status_code == 200  # old key still verifies
+        settings.JWT_KEYS = {'ACTIVE_KID': 'new', 'KEYS': {'new': self.HS_KEYS['new']}}
+        assert self.me(api_client, old)[0].status_code == 401  # retired
+        assert self.me(api_client, new)[0].status_code == 200
+
+    def test_keys_file_reloaded(self, api_client, user1, settings, tmp_path):
+        keys_file = tmp_path / 'keys.json'
+        keys_file.write_text(json.dumps({'active_kid': 'old', 'keys': self.HS_KEYS}))
+        settings.JWT_KEYS = {'KEYS_FILE': str(keys_file), 'CACHE_TTL': 0}
+        old = self.login(api_client, user1)['access']
+        keys_file.write_text(json.dumps({'active_kid': 'new', 'keys': {'new': self.HS_KEYS['new']}}))
+        assert self.me(api_client, old)[0].status_code == 401
+
+    def test_forged_tokens_rejected(self, api_client, user1, settings):
+        import jwt
+        settings.JWT_KEYS = {'ACTIVE_KID': 'new', 'KEYS': self.HS_KEYS}
+        claims = {'user_id': str(user1.pk), 'token_type': 'access', 'exp': 2 ** 31, 'jti': 'x',
+                  'username': 'santa', 'email': '', 'level': 9}
+        unsigned = jwt.encode(claims, None, algorithm='none', headers={'kid': 'new'})
+        unknown_kid = jwt.encode(claims, 'n' * 32, algorithm='HS256', headers={'kid': 'other'})
+        wrong_key = jwt.encode(claims, 'x' * 32, algorithm='HS256', headers={'kid': 'new'})
+        for token in (unsigned, unknown_kid, wrong_key):
+            assert self.me(api_client, token)[0].status_code == 401
+
+    def test_asymmetric_keys(self, api_client, user1, settings):
+        pytest.importorskip('cryptography')
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        private = ec.generate_private_key(ec.SECP256R1())
+        pem = private.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption()).decode()
+        public = private.public_key().public_bytes(serialization.Encoding.PEM,
+                                                   serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+        settings.JWT_KEYS = {'ACTIVE_KID': 'ec', 'KEYS': {
+            'ec': {'algorithm': 'ES256', 'signing_key': pem, 'verifying_key': public}}}
+        resp, queries = self.me(api_client, self.login(api_client, user1)['access'])
+        assert resp.status_code == 200 and queries == 0
+
+    def test_jwks_tokens_only_name_a_local_user(self, api_client, user1, settings, monkeypatch):
+        import jwt
+        from django.core.exceptions import ImproperlyConfigured
+        from app.users.tokens import keyset
+        settings.JWT_KEYS = {'JWKS_URL': 'https://idp.example/jwks'}
+        with pytest.raises(ImproperlyConfigured):
+            keyset.current()
+        settings.JWT_KEYS = {'JWKS_URL': 'https://idp.example/jwks', 'JWKS_ISSUER': 'https://idp.example',
+                             'JWKS_AUDIENCE': 'multiplex'}
+        jwk = jwt.PyJWK({'kty': 'oct', 'k': jwt.utils.base64url_encode(b'i' * 32).decode(), 'alg': 'HS256'})
+        monkeypatch.setattr(keyset.current().jwks_client, 'get_signing_key_from_jwt', lambda token: jwk)
+        admin = get_user_model().objects.create_superuser('root', 'root@example.com', 'pass123')
+        claims = {'sub': 'santa', 'iss': 'https://idp.example', 'aud': 'multiplex', 'exp': 2 ** 31,
+                  'user_id': str(admin.pk), 'is_staff': True, 'is_superuser': True, 'token_type': 'access',
+                  'username': 'root', 'email': '', 'level': 9}
+        token = jwt.encode(claims, 'i' * 32, algorithm='HS256', headers={'kid': 'idp'})
+        resp, queries = self.me(api_client, token)
+        assert resp.data['username'] == 'santa' and queries > 0  # `sub`, loaded from the database
+        assert api_client.get('/api/_metrics').status_code == 403  # is_staff claim ignored
+        for wrong in ({'aud': 'other'}, {'iss': 'https://evil.example'}, {'iss': None}):
+            forged = {k: v for k, v in {**claims, **wrong}.items() if v is not None}
+            token = jwt.encode(forged, 'i' * 32, algorithm='HS256', headers={'kid': 'idp'})
+            assert self.me(api_client, token)[0].status_code == 401
+
+    def test_auth_service_token(self, api_client, user1):
+        from app.users.utils import AuthService
+        assert self.me(api_client, AuthService().getToken(user1))[0].data['username'] == 'santa'
+
+
+@pytest.mark.django_db
+class TestLoginPipeline:
+    """Password checks in a bounded pool (passwords.py), rehash to the preferred hasher at login."""
+
+    def login(self, api_client, username='santa', password='pass123'):
+        return api_client.post("/api/login/", {"username": username, "password": password}, format="json")
+
+    def block_pool(self, settings, waiting=0, timeout=2.0):
+        import threading
+        from app.users.passwords import password_pool
+        settings.PASSWORD_POOL = {'MAX_WORKERS': 1, 'MAX_WAITING': waiting, 'QUEUE_TIMEOUT': timeout}
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=password_pool.run, args=(hold,))
+        thread.start()
+        started.wait(5)
+        return release, thread
+
+    def test_login_and_wrong_password(self, api_client, user1):
+        from app.users.passwords import password_pool
+        before = password_pool.stats()['completed']
+        assert self.login(api_client).status_code == 200
+        assert self.login(api_client, password='nope').status_code == 401
+        assert self.login(api_client, username='nobody').status_code == 401  # hashed too
+        assert password_pool.stats()['completed'] == before + 3
+
+    def test_full_pool_503(self, api_client, user1, settings):
+        release, thread = self.block_pool(settings)
+        try:
+            resp = self.login(api_client)
+        finally:
+            release.set()
+            thread.join()
+        assert resp.status_code == 503 and resp['Retry-After'] == '2'
+        assert self.login(api_client).status_code == 200
+
+    def test_full_pool_outside_the_api(self, client, user1, settings):
+        release, thread = self.block_pool(settings)
+        try:
+            resp = client.post('/admin/login/', {'username': 'santa', 'password': 'pass123'})
+            assert resp.status_code == 503 and resp['Retry-After'] == '2'
+            assert client.login(username='santa', password='pass123')  # no request: hashed in place
+        finally:
+            release.set()
+            thread.join()
+
+    def test_queue_timeout(self, settings):
+        from app.users.passwords import PasswordPoolBusy, password_pool
+        release, thread = self.block_pool(settings, waiting=1, timeout=0.05)
+        import threading
+        threading.Timer(0.2, release.set).start()
+        with pytest.raises(PasswordPoolBusy):
+            password_pool.run(lambda: 'late')  # queued behind hold() for longer than QUEUE_TIMEOUT
+        thread.join()
+
+    def test_login_rate_limited(self, api_client, user1, settings):
+        settings.THROTTLING = {'RATES': {'login': '2/minute'}, 'ALGORITHMS': {'login': 'bucket'}}
+        assert [self.login(api_client, password='nope').status_code for _ in range(3)] == [401, 401, 429]
+        assert self.login(api_client).status_code == 429  # per IP, before any password check
+
+    def test_rehash_to_preferred_hasher(self, api_client, user1, settings):
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.ScryptPasswordHasher',
+                                     'django.contrib.auth.hashers.PBKDF2PasswordHasher']
+        assert self.login(api_client).status_code == 200
+        user1.refresh_from_db()
+        assert user1.password.startswith('scrypt$')
+        assert self.login(api_client).status_code == 200  # the new hash works
+
+    def test_default_hashers_kept(self):
+        from django.contrib.auth.hashers import get_hashers_by_algorithm
+        assert {'pbkdf2_sha256', 'pbkdf2_sha1', 'argon2', 'bcrypt_sha256', 'scrypt'} <= set(get_hashers_by_algorithm())
+
+    def test_tuned_argon2(self, api_client, user1, settings):
+        pytest.importorskip('argon2')
+        settings.PASSWORD_HASHERS = ['app.users.passwords.TunedArgon2PasswordHasher',
+                                     'django.contrib.auth.hashers.PBKDF2PasswordHasher']
+        settings.ARGON2 = {'TIME_COST': 1, 'MEMORY_COST': 8192, 'PARALLELISM': 1}
+        self.login(api_client)
+        user1.refresh_from_db()
+        assert user1.password.startswith('argon2$argon2id$') and 'm=8192,t=1,p=1' in user1.password
+        settings.ARGON2 = {'TIME_COST': 2, 'MEMORY_COST': 8192, 'PARALLELISM': 1}
+        self.login(api_client)  # other parameters: rehashed again
+        user1.refresh_from_db()
+        assert 'm=8192,t=2,p=1' in user1.password
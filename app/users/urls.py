@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import UserMeView, MyTokenObtainPairView, MyTokenRefreshView
+from .views import UserMeView, UserMeAsyncView, MyTokenObtainPairView, MyTokenRefreshView
+from app.core.asyncviews import async_reads_enabled
 
 urlpatterns = [
     path('login/', MyTokenObtainPairView.as_view(), name="token_obtain_pair"),
     path('token/refresh/', MyTokenRefreshView.as_view(), name="token_refresh"),
-    path('user/me/', UserMeView.as_view(), name='user_me')
+    path('user/me/', (UserMeAsyncView if async_reads_enabled() else UserMeView).as_view(), name='user_me')
 ]
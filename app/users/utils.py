@@ -1,15 +1,8 @@
-import jwt
-import datetime
+from .tokens import ProfileRefreshToken
 
 
 class AuthService():
 
     def getToken(self, user):
-        secret_key = 'abc'
-        payload = {
-            "user_id": user.id,
-            "exp": datetime.datetime.now() + datetime.timedelta(minutes=30)
-        }
-        token = jwt.encode(payload, secret_key, algorithm='HS256')
-
-        return token
+        # same keys, algorithm and claims as /api/login/ (tokens.py): no secret in the code
+        return str(ProfileRefreshToken.for_user(user).access_token)
@@ -1,6 +1,7 @@
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework import status
 # the import just makes User available in Python, and the OneToOneField(User) connects your userProfile to User.
 from django.contrib.auth.models import User
 from drf_spectacular.utils import extend_schema
@@ -8,6 +9,10 @@ from .models import userProfile
 from .serializers import UserSerializer, LoginSerializer, RefreshSerializer
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer as JWTRefreshSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from app.core.asyncviews import AsyncReadView
+from app.core.replicas import ReplicaReadMixin
+from .authentication import cached_profile
+from .passwords import PasswordPoolBusy
 
 '''
 userProfile has a field user that links to Django's built-in User model.
@@ -17,11 +22,14 @@ So if you have a User instance user, you can access its profile with user.userpr
 '''
 
 # Create your views here.
-class UserMeView(APIView):
+class UserMeView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 3  # app/core/budgets.py: 0 with a JWT or a cached token
 
     @extend_schema(responses = UserSerializer, tags=["Authentication"])
     def get(self, request):
+        # JWT: request.user and its profile come from the token claims (tokens.py), token:
+        # from the cache (authentication.py); the database is only read on a miss
         user = request.user
         try:
             profile = user.userprofile
@@ -35,10 +43,34 @@ class UserMeView(APIView):
 
         return Response(data)
 
+class UserMeAsyncView(AsyncReadView):
+    """UserMeView as a native async view (ASYNC_READ_VIEWS=true)."""
+    view_class = UserMeView
+
+    async def read(self, view, request):
+        user = request.user
+        cached, profile = cached_profile(user)  # loaded with the user by CachedTokenAuthentication
+        if not cached:
+            profile = await userProfile.objects.filter(user=user).afirst()
+        data = {
+            'username': user.username,
+            'email': profile.email if profile else user.email,
+            'level': profile.level if profile else None
+        }
+        return Response(data)
+
 @extend_schema(request=LoginSerializer,responses={200: TokenObtainPairSerializer}, tags=["Authentication"])
 class MyTokenObtainPairView(TokenObtainPairView):
-    pass
+    throttle_scope = 'login'  # THROTTLING['RATES'], per IP address
+    query_budget = 5  # user + profile, last_login, password rehash
+
+    def post(self, request, *args, **kwargs):
+        try:
+            return super().post(request, *args, **kwargs)
+        except PasswordPoolBusy as exc:  # too many logins hashing right now (passwords.py)
+            return Response({'detail': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': str(exc.retry_after)})
 
 @extend_schema(request=RefreshSerializer,responses={200: JWTRefreshSerializer}, tags=["Authentication"])
 class MyTokenRefreshView(TokenRefreshView):
-    pass
+    query_budget = 3
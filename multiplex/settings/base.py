@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+from datetime import timedelta
+from importlib.util import find_spec
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -47,17 +49,23 @@ INSTALLED_APPS = [
     "drf_spectacular_sidecar",
     'app.users',
     'app.posts',
-    'app.comments'
+    'app.comments',
+    'app.jobs',
 ]
 
 MIDDLEWARE = [
+    'app.core.metrics.MetricsMiddleware',  # first: times the whole request, Server-Timing
+    'app.core.budgets.QueryBudgetMiddleware',  # views' query_budget, counts the other middleware's queries too
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.users.passwords.PasswordPoolBusyMiddleware',  # 503 + Retry-After from the admin / session login forms
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app.core.throttling.RateLimitHeadersMiddleware',  # RateLimit-* headers of throttled views
+    'app.core.replicas.ReplicaMiddleware',  # read-your-writes for the replica router, after the session save
 ]
 
 ROOT_URLCONF = 'multiplex.urls'
@@ -98,8 +106,179 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD", "mypassword"),
         "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
         "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        # connection reuse, see app/core/dbpool.py
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),  # seconds, 0: connect per request; ASGI: use the pool
+        "CONN_HEALTH_CHECKS": os.environ.get("DB_HEALTH_CHECKS", "true").lower() == "true",  # check before reuse
+        "OPTIONS": {},
     }
 }
+# psycopg pool (pip install "psycopg[pool]"), replaces the per thread persistent connections
+if os.environ.get("DB_POOL", "true").lower() == "true" and find_spec("psycopg_pool"):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0  # required by the pool: connections go back to it
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),  # kept open when idle
+        "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),  # per process, x workers <= max_connections
+        "timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),  # seconds waiting for a free connection
+        "max_waiting": int(os.environ.get("DB_POOL_MAX_WAITING", 0)),  # 0: unbounded queue
+        "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", 300)),  # idle connections above min_size closed
+        "max_lifetime": float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800)),  # connections recycled
+    }
+
+# Read replicas (app/core/replicas.py): DB_REPLICAS="host1,host2:5433*2" (host[:port][*weight]),
+# same database, user and password as the primary
+REPLICAS = {
+    "ALIASES": {},  # alias -> weight, filled from DB_REPLICAS
+    "STICKY_SECONDS": float(os.environ.get("DB_REPLICA_STICKY_SECONDS", 5)),  # after a write: primary (> lag)
+    "RETRY_AFTER": float(os.environ.get("DB_REPLICA_RETRY_AFTER", 30)),  # unreachable replica skipped this long
+}
+for number, spec in enumerate(filter(None, os.environ.get("DB_REPLICAS", "").split(",")), start=1):
+    address, _, weight = spec.strip().partition("*")
+    host, _, port = address.partition(":")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICAS["ALIASES"][f"replica{number}"] = int(weight or 1)
+DATABASE_ROUTERS = ["app.core.replicas.ReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; e.g. CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# with CACHE_LOCATION=/var/tmp/multiplex_cache to share entries between worker processes.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "multiplex"),
+    }
+}
+
+# Response cache for anonymous GETs on PostViewSet (app/core/cache.py)
+RESPONSE_CACHE = {
+    "ENABLED": os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true",
+    "ALIAS": "default",
+    "TIMEOUT": int(os.environ.get("RESPONSE_CACHE_TIMEOUT", 60)),  # seconds, when the view sets no per-action TTL
+}
+
+# Batch endpoints /api/posts/bulk/ and /api/posts/bulk-publish/ (app/posts/bulk.py)
+POSTS_BULK = {
+    "BATCH_SIZE": int(os.environ.get("POSTS_BULK_BATCH_SIZE", 500)),  # rows per INSERT/UPDATE statement
+    "MAX_ITEMS": int(os.environ.get("POSTS_BULK_MAX_ITEMS", 5000)),   # items per request
+}
+
+# Read-only list/retrieve through .values() + precompiled row converters (app/core/fastpath.py)
+FAST_READ_SERIALIZATION = os.environ.get("FAST_READ_SERIALIZATION", "true").lower() == "true"
+
+# Native async GET/HEAD views for posts, comments and user/me (app/core/asyncviews.py).
+# Only for ASGI deployments (uvicorn/daphne multiplex.asgi:application).
+ASYNC_READ_VIEWS = os.environ.get("ASYNC_READ_VIEWS", "false").lower() == "true"
+
+# Streaming NDJSON/CSV exports /api/posts/export/, /api/comments/export/ (app/core/export.py)
+EXPORT = {
+    "CHUNK_SIZE": int(os.environ.get("EXPORT_CHUNK_SIZE", 2000)),  # rows fetched per server-side cursor round trip
+}
+
+# Buffered comment ingestion (app/comments/ingest.py): POST /api/comments/ answers 202 and
+# comments are written in batches by a background thread
+COMMENT_INGEST = {
+    "ENABLED": os.environ.get("COMMENT_INGEST", "false").lower() == "true",
+    "MAX_QUEUE": int(os.environ.get("COMMENT_INGEST_MAX_QUEUE", 10000)),  # full queue => 503 + Retry-After
+    "BATCH_SIZE": int(os.environ.get("COMMENT_INGEST_BATCH_SIZE", 500)),  # flush when this many are waiting
+    "FLUSH_INTERVAL": float(os.environ.get("COMMENT_INGEST_FLUSH_INTERVAL", 0.2)),  # ... or after this many seconds
+    "ENQUEUE_TIMEOUT": float(os.environ.get("COMMENT_INGEST_ENQUEUE_TIMEOUT", 0.05)),  # wait for room before 503
+    "SPOOL_PATH": os.environ.get("COMMENT_INGEST_SPOOL", ""),  # e.g. /var/spool/multiplex/comments-{pid}.ndjson
+    "SPOOL_FSYNC": os.environ.get("COMMENT_INGEST_SPOOL_FSYNC", "false").lower() == "true",
+}
+
+# Admin on big tables (app/core/admin.py): estimated/capped changelist counts, capped inlines
+ADMIN_SCALE = {
+    "ESTIMATE_COUNT_ABOVE": int(os.environ.get("ADMIN_ESTIMATE_COUNT_ABOVE", 100000)),  # PostgreSQL reltuples
+    "MAX_COUNT": int(os.environ.get("ADMIN_MAX_COUNT", 10000)),  # filtered changelists count at most this many
+    "INLINE_MAX": int(os.environ.get("ADMIN_INLINE_MAX", 20)),  # newest comments on the post page
+}
+
+# Background jobs (app/jobs/runner.py, worker: manage.py run_jobs)
+JOBS = {
+    "CHUNK_SIZE": int(os.environ.get("JOBS_CHUNK_SIZE", 500)),  # primary keys per transaction
+    "INLINE_MAX_ROWS": int(os.environ.get("JOBS_INLINE_MAX_ROWS", 500)),  # smaller admin selections run in the request
+    "MAX_ATTEMPTS": int(os.environ.get("JOBS_MAX_ATTEMPTS", 3)),
+    "RETRY_DELAY": float(os.environ.get("JOBS_RETRY_DELAY", 10)),  # seconds, doubled after every failure
+    "POLL_INTERVAL": float(os.environ.get("JOBS_POLL_INTERVAL", 2)),
+    "STALE_AFTER": int(os.environ.get("JOBS_STALE_AFTER", 300)),  # running job without heartbeat => re-queued
+}
+
+# Token -> user cache of CachedTokenAuthentication (app/users/authentication.py)
+AUTH_TOKEN_CACHE = {
+    "ENABLED": os.environ.get("AUTH_TOKEN_CACHE_ENABLED", "true").lower() == "true",
+    "ALIAS": "default",
+    "TIMEOUT": int(os.environ.get("AUTH_TOKEN_CACHE_TIMEOUT", 300)),  # shared cache entries, seconds
+    "LOCAL_TTL": float(os.environ.get("AUTH_TOKEN_CACHE_LOCAL_TTL", 5)),  # per process copies: max staleness elsewhere
+    "LOCAL_MAX_ENTRIES": int(os.environ.get("AUTH_TOKEN_CACHE_LOCAL_MAX", 10000)),
+}
+
+# Stateless JWT with profile claims (app/users/tokens.py)
+SIMPLE_JWT = {
+    "ACCESS_TOKEN_LIFETIME": timedelta(minutes=int(os.environ.get("JWT_ACCESS_MINUTES", 5))),  # how stale claims may get
+    "REFRESH_TOKEN_LIFETIME": timedelta(days=int(os.environ.get("JWT_REFRESH_DAYS", 1))),
+    "AUTH_TOKEN_CLASSES": ("app.users.tokens.ProfileAccessToken",),
+    "TOKEN_OBTAIN_SERIALIZER": "app.users.tokens.ProfileTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "app.users.tokens.ProfileTokenRefreshSerializer",
+}
+JWT_KEYS = {
+    "ALGORITHM": os.environ.get("JWT_ALGORITHM", "HS256"),  # RS256/ES256... need the cryptography package
+    "ACTIVE_KID": os.environ.get("JWT_ACTIVE_KID", "default"),  # signs new tokens
+    "KEYS": {},  # kid -> {"algorithm", "signing_key", "verifying_key"}; empty: SECRET_KEY as the HS key
+    "KEYS_FILE": os.environ.get("JWT_KEYS_FILE", ""),  # JSON {"active_kid", "keys"}, re-read every CACHE_TTL
+    "JWKS_URL": os.environ.get("JWT_JWKS_URL", ""),  # verify tokens of another issuer
+    "JWKS_ISSUER": os.environ.get("JWT_JWKS_ISSUER", ""),  # required `iss` of those tokens
+    "JWKS_AUDIENCE": os.environ.get("JWT_JWKS_AUDIENCE", ""),  # required `aud` of those tokens
+    "JWKS_USER_FIELD": os.environ.get("JWT_JWKS_USER_FIELD", "username"),  # local user matched by `sub`
+    "CACHE_TTL": int(os.environ.get("JWT_KEYS_CACHE_TTL", 300)),
+    "STATELESS": os.environ.get("JWT_STATELESS", "true").lower() == "true",  # false: load the user per request
+}
+
+
+# Rate limits of views with a throttle_scope (app/core/throttling.py)
+THROTTLING = {
+    "BACKEND": os.environ.get("THROTTLE_BACKEND", "local"),  # local: per process, cache: shared via CACHES[ALIAS]
+    "ALIAS": "default",
+    "ALGORITHM": os.environ.get("THROTTLE_ALGORITHM", "sliding"),  # sliding window counter | bucket
+    "ALGORITHMS": {"login": "bucket"},  # per scope: logins may burst, then refill slowly
+    "RATES": {
+        "user": os.environ.get("THROTTLE_USER_RATE", "600/minute"),  # PostViewSet, per user or per IP
+        "login": os.environ.get("THROTTLE_LOGIN_RATE", "10/minute"),  # per IP
+    },
+}
+
+# Login pipeline (app/users/passwords.py): password hashes run in a bounded pool
+AUTHENTICATION_BACKENDS = ["app.users.passwords.PooledModelBackend"]
+PASSWORD_POOL = {
+    "ENABLED": os.environ.get("PASSWORD_POOL_ENABLED", "true").lower() == "true",
+    "MAX_WORKERS": int(os.environ.get("PASSWORD_POOL_WORKERS", 2)),  # hashes at once per process, <= cores
+    "MAX_WAITING": int(os.environ.get("PASSWORD_POOL_WAITING", 16)),  # queued logins, more => 503
+    "QUEUE_TIMEOUT": float(os.environ.get("PASSWORD_POOL_QUEUE_TIMEOUT", 2)),  # seconds in the queue, then 503
+}
+# New hashes use the first hasher; older ones are rehashed when their user logs in.
+# Django's defaults, Argon2PasswordHasher replaced by the tuned one (it checks any argon2 hash)
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "app.users.passwords.TunedArgon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+if find_spec("argon2") and os.environ.get("PASSWORD_ARGON2", "true").lower() == "true":  # pip install argon2-cffi
+    PASSWORD_HASHERS.remove("app.users.passwords.TunedArgon2PasswordHasher")
+    PASSWORD_HASHERS.insert(0, "app.users.passwords.TunedArgon2PasswordHasher")
+ARGON2 = {
+    "TIME_COST": int(os.environ.get("ARGON2_TIME_COST", 2)),
+    "MEMORY_COST": int(os.environ.get("ARGON2_MEMORY_COST", 19456)),  # KiB
+    "PARALLELISM": int(os.environ.get("ARGON2_PARALLELISM", 1)),
+}
 
 
 # Password validation
@@ -123,13 +302,17 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'app.users.authentication.CachedTokenAuthentication',  # TokenAuthentication without the query
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'app.users.tokens.ClaimsJWTAuthentication',  # JWTAuthentication, user from the claims
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
+    # views with a throttle_scope, rates in THROTTLING (app/core/throttling.py)
+    'DEFAULT_THROTTLE_CLASSES': (
+        'app.core.throttling.RateLimitThrottle',
+    ),
     # 'DEFAULT_THROTTLE_CLASSES': (
     #     'post.throttles.PostUserThrottle',
     #     'post.throttles.PostAnonThrottle',
@@ -163,6 +346,27 @@ SPECTACULAR_SETTINGS = {
     ]
 }
 
+# Request metrics (app/core/metrics.py): Server-Timing header, histograms at /api/_metrics
+METRICS = {
+    "ENABLED": os.environ.get("METRICS_ENABLED", "true").lower() == "true",
+    "SAMPLE_RATE": float(os.environ.get("METRICS_SAMPLE_RATE", 0.1)),  # share of the requests measured
+    "SERVER_TIMING": os.environ.get("METRICS_SERVER_TIMING", "true").lower() == "true",
+    "TOKEN": os.environ.get("METRICS_TOKEN", ""),  # X-Metrics-Token of the Prometheus scraper
+}
+
+# Query budgets of the views (app/core/budgets.py): over budget -> warning on `app.query_budget`
+QUERY_BUDGETS = {
+    "ENABLED": os.environ.get("QUERY_BUDGETS_ENABLED", "true").lower() == "true",
+    "RAISE": os.environ.get("QUERY_BUDGETS_RAISE", "false").lower() == "true",  # tests: always (app/conftest.py)
+}
+
+# /api/schema/ (app/core/schema.py): `manage.py compile_schema` writes the schema here at build time,
+# without the files it is generated on the first request of each process
+SCHEMA_CACHE = {
+    "DIR": os.environ.get("SCHEMA_DIR", str(BASE_DIR / "build" / "schema")),
+    "MAX_AGE": int(os.environ.get("SCHEMA_MAX_AGE", 60)),  # Cache-Control max-age, then revalidated by ETag
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
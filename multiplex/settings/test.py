@@ -2,3 +2,10 @@ from .base import *
 
 DEBUG = False
 ALLOWED_HOSTS = ["*"]
+
+# A second database standing in for a read replica (app/core/replicas.py tests). It is
+# not replicated: a read that reaches it only sees the rows written to it directly.
+DATABASES["replica"] = {
+    **DATABASES["default"],
+    "TEST": {"NAME": f"test_{DATABASES['default']['NAME']}_replica"},
+}
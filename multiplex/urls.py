@@ -16,8 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from drf_spectacular.views import SpectacularSwaggerView, SpectacularRedocView
 from django.shortcuts import redirect
+from app.core.dbpool import DatabasePoolStatsView
+from app.core.schema import CachedSchemaView
+from app.core.metrics import MetricsView
 
 def redirect_to_swagger(request):
     return redirect('/api/docs/swagger/')
@@ -31,9 +34,12 @@ urlpatterns = [
     path('api/', include('app.posts.urls')),
     path('api/', include('app.comments.urls')),
     path('api/', include('app.users.urls')),   # 👈 add this line
+    path('api/_db/pool/', DatabasePoolStatsView.as_view(), name='db_pool_stats'),
+    path('api/_metrics', MetricsView.as_view(), name='metrics'),
 
     # OpenAPI schema/docs
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    # precompiled by `manage.py compile_schema`, else generated once per process (app/core/schema.py)
+    path('api/schema/', CachedSchemaView.as_view(), name='schema'),
     path('api/docs/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/docs/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
 ]